@@ -0,0 +1,85 @@
+"""Time weekly league pairings and measure how fair they are as leagues grow.
+
+Usage: python benchmarks/pairing_quality.py [--sizes 8 9 64 65 500 501 2000] [--weeks 10] [--elo-weight 0]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from league_history import count_matches, empty_history, pair_counts, user_counts
+from pairing import pair_week, pair_week_2v2
+
+
+def synthetic_league(player_count: int, seed: int = 1) -> dict:
+    """Player ids shaped like Discord ids, with ratings spread like an established sport"""
+    rng = random.Random(seed)
+    players = rng.sample(range(10 ** 17, 10 ** 18), player_count)
+    return {player: round(rng.gauss(1000, 150), 2) for player in players}
+
+
+def week_matches(team_size: int, players, ratings: dict, history: dict, elo_weight: float, seed) -> list:
+    """One week through the league's pairing functions, as league match entries (just the counted fields)"""
+    match_history = pair_counts(history["opponents"])
+    bye_history = user_counts(history["byes"])
+    if team_size == 2:
+        fixtures, bye_player, bye_team = pair_week_2v2(players, match_history, bye_history,
+                                                       pair_counts(history["teammates"]), ratings, elo_weight, seed)
+        matches = [{"team1": list(a), "team2": list(b), "status": "scheduled"} for a, b in fixtures]
+        if bye_team is not None:
+            matches.append({"team1": list(bye_team), "team2": None, "status": "bye"})
+    else:
+        pairs, bye_player = pair_week(players, match_history, bye_history, ratings, elo_weight, seed)
+        matches = [{"player1": a, "player2": b, "status": "scheduled"} for a, b in pairs]
+    if bye_player is not None:
+        matches.append({"player1": bye_player, "player2": None, "status": "bye"})
+    return matches
+
+
+def simulate_season(team_size: int, player_count: int, weeks: int, elo_weight: float, seed: int) -> dict:
+    """Pair every week of a season in turn; per-week times and the fairness of the result"""
+    ratings = synthetic_league(player_count, seed)
+    players = list(ratings)
+    history = empty_history()
+    seconds = []
+    for week in range(1, weeks + 1):
+        # Reading the counters is part of generating a week, so it is timed too
+        started = time.perf_counter()
+        matches = week_matches(team_size, players, ratings, history, elo_weight, f"bench:{week}")
+        seconds.append(time.perf_counter() - started)
+        count_matches(history, matches)
+
+    byes = [history["byes"].get(str(player), 0) for player in players]
+    return {
+        "mean": sum(seconds) / len(seconds),
+        "max": max(seconds),
+        "rematches": max(history["opponents"].values(), default=1) - 1,
+        "bye_spread": max(byes) - min(byes),
+        "teammate_repeats": max(history["teammates"].values(), default=1) - 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[8, 9, 64, 65, 500, 501, 2000])
+    parser.add_argument("--team-sizes", type=int, nargs="+", choices=[1, 2], default=[1, 2])
+    parser.add_argument("--weeks", type=int, default=10)
+    parser.add_argument("--elo-weight", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'format':<6}  {'players':>7}  {'mean ms':>9}  {'max ms':>9}  "
+          f"{'rematches':>9}  {'bye spread':>10}  {'teammate repeats':>16}")
+    for team_size in args.team_sizes:
+        for size in args.sizes:
+            result = simulate_season(team_size, size, args.weeks, args.elo_weight, args.seed)
+            teammates = result["teammate_repeats"] if team_size == 2 else "-"
+            print(f"{team_size}v{team_size:<4}  {size:>7}  {result['mean'] * 1000:>9.1f}  {result['max'] * 1000:>9.1f}  "
+                  f"{result['rematches']:>9}  {result['bye_spread']:>10}  {teammates:>16}")
+
+
+if __name__ == "__main__":
+    main()
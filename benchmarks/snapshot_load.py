@@ -0,0 +1,79 @@
+"""Compare cold-start load time and disk size of JSON and msgpack snapshots.
+
+Usage: python benchmarks/snapshot_load.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from storage import SNAPSHOT_FORMATS, decode_snapshot, default_data, encode_snapshot, normalize_data
+
+
+SPORTS = ["pingpong", "pool", "foosball", "chess"]
+
+
+def synthetic_data(match_count: int, user_count: int = 500, seed: int = 1) -> dict:
+    """Match history shaped like what /match_confirm records, plus ratings for every player"""
+    rng = random.Random(seed)
+    data = default_data()
+    users = [rng.randrange(10 ** 17, 10 ** 18) for _ in range(user_count)]
+    for sport in SPORTS:
+        data["sports"][sport] = {"team_size": 1}
+    for user_id in users:
+        data["elo"][str(user_id)] = {sport: round(rng.uniform(800, 1400), 2) for sport in SPORTS}
+
+    for _ in range(match_count):
+        winner, loser = rng.sample(users, 2)
+        data["matches"].append({
+            "sport": rng.choice(SPORTS),
+            "winner_ids": [winner],
+            "loser_ids": [loser],
+            "score": f"{rng.randint(3, 5)}-{rng.randint(0, 2)}",
+            "reported_by": winner
+        })
+    return data
+
+
+def time_load(path: str, repeat: int) -> float:
+    """Best of `repeat` runs of reading and parsing the file"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            data = normalize_data(decode_snapshot(f.read()))
+        best = min(best, time.perf_counter() - started)
+        # Freeing the previous result is not part of loading
+        del data
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'matches':>10}  {'format':<8}  {'size MB':>8}  {'load ms':>9}  {'vs json':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            data = synthetic_data(size)
+            json_seconds = None
+            for snapshot_format in SNAPSHOT_FORMATS:
+                path = os.path.join(directory, f"{size}.{snapshot_format}")
+                with open(path, "wb") as f:
+                    f.write(encode_snapshot(data, snapshot_format))
+
+                seconds = time_load(path, args.repeat)
+                json_seconds = json_seconds or seconds
+                print(f"{size:>10}  {snapshot_format:<8}  {os.path.getsize(path) / 2 ** 20:>8.1f}  "
+                      f"{seconds * 1000:>9.1f}  {json_seconds / seconds:>6.1f}x")
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,33 @@
 import discord
 from discord import app_commands
+from discord.ext import tasks
 from discord.ui import View, Button, Select
+import copy
+import itertools
 import json
 import os
 import math
 import asyncio
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
 
 from dotenv import load_dotenv
 
+from cold_storage import ColdStorage
+from head_to_head import HeadToHead, build_records
+from identity import IdentityCache
+from league_history import build_history, count_changes, count_matches, empty_history, is_current, pair_counts, user_counts
+from match_archive import parse_score
+from pairing import pair_week, pair_week_2v2, round_robin
+from projection import project_schedule, project_season
+from ranking import RankingIndex
+from rating_engines import PlayerRating, RatingEngine, make_engines
+from rating_history import NO_REF, RatingHistory
+from replay import EventLog, replay_ratings
+from storage import DataStore, JsonBackend, PersistenceScheduler
+from storage_sqlite import SqliteBackend
+
 load_dotenv()
 
 TOKEN = os.getenv("TOKEN")
@@ -21,24 +39,81 @@ client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
 DATA_FILE = "match_data.json"
-K_FACTOR = 32
-
-# Load or initialize data
-if os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "r") as f:
-        match_data = json.load(f)
+# After changing K, run /recalculate_elo to rebuild ratings from the match history
+K_FACTOR = float(os.getenv("K_FACTOR", "32"))
+
+# "json" keeps match_data.json (+ journal); "sqlite" keeps indexed tables in SQLITE_FILE
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SQLITE_FILE = os.getenv("SQLITE_FILE", "match_data.db")
+# "journal" appends each change to a log; "snapshot" rewrites the whole file on every save
+PERSISTENCE_MODE = os.getenv("PERSISTENCE_MODE", "journal")
+JOURNAL_COMPACT_AFTER = int(os.getenv("JOURNAL_COMPACT_AFTER", "1000"))
+# How many older snapshots (with checksums) to keep for crash recovery
+SNAPSHOT_GENERATIONS = int(os.getenv("SNAPSHOT_GENERATIONS", "3"))
+# json or msgpack; existing files are read in either format
+SNAPSHOT_FORMAT = os.getenv("SNAPSHOT_FORMAT", "json")
+# How many leagues' shard files to keep loaded at once
+LEAGUE_SHARD_CACHE_SIZE = int(os.getenv("LEAGUE_SHARD_CACHE_SIZE", "16"))
+# Saves requested within this many seconds of each other are written together
+SAVE_COALESCE_SECONDS = float(os.getenv("SAVE_COALESCE_SECONDS", "1.0"))
+# Completed leagues and casual matches older than COLD_MATCH_DAYS move to compressed archives here
+COLD_STORAGE_DIR = os.getenv("COLD_STORAGE_DIR", "match_data_cold")
+COLD_MATCH_DAYS = float(os.getenv("COLD_MATCH_DAYS", "180"))
+TIERING_INTERVAL_HOURS = float(os.getenv("TIERING_INTERVAL_HOURS", "24"))
+# Fewer old matches than this stay hot rather than creating a tiny archive segment
+COLD_MIN_MATCHES = 500
+# Cached display names per (guild, user); see identity.py
+# Member/user update events refresh names, so the TTL only covers missed events
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "21600"))
+# How long an unknown or deleted user is remembered as "Unknown User"
+IDENTITY_NEGATIVE_TTL = float(os.getenv("IDENTITY_NEGATIVE_TTL", "3600"))
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "5000"))
+# Most REST name lookups in flight at once when rendering many rows
+IDENTITY_CONCURRENCY = int(os.getenv("IDENTITY_CONCURRENCY", "8"))
+# How often the full member list is re-chunked into the name index
+MEMBER_INDEX_REFRESH_HOURS = float(os.getenv("MEMBER_INDEX_REFRESH_HOURS", "6"))
+# Sports using a batched engine (Glicko-2) are rated once per period of this many days
+RATING_PERIOD_DAYS = float(os.getenv("RATING_PERIOD_DAYS", "7"))
+# Append-only log of every rating change, one file per sport; see rating_history.py
+RATING_HISTORY_DIR = os.getenv("RATING_HISTORY_DIR", "rating_history")
+# Pairwise records between opponents, one file per sport; see head_to_head.py
+HEAD_TO_HEAD_DIR = os.getenv("HEAD_TO_HEAD_DIR", "head_to_head")
+# Longest /league_projection may simulate before answering with the trials done so far
+PROJECTION_TIME_BUDGET = float(os.getenv("PROJECTION_TIME_BUDGET", "2.0"))
+# Weekly pairing cost per rating point between opponents (team averages in 2v2); 0 pairs on rematches alone.
+# A rematch costs 1000, so e.g. 1.0 prefers a 400-point gap over facing someone again.
+PAIRING_ELO_WEIGHT = float(os.getenv("PAIRING_ELO_WEIGHT", "0"))
+# Points in the /elo_history sparkline
+ELO_HISTORY_POINTS = 30
+# Rows per page in /leaderboard, /show_naked_laps and /league_standings
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "10"))
+
+# Load or initialize data (snapshot plus any journaled changes since it was written)
+if STORAGE_BACKEND == "sqlite":
+    # An existing match_data.json is imported the first time the database is created
+    backend = SqliteBackend(SQLITE_FILE, import_from=DATA_FILE)
 else:
-    match_data = {
-        "sports": {}, 
-        "elo": {}, 
-        "matches": [], 
-        "naked_laps": {},
-        "leagues": {},
-        "league_signups": {},
-        "league_matches": {},
-        "league_standings": {},
-        "admins": []
-    }
+    backend = JsonBackend(DATA_FILE, mode=PERSISTENCE_MODE, compact_after=JOURNAL_COMPACT_AFTER,
+                          generations=SNAPSHOT_GENERATIONS, shard_cache_size=LEAGUE_SHARD_CACHE_SIZE,
+                          snapshot_format=SNAPSHOT_FORMAT)
+store = DataStore(backend)
+match_data = store.data
+rating_history = RatingHistory(RATING_HISTORY_DIR)
+head_to_head = HeadToHead(HEAD_TO_HEAD_DIR)
+# The history logs are appended on the same schedule as the match data is saved
+persistence = PersistenceScheduler(store, window=SAVE_COALESCE_SECONDS, companions=[rating_history, head_to_head])
+
+cold = ColdStorage(COLD_STORAGE_DIR)
+# Per-sport ordered rankings, updated by set_elo
+rankings = RankingIndex.from_elo(match_data["elo"])
+# Selected per sport by match_data["sports"][sport]["rating_engine"]; Elo if unset
+rating_engines = make_engines(K_FACTOR)
+identities = IdentityCache(client, ttl=IDENTITY_CACHE_TTL, capacity=IDENTITY_CACHE_SIZE,
+                           concurrency=IDENTITY_CONCURRENCY, negative_ttl=IDENTITY_NEGATIVE_TTL)
+# Matches archived right before a crash may not have been trimmed from the hot data yet
+if cold.matches_end > match_data["matches"].base:
+    store.trim(("matches",), cold.matches_end - match_data["matches"].base)
+    store.commit()
 
 # Load admin IDs from environment variable
 ADMIN_IDS = os.getenv("ADMIN_IDS", "").split(",") if os.getenv("ADMIN_IDS") else []
@@ -46,67 +121,92 @@ ADMIN_IDS = os.getenv("ADMIN_IDS", "").split(",") if os.getenv("ADMIN_IDS") else
 ADMIN_IDS = [int(admin_id.strip()) for admin_id in ADMIN_IDS if admin_id.strip().isdigit()]
 
 def save_data():
-    with open(DATA_FILE, "w") as f:
-        json.dump(match_data, f, indent=4)
+    # Coalesced and written off the event loop; see PersistenceScheduler
+    persistence.mark_dirty()
+
+def is_valid_score(score: str) -> bool:
+    """A "W-L" score with both numbers small enough to store"""
+    return parse_score(score)[0] >= 0
 
 async def get_user_display_info(user_id: int, sport: str = None, guild: discord.Guild = None) -> tuple:
     """Get user display name, ELO, and naked laps for consistent formatting"""
-    try:
-        user = await client.fetch_user(user_id)
-        # Try to get server nickname first, fall back to display name
-        display_name = user.display_name
-        if guild:
-            try:
-                member = await guild.fetch_member(user_id)
-                display_name = member.display_name
-            except:
-                pass  # Use user.display_name if member not found
-        
-        elo = get_elo(str(user_id), sport) if sport else 0
-        naked_laps = match_data["naked_laps"].get(str(user_id), 0)
-        
-        return display_name, elo, naked_laps
-    except:
-        elo = get_elo(str(user_id), sport) if sport else 0
-        naked_laps = match_data["naked_laps"].get(str(user_id), 0)
-        return f"Unknown User ({user_id})", elo, naked_laps
+    # Server nickname if the user is a member, else their display name; cached
+    display_name = (await identities.resolve(user_id, guild)).display_name
+
+    elo = get_elo(str(user_id), sport) if sport else 0
+    naked_laps = match_data["naked_laps"].get(str(user_id), 0)
+
+    return display_name, elo, naked_laps
 
 # Add any existing admins from environment to the data
 if ADMIN_IDS:
-    match_data["admins"] = list(set(match_data.get("admins", []) + ADMIN_IDS))
+    store.set(("admins",), list(set(match_data.get("admins", []) + ADMIN_IDS)))
     save_data()
 
 def get_elo(user_id: str, sport: str) -> float:
-    return match_data["elo"].get(user_id, {}).get(sport, 1000)
-
+    rating = store.rating(user_id, sport)
+    return 1000 if rating is None else rating
 
-def set_elo(user_id: str, sport: str, new_elo: float):
-    if user_id not in match_data["elo"]:
-        match_data["elo"][user_id] = {}
-    match_data["elo"][user_id][sport] = round(new_elo, 2)
 
+def sport_ranking(sport: str):
+    """A sport's leaderboard: indexed queries on the SQLite backend, else the in-memory RankingIndex"""
+    ranking = store.ranking(sport)
+    return rankings.sport(sport) if ranking is None else ranking
 
-def expected_score(rating_a, rating_b):
-    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
 
-
-def update_elo_winner_loser(winner_ids, loser_ids, sport):
-    winner_elos = [get_elo(str(uid), sport) for uid in winner_ids]
-    loser_elos = [get_elo(str(uid), sport) for uid in loser_ids]
-
-    avg_winner_elo = sum(winner_elos) / len(winner_elos)
-    avg_loser_elo = sum(loser_elos) / len(loser_elos)
-
-    expected_win = expected_score(avg_winner_elo, avg_loser_elo)
-    expected_loss = expected_score(avg_loser_elo, avg_winner_elo)
-
-    for uid, r in zip(winner_ids, winner_elos):
-        new_r = r + K_FACTOR * (1 - expected_win)
-        set_elo(str(uid), sport, new_r)
-
-    for uid, r in zip(loser_ids, loser_elos):
-        new_r = r + K_FACTOR * (0 - expected_loss)
-        set_elo(str(uid), sport, new_r)
+def set_elo(user_id: str, sport: str, new_elo: float, ref: int = NO_REF):
+    """ref is the casual match's position in the full history, for the rating history"""
+    if user_id not in match_data["elo"]:
+        store.set(("elo", user_id), {})
+    store.set(("elo", user_id, sport), round(new_elo, 2))
+    rankings.update(int(user_id), sport, round(new_elo, 2))
+    rating_history.record(int(user_id), sport, time.time(), round(new_elo, 2), ref)
+
+
+def get_rating_engine(sport: str) -> RatingEngine:
+    """The engine a sport is configured to use; Elo if unset or unavailable"""
+    name = match_data["sports"].get(sport, {}).get("rating_engine", "elo")
+    return rating_engines.get(name, rating_engines["elo"])
+
+
+def update_elo_winner_loser(winner_ids, loser_ids, sport, ref: int = NO_REF):
+    engine = get_rating_engine(sport)
+    if engine.batched:
+        # Rated together with the rest of the period by close_rating_period
+        if "pending_games" not in match_data["sports"][sport]:
+            store.set(("sports", sport, "pending_games"), [])
+        store.append(("sports", sport, "pending_games"), [list(winner_ids), list(loser_ids)])
+        return
+
+    players = {uid: PlayerRating(get_elo(str(uid), sport)) for uid in (*winner_ids, *loser_ids)}
+    for uid, player in engine.rate(players, [(winner_ids, loser_ids)]).items():
+        set_elo(str(uid), sport, player.rating, ref)
+
+
+def close_rating_period(sport: str):
+    """Rate every game a batched sport has collected since its last period, in one pass"""
+    engine = get_rating_engine(sport)
+    if not engine.batched:
+        return
+
+    config = match_data["sports"][sport]
+    games = [([str(uid) for uid in winners], [str(uid) for uid in losers])
+             for winners, losers in config.get("pending_games", [])]
+    # user id -> [rating deviation, volatility] of everyone rated in this sport so far
+    state = config.get("rating_state", {})
+    player_ids = set(state) | {uid for game in games for side in game for uid in side}
+    players = {uid: PlayerRating(get_elo(uid, sport), *state.get(uid, ())) for uid in player_ids}
+
+    rated = engine.rate(players, games)
+    for uid, player in rated.items():
+        if player.rating != get_elo(uid, sport):
+            set_elo(uid, sport, player.rating)
+    store.set(("sports", sport, "rating_state"), {
+        uid: [round(player.rd, 4), round(player.volatility, 6)] for uid, player in rated.items()
+    })
+    store.set(("sports", sport, "pending_games"), [])
+    store.set(("sports", sport, "period_started"), time.time())
+    save_data()
 
 
 # League Management Functions
@@ -126,13 +226,15 @@ def create_league(league_name: str, sport: str, season_length: int, signup_deadl
         "current_week": 0,
         "participants": [],
         "matches": {},
-        "standings": {}
+        "standings": {},
+        # Opponent, teammate and bye counts, kept in step with league_matches; see league_history.py
+        "history": empty_history()
     }
     
-    match_data["leagues"][league_name] = league
-    match_data["league_signups"][league_name] = []
-    match_data["league_matches"][league_name] = {}
-    match_data["league_standings"][league_name] = {}
+    store.set(("leagues", league_name), league)
+    store.set(("league_signups", league_name), [])
+    store.set(("league_matches", league_name), {})
+    store.set(("league_standings", league_name), {})
     
     save_data()
     return league
@@ -148,7 +250,7 @@ def add_participant_to_league(league_name: str, user_id: int) -> bool:
         return False
     
     if user_id not in match_data["league_signups"][league_name]:
-        match_data["league_signups"][league_name].append(user_id)
+        store.append(("league_signups", league_name), user_id)
         save_data()
         return True
     
@@ -165,15 +267,15 @@ def remove_participant_from_league(league_name: str, user_id: int) -> bool:
         return False
     
     if user_id in match_data["league_signups"][league_name]:
-        match_data["league_signups"][league_name].remove(user_id)
+        store.remove(("league_signups", league_name), user_id)
         save_data()
         return True
     
     return False
 
 
-def start_league(league_name: str) -> bool:
-    """Start a league and generate first week matches"""
+def start_league(league_name: str, full_schedule: bool = False) -> bool:
+    """Start a league and generate first week matches, or with full_schedule every week's up front"""
     if league_name not in match_data["leagues"]:
         return False
     
@@ -185,18 +287,21 @@ def start_league(league_name: str) -> bool:
     if len(participants) < 2:
         return False
     
-    league["status"] = "active"
-    league["current_week"] = 1
-    league["participants"] = participants.copy()
+    store.set(("leagues", league_name, "status"), "active")
+    store.set(("leagues", league_name, "current_week"), 1)
+    store.set(("leagues", league_name, "participants"), participants.copy())
     
     # Initialize standings
     for user_id in participants:
-        match_data["league_standings"][league_name][str(user_id)] = {
+        store.set(("league_standings", league_name, str(user_id)), {
             "wins": 0,
             "losses": 0,
             "points": 0,
             "elo": get_elo(str(user_id), league["sport"])
-        }
+        })
+    
+    if full_schedule:
+        store.set(("leagues", league_name, "schedule"), schedule_season(league_name))
     
     # Generate first week matches
     generate_week_matches(league_name, 1)
@@ -213,78 +318,162 @@ def generate_week_matches(league_name: str, week: int):
     league = match_data["leagues"][league_name]
     participants = league["participants"]
     
+    # Leagues started with a full schedule just look the week up
+    scheduled = league.get("schedule", {}).get(str(week))
+    if scheduled is not None:
+        set_league_week(league_name, week, copy.deepcopy(scheduled))
+        save_data()
+        return
+    
     if week not in match_data["league_matches"][league_name]:
-        match_data["league_matches"][league_name][week] = []
+        set_league_week(league_name, week, [])
     
     if league.get("team_size", 1) == 2:
         matches = generate_week_matches_2v2(league_name, week, participants)
-        match_data["league_matches"][league_name][week] = matches
+        set_league_week(league_name, week, matches)
         save_data()
         return
     
-    # 1v1 path (existing)
     match_history = get_match_history(league_name)
     bye_history = get_bye_history(league_name)
-    matches = generate_optimal_pairings(participants, match_history, bye_history, week)
-    match_data["league_matches"][league_name][week] = matches
+    ratings = {user_id: get_elo(str(user_id), league["sport"]) for user_id in participants}
+    matches = generate_optimal_pairings(participants, match_history, bye_history, week,
+                                        ratings=ratings, seed=pairing_seed(league_name, week))
+    set_league_week(league_name, week, matches)
     save_data()
 
 
+def set_league_week(league_name: str, week: int, matches: List[Dict]):
+    """Store a week's matches, updating the league's history counters for whatever they replace"""
+    league_history(league_name)
+    previous = match_data["league_matches"][league_name].get(week, [])
+    store.set(("league_matches", league_name, week), matches)
+    update_league_history(league_name, previous, matches)
+    store.set(("leagues", league_name, "history", "weeks", str(week)), len(matches))
+
+
+def set_league_match(league_name: str, week: int, index: int, match: Dict):
+    """Store one league match, updating the history counters if it now counts differently"""
+    league_history(league_name)
+    previous = match_data["league_matches"][league_name][week][index]
+    store.set(("league_matches", league_name, week, index), match)
+    update_league_history(league_name, [previous], [match])
+
+
+def update_league_history(league_name: str, removed: List[Dict], added: List[Dict]):
+    history = match_data["leagues"][league_name]["history"]
+    for (section, key), count in count_changes(history, removed, added).items():
+        if count:
+            store.set(("leagues", league_name, "history", section, key), count)
+        else:
+            store.delete(("leagues", league_name, "history", section, key))
+
+
+def league_history(league_name: str) -> Dict:
+    """A league's history counters, recounted from its weeks if missing or out of step with them.
+
+    Leagues created before the counters existed are counted the first time
+    they're used; after that the check only compares match counts per week.
+    """
+    league = match_data["leagues"].get(league_name)
+    if league is None:
+        return empty_history()
+    weeks = match_data["league_matches"].get(league_name, {})
+    if not is_current(league.get("history"), weeks):
+        store.set(("leagues", league_name, "history"), build_history(weeks))
+        save_data()
+    return league["history"]
+
+
+def schedule_season(league_name: str) -> Dict[str, List[Dict]]:
+    """Every week of a league's season, keyed by week number as a string.
+
+    1v1 leagues get a round robin: no rematches until everyone has met, and
+    at most one bye each per cycle. 2v2 teams change every week, so those
+    weeks are paired one after another with the weekly engine, each seeing
+    the counts of the weeks before it.
+    """
+    league = match_data["leagues"][league_name]
+    participants = league["participants"]
+    weeks = range(1, league["season_length"] + 1)
+    if league.get("team_size", 1) != 2:
+        rounds = round_robin(participants, len(weeks), pairing_seed(league_name, 0))
+        return {str(week): week_matches_1v1(week, pairs, bye) for week, (pairs, bye) in zip(weeks, rounds)}
+
+    ratings = {user_id: get_elo(str(user_id), league["sport"]) for user_id in participants}
+    history = empty_history()
+    schedule = {}
+    for week in weeks:
+        fixtures, bye_player, bye_team = pair_week_2v2(
+            participants, pair_counts(history["opponents"]), user_counts(history["byes"]),
+            pair_counts(history["teammates"]), ratings, PAIRING_ELO_WEIGHT, pairing_seed(league_name, week)
+        )
+        schedule[str(week)] = week_matches_2v2(week, fixtures, bye_player, bye_team)
+        count_matches(history, schedule[str(week)])
+    return schedule
+
+
+def pairing_seed(league_name: str, week: int) -> str:
+    """Seed for a week's pairings, so regenerating a week gives the same matches"""
+    return f"{league_name}:{week}"
+
+
+def generate_optimal_pairings(participants: List[int], match_history: Dict[tuple, int], bye_history: Dict[int, int],
+                              week: int, ratings: Optional[Dict[int, float]] = None, seed=None) -> List[Dict]:
+    """1v1 matches for a week: fewest repeat matchups (and optionally closest ratings), byes rotated evenly"""
+    pairs, bye_player = pair_week(participants, match_history, bye_history, ratings, PAIRING_ELO_WEIGHT, seed)
+    return week_matches_1v1(week, pairs, bye_player)
+
+
+def week_matches_1v1(week: int, pairs: List[Tuple[int, int]], bye_player: Optional[int]) -> List[Dict]:
+    """League match entries for a week of 1v1 pairings"""
+    matches = [
+        {
+            "week": week,
+            "player1": player1,
+            "player2": player2,
+            "status": "scheduled",
+            "result": None,
+            "scheduled_date": None,
+            "completed_date": None
+        }
+        for player1, player2 in pairs
+    ]
+    if bye_player is not None:
+        matches.append({
+            "week": week,
+            "player1": bye_player,
+            "player2": None,
+            "status": "bye",
+            "result": "bye",
+            "scheduled_date": None,
+            "completed_date": None
+        })
+    return matches
+
+
+def get_match_user_ids(matches: List[Dict]) -> List[int]:
+    """Every player id appearing in a list of league matches (1v1 or 2v2)"""
+    user_ids = []
+    for match in matches:
+        user_ids += [match.get("player1"), match.get("player2")]
+        user_ids += (match.get("team1") or []) + (match.get("team2") or [])
+    return [user_id for user_id in user_ids if user_id is not None]
+
+
 def get_match_history(league_name: str) -> Dict[tuple, int]:
-    """Get how many times each pair of players has faced each other"""
-    match_history = {}
-    
-    for week_num, week_matches in match_data["league_matches"].get(league_name, {}).items():
-        for match in week_matches:
-            # 1v1 historical matches
-            if match.get("player2") is not None and match.get("status") in ["completed", "forfeited", "scheduled"] and "player1" in match:
-                player_pair = tuple(sorted([match["player1"], match["player2"]]))
-                match_history[player_pair] = match_history.get(player_pair, 0) + 1
-            # 2v2 historical opponent pairs (count each individual vs individual) for opponent pressure
-            if match.get("team1") and match.get("team2") and match.get("status") in ["completed", "forfeited", "scheduled"]:
-                for a in match["team1"]:
-                    for b in match["team2"]:
-                        pair = tuple(sorted([a, b]))
-                        match_history[pair] = match_history.get(pair, 0) + 1
-    
-    return match_history
+    """Get how many times each pair of players has faced each other (1v1, or individuals across 2v2 teams)"""
+    return pair_counts(league_history(league_name)["opponents"])
 
 
 def get_bye_history(league_name: str) -> Dict[int, int]:
     """Get how many BYEs each player has received (1v1 or 2v2)"""
-    bye_history = {}
-    
-    for week_num, week_matches in match_data["league_matches"].get(league_name, {}).items():
-        for match in week_matches:
-            if match.get("status") == "bye":
-                # 1v1 bye
-                if match.get("player2") is None and match.get("player1") is not None:
-                    player_id = match["player1"]
-                    bye_history[player_id] = bye_history.get(player_id, 0) + 1
-                # 2v2 team bye
-                if match.get("team1") and not match.get("team2"):
-                    for pid in match["team1"]:
-                        bye_history[pid] = bye_history.get(pid, 0) + 1
-    
-    return bye_history
+    return user_counts(league_history(league_name)["byes"])
 
 
 def get_teammate_history(league_name: str) -> Dict[tuple, int]:
     """Count how many times two users have been teammates in 2v2."""
-    teammate_history: Dict[tuple, int] = {}
-    for week_num, week_matches in match_data["league_matches"].get(league_name, {}).items():
-        for match in week_matches:
-            if match.get("team1"):
-                t1 = match["team1"]
-                if len(t1) == 2:
-                    key = tuple(sorted(t1))
-                    teammate_history[key] = teammate_history.get(key, 0) + 1
-            if match.get("team2"):
-                t2 = match["team2"]
-                if len(t2) == 2:
-                    key = tuple(sorted(t2))
-                    teammate_history[key] = teammate_history.get(key, 0) + 1
-    return teammate_history
+    return pair_counts(league_history(league_name)["teammates"])
 
 
 def generate_week_matches_2v2(league_name: str, week: int, participants: List[int]) -> List[Dict]:
@@ -292,22 +481,33 @@ def generate_week_matches_2v2(league_name: str, week: int, participants: List[in
     if len(participants) < 2:
         return []
     
-    bye_history = get_bye_history(league_name)
-    teammate_history = get_teammate_history(league_name)
-    opponent_history = get_match_history(league_name)  # reuse individual-vs-individual counts
-    
-    players_pool = participants.copy()
-    players_pool_set = set(players_pool)
-    
-    # Assign individual bye if odd number of players
-    byes: List[Dict] = []
-    if len(players_pool) % 2 == 1:
-        # pick player with fewest byes
-        min_byes = min(bye_history.get(p, 0) for p in players_pool)
-        candidates = [p for p in players_pool if bye_history.get(p, 0) == min_byes]
-        bye_player = candidates[0]
-        players_pool.remove(bye_player)
-        byes.append({
+    sport = match_data["leagues"][league_name]["sport"]
+    ratings = {user_id: get_elo(str(user_id), sport) for user_id in participants}
+    fixtures, bye_player, bye_team = pair_week_2v2(
+        participants, get_match_history(league_name), get_bye_history(league_name),
+        get_teammate_history(league_name), ratings, PAIRING_ELO_WEIGHT, pairing_seed(league_name, week)
+    )
+    return week_matches_2v2(week, fixtures, bye_player, bye_team)
+
+
+def week_matches_2v2(week: int, fixtures: List[Tuple[Tuple[int, int], Tuple[int, int]]],
+                     bye_player: Optional[int], bye_team: Optional[Tuple[int, int]]) -> List[Dict]:
+    """League match entries for a week of 2v2 team pairings"""
+    matches: List[Dict] = [
+        {
+            "week": week,
+            "team1": list(team1),
+            "team2": list(team2),
+            "status": "scheduled",
+            "result": None,
+            "scheduled_date": None,
+            "completed_date": None
+        }
+        for team1, team2 in fixtures
+    ]
+    # Individual bye for an odd player out, then a team bye for an odd team out
+    if bye_player is not None:
+        matches.append({
             "week": week,
             "player1": bye_player,
             "player2": None,
@@ -316,92 +516,17 @@ def generate_week_matches_2v2(league_name: str, week: int, participants: List[in
             "scheduled_date": None,
             "completed_date": None
         })
-    
-    # Form teams from remaining players (greedy, minimize teammate repeats)
-    teams: List[List[int]] = []
-    used: set = set()
-    # sort players by number of times they've played (approximate via opponent_history degree + teammate_history degree)
-    def player_load(p: int) -> int:
-        opp = sum(ct for (a,b), ct in opponent_history.items() if a == p or b == p)
-        team = sum(ct for (a,b), ct in teammate_history.items() if a == p or b == p)
-        return opp + team
-    players_sorted = sorted(players_pool, key=player_load)
-    while players_sorted:
-        p = players_sorted.pop(0)
-        if p in used:
-            continue
-        best_q = None
-        best_score = float('inf')
-        for q in players_sorted:
-            if q in used or q == p:
-                continue
-            # high penalty if they teamed before
-            team_penalty = teammate_history.get(tuple(sorted([p, q])), 0) * 1000
-            # slight load balance penalty
-            balance_penalty = abs(player_load(p) - player_load(q))
-            score = team_penalty + balance_penalty
-            if score < best_score:
-                best_score = score
-                best_q = q
-        if best_q is not None:
-            teams.append([p, best_q])
-            used.add(p)
-            used.add(best_q)
-        # rebuild list without used
-        players_sorted = [x for x in players_sorted if x not in used]
-    
-    # If odd number of teams, assign team bye to the team with fewest combined byes
-    team_bye: Optional[List[int]] = None
-    if len(teams) % 2 == 1:
-        min_team_byes = float('inf')
-        for t in teams:
-            total_byes = bye_history.get(t[0], 0) + bye_history.get(t[1], 0)
-            if total_byes < min_team_byes:
-                min_team_byes = total_byes
-                team_bye = t
-        if team_bye:
-            teams.remove(team_bye)
-            byes.append({
-                "week": week,
-                "team1": team_bye,
-                "team2": None,
-                "status": "bye",
-                "result": "bye",
-                "scheduled_date": None,
-                "completed_date": None
-            })
-    
-    # Pair teams into matches, minimizing repeat opponents at individual level
-    matches: List[Dict] = []
-    teams_sorted = teams.copy()
-    # Greedy: always take first team and find best opponent
-    while len(teams_sorted) >= 2:
-        t1 = teams_sorted.pop(0)
-        best_t2 = None
-        best_score = float('inf')
-        for i in range(len(teams_sorted)):
-            t2 = teams_sorted[i]
-            # opponent penalty: sum of opponent_history across the 4 cross pairs
-            opp_penalty = sum(opponent_history.get(tuple(sorted([a, b])), 0) for a in t1 for b in t2) * 100
-            score = opp_penalty
-            if score < best_score:
-                best_score = score
-                best_t2 = t2
-        if best_t2 is not None:
-            teams_sorted.remove(best_t2)
-            matches.append({
-                "week": week,
-                "team1": t1,
-                "team2": best_t2,
-                "status": "scheduled",
-                "result": None,
-                "scheduled_date": None,
-                "completed_date": None
-            })
-        else:
-            break
-    
-    return matches + byes
+    if bye_team is not None:
+        matches.append({
+            "week": week,
+            "team1": list(bye_team),
+            "team2": None,
+            "status": "bye",
+            "result": "bye",
+            "scheduled_date": None,
+            "completed_date": None
+        })
+    return matches
 
 
 def select_bye_player(participants: List[int], bye_history: Dict[int, int]) -> int:
@@ -437,7 +562,7 @@ def advance_league_week(league_name: str) -> bool:
     
     current_week = league["current_week"]
     if current_week >= league["season_length"]:
-        league["status"] = "completed"
+        store.set(("leagues", league_name, "status"), "completed")
         save_data()
         
         # Send final rankings and season summary
@@ -447,9 +572,11 @@ def advance_league_week(league_name: str) -> bool:
     
     # Process forfeits for current week
     process_week_forfeits(league_name, current_week)
+    # A league week is a rating period for sports rated in batches
+    close_rating_period(league["sport"])
     
     # Advance to next week
-    league["current_week"] += 1
+    store.set(("leagues", league_name, "current_week"), current_week + 1)
     
     # Generate matches for next week
     generate_week_matches(league_name, league["current_week"])
@@ -458,6 +585,18 @@ def advance_league_week(league_name: str) -> bool:
     return True
 
 
+def apply_forfeit_penalty(user_ids: List[int], sport: str):
+    """Every player in an unplayed match loses K_FACTOR points, never dropping below 100.
+
+    Only for Elo sports: a game nobody won can't be rated by a batched engine
+    like Glicko-2, so there the forfeit only counts as a loss in the standings.
+    """
+    if get_rating_engine(sport).name != "elo":
+        return
+    for user_id in user_ids:
+        set_elo(str(user_id), sport, max(100, get_elo(str(user_id), sport) - K_FACTOR))
+
+
 def process_week_forfeits(league_name: str, week: int):
     """Process forfeits for matches that didn't happen"""
     if league_name not in match_data["league_matches"] or week not in match_data["league_matches"][league_name]:
@@ -467,33 +606,33 @@ def process_week_forfeits(league_name: str, week: int):
     sport = match_data["leagues"][league_name]["sport"]
     team_size = match_data["leagues"][league_name].get("team_size", 1)
     
-    for match in matches:
+    for index, match in enumerate(matches):
         if match["status"] == "scheduled":
             if team_size == 1 and match.get("player1") is not None and match.get("player2") is not None:
                 # 1v1: Both players lose maximum ELO
                 player1_id = match["player1"]
                 player2_id = match["player2"]
-                player1_elo = get_elo(str(player1_id), sport)
-                player2_elo = get_elo(str(player2_id), sport)
-                new_player1_elo = max(100, player1_elo - K_FACTOR)
-                new_player2_elo = max(100, player2_elo - K_FACTOR)
-                set_elo(str(player1_id), sport, new_player1_elo)
-                set_elo(str(player2_id), sport, new_player2_elo)
-                match["status"] = "forfeited"
-                match["result"] = "forfeit"
-                match["completed_date"] = datetime.now().isoformat()
+                apply_forfeit_penalty([player1_id, player2_id], sport)
+                set_league_match(league_name, week, index, {
+                    **match,
+                    "status": "forfeited",
+                    "result": "forfeit",
+                    "completed_date": datetime.now().isoformat()
+                })
                 update_league_standings(league_name, player1_id, "loss")
                 update_league_standings(league_name, player2_id, "loss")
             elif team_size == 2 and match.get("team1") and match.get("team2"):
                 # 2v2: All four players lose maximum ELO
                 all_players = match["team1"] + match["team2"]
+                apply_forfeit_penalty(all_players, sport)
                 for pid in all_players:
-                    current_elo = get_elo(str(pid), sport)
-                    set_elo(str(pid), sport, max(100, current_elo - K_FACTOR))
                     update_league_standings(league_name, pid, "loss")
-                match["status"] = "forfeited"
-                match["result"] = "forfeit"
-                match["completed_date"] = datetime.now().isoformat()
+                set_league_match(league_name, week, index, {
+                    **match,
+                    "status": "forfeited",
+                    "result": "forfeit",
+                    "completed_date": datetime.now().isoformat()
+                })
 
 
 def update_league_standings(league_name: str, user_id: int, result: str):
@@ -505,7 +644,7 @@ def update_league_standings(league_name: str, user_id: int, result: str):
     if user_id_str not in match_data["league_standings"][league_name]:
         return
     
-    standings = match_data["league_standings"][league_name][user_id_str]
+    standings = dict(match_data["league_standings"][league_name][user_id_str])
     
     if result == "win":
         standings["wins"] += 1
@@ -519,6 +658,7 @@ def update_league_standings(league_name: str, user_id: int, result: str):
     # Update current ELO
     sport = match_data["leagues"][league_name]["sport"]
     standings["elo"] = get_elo(user_id_str, sport)
+    store.set(("league_standings", league_name, user_id_str), standings)
     
     save_data()
 
@@ -531,39 +671,45 @@ def record_league_match_result(league_name: str, week: int, player1_id: int,
     
     matches = match_data["league_matches"][league_name][week]
     
-    for match in matches:
+    # Only player1's matches need checking
+    for index in store.league_match_indices(league_name, week, player1_id):
+        match = matches[index]
         if (match["player1"] == player1_id and match["player2"] == player2_id) or \
            (match["player1"] == player2_id and match["player2"] == player1_id):
             
             if match["status"] != "scheduled":
                 return False
             
-            match["status"] = "completed"
-            match["result"] = f"{winner_id}_{score}"
-            match["completed_date"] = datetime.now().isoformat()
+            completed_at = datetime.now()
+            set_league_match(league_name, week, index, {
+                **match,
+                "status": "completed",
+                "result": f"{winner_id}_{score}",
+                "completed_date": completed_at.isoformat()
+            })
             
             # Update ELO
             sport = match_data["leagues"][league_name]["sport"]
             if winner_id == player1_id:
                 update_elo_winner_loser([player1_id], [player2_id], sport)
+                head_to_head.add([player1_id], [player2_id], sport, completed_at.timestamp(), score)
                 update_league_standings(league_name, player1_id, "win")
                 update_league_standings(league_name, player2_id, "loss")
                 
                 # Check for naked lap (loser scored 0 points)
                 if score and score.split("-")[1].strip() == "0":
-                    match_data["naked_laps"][str(player2_id)] = (
-                        match_data["naked_laps"].get(str(player2_id), 0) + 1
-                    )
+                    store.set(("naked_laps", str(player2_id)),
+                              match_data["naked_laps"].get(str(player2_id), 0) + 1)
             else:
                 update_elo_winner_loser([player2_id], [player1_id], sport)
+                head_to_head.add([player2_id], [player1_id], sport, completed_at.timestamp(), score)
                 update_league_standings(league_name, player2_id, "win")
                 update_league_standings(league_name, player1_id, "loss")
                 
                 # Check for naked lap (loser scored 0 points)
                 if score and score.split("-")[1].strip() == "0":
-                    match_data["naked_laps"][str(player1_id)] = (
-                        match_data["naked_laps"].get(str(player1_id), 0) + 1
-                    )
+                    store.set(("naked_laps", str(player1_id)),
+                              match_data["naked_laps"].get(str(player1_id), 0) + 1)
             
             save_data()
             return True
@@ -578,21 +724,28 @@ def record_league_match_result_2v2(league_name: str, week: int, team1: List[int]
     
     matches = match_data["league_matches"][league_name][week]
     
-    for match in matches:
+    # Only the matches of team1's first player need checking
+    for index in store.league_match_indices(league_name, week, team1[0]):
+        match = matches[index]
         if (match["team1"] == team1 and match["team2"] == team2) or \
            (match["team1"] == team2 and match["team2"] == team1):
             
             if match["status"] != "scheduled":
                 return False
             
-            match["status"] = "completed"
-            match["result"] = f"{winner_team}_{score}"
-            match["completed_date"] = datetime.now().isoformat()
+            completed_at = datetime.now()
+            set_league_match(league_name, week, index, {
+                **match,
+                "status": "completed",
+                "result": f"{winner_team}_{score}",
+                "completed_date": completed_at.isoformat()
+            })
             
             # Update ELO
             sport = match_data["leagues"][league_name]["sport"]
             if winner_team == 1:
                 update_elo_winner_loser(team1, team2, sport)
+                head_to_head.add(team1, team2, sport, completed_at.timestamp(), score)
                 for uid in team1:
                     update_league_standings(league_name, uid, "win")
                 for uid in team2:
@@ -601,11 +754,10 @@ def record_league_match_result_2v2(league_name: str, week: int, team1: List[int]
                 # Check for naked lap (losing team scored 0 points)
                 if score and score.split("-")[1].strip() == "0":
                     for uid in team2:
-                        match_data["naked_laps"][str(uid)] = (
-                            match_data["naked_laps"].get(str(uid), 0) + 1
-                        )
+                        store.set(("naked_laps", str(uid)), match_data["naked_laps"].get(str(uid), 0) + 1)
             else:
                 update_elo_winner_loser(team2, team1, sport)
+                head_to_head.add(team2, team1, sport, completed_at.timestamp(), score)
                 for uid in team2:
                     update_league_standings(league_name, uid, "win")
                 for uid in team1:
@@ -614,9 +766,7 @@ def record_league_match_result_2v2(league_name: str, week: int, team1: List[int]
                 # Check for naked lap (losing team scored 0 points)
                 if score and score.split("-")[1].strip() == "0":
                     for uid in team1:
-                        match_data["naked_laps"][str(uid)] = (
-                            match_data["naked_laps"].get(str(uid), 0) + 1
-                        )
+                        store.set(("naked_laps", str(uid)), match_data["naked_laps"].get(str(uid), 0) + 1)
             
             save_data()
             return True
@@ -633,7 +783,7 @@ def is_admin(user_id: int) -> bool:
 def add_admin(user_id: int) -> bool:
     """Add a user as an admin"""
     if user_id not in match_data["admins"]:
-        match_data["admins"].append(user_id)
+        store.append(("admins",), user_id)
         save_data()
         return True
     return False
@@ -642,7 +792,7 @@ def add_admin(user_id: int) -> bool:
 def remove_admin(user_id: int) -> bool:
     """Remove a user's admin status"""
     if user_id in match_data["admins"]:
-        match_data["admins"].remove(user_id)
+        store.remove(("admins",), user_id)
         save_data()
         return True
     return False
@@ -688,24 +838,27 @@ class ConfirmMatchView(View):
 
         self.finalized = True
 
-        match_data["matches"].append(
+        store.append(
+            ("matches",),
             {
                 "sport": self.sport,
                 "winner_ids": self.winner_ids,
                 "loser_ids": self.loser_ids,
                 "score": self.score,
                 "reported_by": self.interaction.user.id,
+                "timestamp": datetime.now().timestamp(),
             }
         )
 
-        update_elo_winner_loser(self.winner_ids, self.loser_ids, self.sport)
+        matches = match_data["matches"]
+        ref = matches.base + len(matches) - 1
+        update_elo_winner_loser(self.winner_ids, self.loser_ids, self.sport, ref=ref)
+        head_to_head.add(self.winner_ids, self.loser_ids, self.sport, matches[-1]["timestamp"], self.score, ref)
 
         if self.score.split("-")[1].strip() == "0":
             for uid in self.loser_ids:
                 uid_str = str(uid)
-                match_data["naked_laps"][uid_str] = (
-                    match_data["naked_laps"].get(uid_str, 0) + 1
-                )
+                store.set(("naked_laps", uid_str), match_data["naked_laps"].get(uid_str, 0) + 1)
 
         save_data()
 
@@ -714,6 +867,147 @@ class ConfirmMatchView(View):
         )
 
 
+class JumpToPageModal(discord.ui.Modal, title="Jump to page"):
+    page_number = discord.ui.TextInput(label="Page number", max_length=6)
+
+    def __init__(self, pages: "PaginatedView"):
+        super().__init__()
+        self.pages = pages
+
+    async def on_submit(self, interaction: discord.Interaction):
+        if not self.page_number.value.strip().isdigit():
+            await interaction.response.send_message("❌ Enter a page number.", ephemeral=True)
+            return
+        await self.pages.show_page(interaction, int(self.page_number.value) - 1)
+
+
+class PaginatedView(View):
+    """One message with prev/next/jump buttons that renders a page only when it is shown.
+
+    render_page(offset, limit) returns the lines for that slice, so a page costs
+    the same however many rows there are, and only its own names get resolved.
+    count() is read on every render, so pages over live data stay in range.
+    """
+
+    def __init__(self, title: str, count: Callable[[], int],
+                 render_page: Callable[[int, int], Awaitable[List[str]]],
+                 header: str = "", page_size: int = PAGE_SIZE):
+        super().__init__(timeout=300)
+        self.title = title
+        self.count = count
+        self.render_page = render_page
+        self.header = header
+        self.page_size = page_size
+        self.page = 0
+
+    @property
+    def page_count(self) -> int:
+        return max(1, math.ceil(self.count() / self.page_size))
+
+    async def render(self) -> discord.Embed:
+        self.page = min(max(self.page, 0), self.page_count - 1)
+        lines = await self.render_page(self.page * self.page_size, self.page_size)
+        embed = discord.Embed(title=self.title, description="\n".join(([self.header] if self.header else []) + lines))
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count} • {self.count()} total")
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.page_count - 1
+        return embed
+
+    async def send(self, interaction: discord.Interaction):
+        embed = await self.render()
+        if self.page_count > 1:
+            await interaction.response.send_message(embed=embed, view=self)
+        else:
+            await interaction.response.send_message(embed=embed)
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        self.page = page
+        await interaction.response.edit_message(embed=await self.render(), view=self)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: Button):
+        await self.show_page(interaction, self.page + 1)
+
+    @discord.ui.button(label="🔢 Jump", style=discord.ButtonStyle.primary)
+    async def jump_to_page(self, interaction: discord.Interaction, button: Button):
+        await interaction.response.send_modal(JumpToPageModal(self))
+
+
+async def user_match_page(user_id: int, limit: int, before: Optional[int] = None) -> List[Tuple[int, Dict]]:
+    """(position, match) of up to `limit` of the user's matches older than position `before`, newest first"""
+    page = store.user_matches(user_id, limit=limit, before=before)
+    if len(page) < limit:
+        # Older matches live in cold storage
+        page += await asyncio.to_thread(cold.user_matches, user_id, limit - len(page), before)
+    return page
+
+
+class MatchHistoryView(View):
+    """Pages back through a user's matches with a cursor instead of an offset.
+
+    Each page starts just below the position of the previous page's oldest
+    match, so paging costs the same however far back it goes. The cursors of
+    the pages already seen are kept to page forward again.
+    """
+
+    def __init__(self, user_id: int, title: str, header: str, page_size: int = PAGE_SIZE):
+        super().__init__(timeout=300)
+        self.user_id = user_id
+        self.title = title
+        self.header = header
+        self.page_size = page_size
+        self.cursors: List[Optional[int]] = [None]
+
+    async def render(self, guild: discord.Guild) -> discord.Embed:
+        # One extra match tells whether there is an older page
+        page = await user_match_page(self.user_id, self.page_size + 1, self.cursors[-1])
+        has_older = len(page) > self.page_size
+        page = page[:self.page_size]
+
+        # Server nicknames for everyone on this page, resolved in one batch
+        names = await identities.resolve_many(
+            [uid for _, match in page for uid in match["winner_ids"] + match["loser_ids"]], guild
+        )
+        lines = [self.header]
+        for _, match in page:
+            winners = ", ".join(names[uid].display_name for uid in match["winner_ids"])
+            losers = ", ".join(names[uid].display_name for uid in match["loser_ids"])
+            outcome = "✅ Win" if self.user_id in match["winner_ids"] else "❌ Loss"
+            lines.append(
+                f"**{match['sport'].title()}** | {outcome} | 🏆 {winners} vs 💀 {losers} | 🎯 {match.get('score', 'N/A')}"
+            )
+
+        embed = discord.Embed(title=self.title, description="\n".join(lines))
+        embed.set_footer(text=f"Page {len(self.cursors)}")
+        self.newer_page.disabled = len(self.cursors) == 1
+        self.older_page.disabled = not has_older
+        self.next_cursor = page[-1][0] if page else None
+        return embed
+
+    async def send(self, interaction: discord.Interaction):
+        embed = await self.render(interaction.guild)
+        if self.older_page.disabled:
+            await interaction.response.send_message(embed=embed)
+        else:
+            await interaction.response.send_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ Newer", style=discord.ButtonStyle.secondary)
+    async def newer_page(self, interaction: discord.Interaction, button: Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await interaction.response.edit_message(embed=await self.render(interaction.guild), view=self)
+
+    @discord.ui.button(label="Older ▶", style=discord.ButtonStyle.secondary)
+    async def older_page(self, interaction: discord.Interaction, button: Button):
+        if self.next_cursor is not None:
+            self.cursors.append(self.next_cursor)
+        await interaction.response.edit_message(embed=await self.render(interaction.guild), view=self)
+
+
 # League UI Components
 class LeagueSignupView(View):
     def __init__(self, league_name: str):
@@ -874,9 +1168,9 @@ class LeagueMatchResultView(View):
             
             # Get player names for the final message
             try:
-                player1 = await client.fetch_user(self.player1_id)
-                player2 = await client.fetch_user(self.player2_id)
-                winner = await client.fetch_user(self.confirmed_winner)
+                player1 = await identities.resolve(self.player1_id, interaction.guild)
+                player2 = await identities.resolve(self.player2_id, interaction.guild)
+                winner = await identities.resolve(self.confirmed_winner, interaction.guild)
                 
                 await interaction.message.edit(
                     content=f"✅ **Match Result Confirmed!**\n"
@@ -983,8 +1277,8 @@ class LeagueMatchResultView2v2(View):
         )
         if ok:
             try:
-                team1_names = ", ".join([(await client.fetch_user(uid)).display_name for uid in self.team1])
-                team2_names = ", ".join([(await client.fetch_user(uid)).display_name for uid in self.team2])
+                team1_names = ", ".join([(await identities.resolve(uid, interaction.guild)).display_name for uid in self.team1])
+                team2_names = ", ".join([(await identities.resolve(uid, interaction.guild)).display_name for uid in self.team2])
                 await interaction.message.edit(
                     content=(
                         "✅ **Match Result Confirmed!**\n"
@@ -1014,6 +1308,47 @@ class LeagueMatchResultView2v2(View):
 async def on_ready():
     await tree.sync(guild=discord.Object(id=GUILD_ID))
     print(f"✅ Logged in as {client.user}. Slash commands synced.")
+    if not tier_cold_data.is_running():
+        tier_cold_data.start()
+    # First run happens right away, so names are indexed before the first render
+    if not refresh_member_index.is_running():
+        refresh_member_index.start()
+    if not close_rating_periods.is_running():
+        close_rating_periods.start()
+    if not head_to_head.is_built():
+        # First start with the index: fill it in from every match played so far
+        try:
+            await rebuild_head_to_head()
+            print("🤝 Built the head-to-head index")
+        except Exception as e:
+            print(f"Error building the head-to-head index: {e}")
+
+
+@client.event
+async def on_member_join(member: discord.Member):
+    identities.update_member(member)
+
+
+@client.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.display_name != after.display_name:
+        identities.update_member(after)
+
+
+@client.event
+async def on_member_remove(member: discord.Member):
+    identities.remove_member(member)
+
+
+@client.event
+async def on_user_update(before: discord.User, after: discord.User):
+    if before.display_name != after.display_name:
+        identities.update_user(after)
+        # Members without a nickname show their account name, so re-store those too
+        for guild in client.guilds:
+            member = guild.get_member(after.id)
+            if member is not None:
+                identities.update_member(member)
 
 
 # ------------------------------------------
@@ -1037,13 +1372,58 @@ async def create_sport(interaction: discord.Interaction, name: str, team_size: i
             f"⚠️ Sport **{name}** already exists.", ephemeral=True
         )
         return
-    match_data["sports"][name] = {"team_size": team_size}
+    store.set(("sports", name), {"team_size": team_size})
     save_data()
     await interaction.response.send_message(
         f"✅ Sport **{name}** created with team size **{team_size}v{team_size}**."
     )
 
 
+@tree.command(
+    name="set_rating_engine",
+    description="(Admin only) Choose how a sport's ratings are calculated",
+    guild=discord.Object(id=GUILD_ID),
+)
+@app_commands.describe(sport="Sport name", engine="Rating engine")
+@app_commands.choices(engine=[
+    app_commands.Choice(name="Elo (updates after every match)", value="elo"),
+    app_commands.Choice(name="Glicko-2 (updates once per rating period)", value="glicko2"),
+])
+async def set_rating_engine(interaction: discord.Interaction, sport: str, engine: str):
+    # Admin-only check
+    if not is_admin(interaction.user.id):
+        await interaction.response.send_message(
+            "⛔ You must be an admin to change rating engines.", ephemeral=True
+        )
+        return
+
+    sport = sport.lower()
+    if sport not in match_data["sports"]:
+        await interaction.response.send_message("❌ Sport not found.", ephemeral=True)
+        return
+    if engine not in rating_engines:
+        await interaction.response.send_message(
+            f"❌ The {engine} engine isn't available (it needs numpy installed).", ephemeral=True
+        )
+        return
+
+    # Games waiting for the old engine's period are rated by it before switching
+    close_rating_period(sport)
+    store.set(("sports", sport, "rating_engine"), engine)
+    if rating_engines[engine].batched:
+        store.set(("sports", sport, "pending_games"), [])
+        store.set(("sports", sport, "period_started"), time.time())
+    save_data()
+    await interaction.response.send_message(
+        f"✅ **{sport.title()}** ratings now use **{engine}**. Current ratings carry over."
+    )
+
+
+@set_rating_engine.autocomplete("sport")
+async def set_rating_engine_sport_autocomplete(interaction: discord.Interaction, current: str):
+    return await autocomplete_sports(interaction, current)
+
+
 # ------------------------------------------
 # /match for 1v1 or 2v2
 # ------------------------------------------
@@ -1077,6 +1457,12 @@ async def match(
         )
         return
 
+    if not is_valid_score(score):
+        await interaction.response.send_message(
+            "❌ Score must look like `21-15`.", ephemeral=True
+        )
+        return
+
     team_size = match_data["sports"][sport]["team_size"]
     if team_size == 1 and (winner2 or loser2):
         await interaction.response.send_message(
@@ -1129,32 +1515,118 @@ async def sport_autocomplete(interaction: discord.Interaction, current: str):
 async def leaderboard(interaction: discord.Interaction, sport: str):
     sport = sport.lower()
 
-    leaderboard = [
-        (int(user_id), elo[sport])
-        for user_id, elo in match_data["elo"].items()
-        if sport in elo
-    ]
+    ranking = sport_ranking(sport)
 
-    if not leaderboard:
+    if not len(ranking):
         await interaction.response.send_message(
             "❌ No ELO data available for this sport."
         )
         return
 
-    leaderboard.sort(key=lambda x: x[1], reverse=True)
+    async def render_page(offset: int, limit: int) -> List[str]:
+        # Positions offset.. straight from the ranking; only this page's names are looked up
+        page = ranking.page(offset, limit)
+        names = await identities.resolve_many([uid for uid, _ in page], interaction.guild)
+        lines = []
+        for rank, (uid, elo) in enumerate(page, start=offset + 1):
+            naked_laps = match_data["naked_laps"].get(str(uid), 0)
+            lines.append(f"**#{rank}** – {names[uid].display_name}: {elo} 🩲{naked_laps}")
+        return lines
 
-    lines = []
-    for rank, (uid, elo) in enumerate(leaderboard, start=1):
-        display_name, _, naked_laps = await get_user_display_info(uid, sport, interaction.guild)
-        lines.append(f"**#{rank}** – {display_name}: {elo} 🩲{naked_laps}")
+    await PaginatedView(f"🏆 {sport.title()} Leaderboard 🏆", lambda: len(ranking), render_page).send(interaction)
+
+
+@leaderboard.autocomplete("sport")
+async def sport_autocomplete(interaction: discord.Interaction, current: str):
+    return await autocomplete_sports(interaction, current)
+
+
+@tree.command(
+    name="rank",
+    description="Show a player's leaderboard position in a sport",
+    guild=discord.Object(id=GUILD_ID),
+)
+@app_commands.describe(sport="Sport name", user="Player to look up (defaults to you)")
+async def rank(interaction: discord.Interaction, sport: str, user: Optional[discord.Member] = None):
+    sport = sport.lower()
+    user = user or interaction.user
+    ranking = sport_ranking(sport)
+    position = ranking.rank(user.id)
+
+    if position is None:
+        await interaction.response.send_message(
+            f"❌ {user.display_name} has no {sport.title()} rating yet.", ephemeral=True
+        )
+        return
 
     await interaction.response.send_message(
-        f"🏆 **{sport.title()} Leaderboard** 🏆\n" + "\n".join(lines)
+        f"📈 **{user.display_name}** is ranked **#{position}** of {len(ranking)} in "
+        f"**{sport.title()}** with an ELO of {get_elo(str(user.id), sport)}"
     )
 
 
-@leaderboard.autocomplete("sport")
-async def sport_autocomplete(interaction: discord.Interaction, current: str):
+@rank.autocomplete("sport")
+async def rank_sport_autocomplete(interaction: discord.Interaction, current: str):
+    return await autocomplete_sports(interaction, current)
+
+
+@tree.command(
+    name="elo_history",
+    description="Show how a player's ELO changed over time, or what it was on a date",
+    guild=discord.Object(id=GUILD_ID),
+)
+@app_commands.describe(
+    sport="Sport name",
+    user="Player to look up (defaults to you)",
+    date="Show the rating at the end of this day instead (YYYY-MM-DD)"
+)
+async def elo_history(interaction: discord.Interaction, sport: str,
+                      user: Optional[discord.Member] = None, date: Optional[str] = None):
+    sport = sport.lower()
+    user = user or interaction.user
+    # The first lookup in a sport reads its history file
+    series = await asyncio.to_thread(rating_history.series, user.id, sport)
+
+    if not series:
+        await interaction.response.send_message(
+            f"❌ No {sport.title()} rating history for {user.display_name}.", ephemeral=True
+        )
+        return
+
+    if date:
+        try:
+            day_end = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).timestamp()
+        except ValueError:
+            await interaction.response.send_message(
+                "❌ Invalid date format. Use YYYY-MM-DD.", ephemeral=True
+            )
+            return
+        rating = series.rating_at(day_end)
+        await interaction.response.send_message(
+            f"📅 **{user.display_name}**'s {sport.title()} ELO on {date}: "
+            + (f"**{rating}**" if rating is not None else "no rated matches yet (1000)")
+        )
+        return
+
+    points = series.downsample(ELO_HISTORY_POINTS)
+    ratings = [rating for _, rating in points]
+    low, high = min(ratings), max(ratings)
+    bars = "▁▂▃▄▅▆▇█"
+    sparkline = "".join(
+        bars[round((rating - low) / (high - low) * (len(bars) - 1)) if high > low else 0] for rating in ratings
+    )
+    all_ratings = series.ratings
+    await interaction.response.send_message(
+        f"📈 **{user.display_name}** – {sport.title()} ELO history\n"
+        f"`{sparkline}`\n"
+        f"• Current: {all_ratings[-1] / 100}\n"
+        f"• Peak: {max(all_ratings) / 100} • Low: {min(all_ratings) / 100}\n"
+        f"• Rating changes: {len(series)}"
+    )
+
+
+@elo_history.autocomplete("sport")
+async def elo_history_sport_autocomplete(interaction: discord.Interaction, current: str):
     return await autocomplete_sports(interaction, current)
 
 
@@ -1169,51 +1641,74 @@ async def sport_autocomplete(interaction: discord.Interaction, current: str):
 @app_commands.describe(user="The user to view match history for")
 async def match_history(interaction: discord.Interaction, user: discord.Member):
     user_id = user.id
-    matches = match_data.get("matches", [])
 
-    # Filter matches involving the user
-    user_matches = [
-        m
-        for m in matches
-        if user_id in m.get("winner_ids", []) or user_id in m.get("loser_ids", [])
-    ]
+    wins, losses = store.user_record(user_id)
+    cold_wins, cold_losses = await asyncio.to_thread(cold.user_record, user_id)
+    wins, losses = wins + cold_wins, losses + cold_losses
+    if wins + losses == 0:
+        await interaction.response.send_message(f"📭 No matches found for {user.display_name}.")
+        return
+
+    view = MatchHistoryView(
+        user_id,
+        f"📜 Match History for {user.display_name}",
+        f"All time: {wins}W - {losses}L"
+    )
+    await view.send(interaction)
+
 
-    if not user_matches:
-        display_name, elo, naked_laps = await get_user_display_info(user_id, None, interaction.guild)
+# ------------------------------------------
+# /head_to_head
+# ------------------------------------------
+@tree.command(
+    name="head_to_head",
+    description="See the record between two players",
+    guild=discord.Object(id=GUILD_ID),
+)
+@app_commands.describe(
+    player="First player",
+    opponent="Second player",
+    sport="Only this sport (defaults to every sport they played)"
+)
+async def head_to_head_cmd(interaction: discord.Interaction, player: discord.Member,
+                           opponent: discord.Member, sport: Optional[str] = None):
+    if player.id == opponent.id:
+        await interaction.response.send_message("❌ Pick two different players.", ephemeral=True)
+        return
+
+    sports = [sport.lower()] if sport else list(match_data["sports"])
+    # The first lookup in a sport reads its index file; after that each one is a dict access
+    records = await asyncio.to_thread(
+        lambda: [(name, head_to_head.between(player.id, opponent.id, name)) for name in sports]
+    )
+    records = [(name, record) for name, record in records if record]
+
+    if not records:
         await interaction.response.send_message(
-            f"📭 No matches found for {display_name}."
+            f"📭 {player.display_name} and {opponent.display_name} haven't played each other"
+            + (f" in {sport.title()}." if sport else ".")
         )
         return
 
-    # Sort by most recent (optional)
-    user_matches = user_matches[::-1]
+    lines = [f"🤝 **{player.display_name}** vs **{opponent.display_name}**"]
+    for name, record in records:
+        lines.append(f"\n**{name.title()}**: {record.wins}W - {record.losses}L")
+        for meeting in reversed(record.recent):
+            if math.isfinite(meeting.timestamp):
+                day = datetime.fromtimestamp(meeting.timestamp).strftime("%Y-%m-%d")
+            else:
+                day = "Unknown date"
+            outcome = "✅ Win" if meeting.won else "❌ Loss"
+            score = f" | 🎯 {meeting.winner_score}-{meeting.loser_score}" if meeting.winner_score >= 0 else ""
+            kind = "Casual" if meeting.ref != NO_REF else "League"
+            lines.append(f"• {day} | {outcome} | {kind}{score}")
 
-    history_lines = []
-    for match in user_matches[-10:]:  # show up to last 10
-        sport = match["sport"]
-        score = match.get("score", "N/A")
-        
-        # Get winner names with server nicknames
-        winner_names = []
-        for uid in match["winner_ids"]:
-            display_name, _, _ = await get_user_display_info(uid, sport, interaction.guild)
-            winner_names.append(display_name)
-        winners = ", ".join(winner_names)
-        
-        # Get loser names with server nicknames
-        loser_names = []
-        for uid in match["loser_ids"]:
-            display_name, _, _ = await get_user_display_info(uid, sport, interaction.guild)
-            loser_names.append(display_name)
-        losers = ", ".join(loser_names)
-        outcome = "✅ Win" if user_id in match["winner_ids"] else "❌ Loss"
-        history_lines.append(
-            f"**{sport.title()}** | {outcome} | 🏆 {winners} vs 💀 {losers} | 🎯 {score}"
-        )
+    await interaction.response.send_message("\n".join(lines))
 
-    await interaction.response.send_message(
-        f"📜 **Match History for {user.display_name}**\n" + "\n".join(history_lines)
-    )
+
+@head_to_head_cmd.autocomplete("sport")
+async def head_to_head_sport_autocomplete(interaction: discord.Interaction, current: str):
+    return await autocomplete_sports(interaction, current)
 
 
 # ------------------------------------------
@@ -1233,14 +1728,15 @@ async def show_naked_laps(interaction: discord.Interaction):
 
     sorted_laps = sorted(laps.items(), key=lambda x: x[1], reverse=True)
 
-    lines = []
-    for rank, (uid, count) in enumerate(sorted_laps, start=1):
-        display_name, _, _ = await get_user_display_info(int(uid), None, interaction.guild)
-        lines.append(f"**#{rank}** – {display_name}: {count} naked lap(s)")
+    async def render_page(offset: int, limit: int) -> List[str]:
+        page = sorted_laps[offset:offset + limit]
+        names = await identities.resolve_many([int(uid) for uid, _ in page], interaction.guild)
+        return [
+            f"**#{rank}** – {names[int(uid)].display_name}: {count} naked lap(s)"
+            for rank, (uid, count) in enumerate(page, start=offset + 1)
+        ]
 
-    await interaction.response.send_message(
-        "🏃‍♂️ **Naked Lap Leaderboard** 🏃‍♀️\n" + "\n".join(lines)
-    )
+    await PaginatedView("🏃‍♂️ Naked Lap Leaderboard 🏃‍♀️", lambda: len(sorted_laps), render_page).send(interaction)
 
 
 # ------------------------------------------
@@ -1269,11 +1765,11 @@ async def clear_naked_lap(interaction: discord.Interaction, user: discord.Member
         )
         return
 
-    match_data["naked_laps"][uid] -= 1
+    store.set(("naked_laps", uid), match_data["naked_laps"][uid] - 1)
 
     # Clean up if count hits zero
     if match_data["naked_laps"][uid] == 0:
-        del match_data["naked_laps"][uid]
+        store.delete(("naked_laps", uid))
 
     save_data()
 
@@ -1389,7 +1885,7 @@ async def league_info(interaction: discord.Interaction, league_name: str):
     participant_names = []
     for user_id in signups:
         try:
-            user = await client.fetch_user(user_id)
+            user = await identities.resolve(user_id, interaction.guild)
             participant_names.append(user.display_name)
         except:
             participant_names.append(f"Unknown User ({user_id})")
@@ -1418,8 +1914,11 @@ async def league_info(interaction: discord.Interaction, league_name: str):
     description="(Admin only) Start a league and generate first week matches",
     guild=discord.Object(id=GUILD_ID),
 )
-@app_commands.describe(league_name="Name of the league to start")
-async def start_league_cmd(interaction: discord.Interaction, league_name: str):
+@app_commands.describe(
+    league_name="Name of the league to start",
+    full_schedule="Draw up every week's matches now, so players can see the whole season (default: False)"
+)
+async def start_league_cmd(interaction: discord.Interaction, league_name: str, full_schedule: bool = False):
     # Admin-only check
     if not is_admin(interaction.user.id):
         await interaction.response.send_message(
@@ -1433,11 +1932,13 @@ async def start_league_cmd(interaction: discord.Interaction, league_name: str):
         )
         return
 
-    if start_league(league_name):
+    if start_league(league_name, full_schedule):
         await interaction.response.send_message(
             f"🏃‍♂️ **League {league_name} has started!**\n"
             f"👥 **Format**: {match_data['leagues'][league_name]['team_size']}v{match_data['leagues'][league_name]['team_size']}\n"
             f"First week matches have been generated and sent to participants."
+            + (f"\n📅 All {match_data['leagues'][league_name]['season_length']} weeks are scheduled; "
+               f"see any of them with `/league_matches`." if full_schedule else "")
         )
         
         # Send match notifications to participants
@@ -1529,7 +2030,7 @@ async def complete_league_cmd(interaction: discord.Interaction, league_name: str
         return
 
     # Mark league as completed
-    league["status"] = "completed"
+    store.set(("leagues", league_name, "status"), "completed")
     save_data()
 
     await interaction.response.send_message(
@@ -1592,21 +2093,15 @@ async def advance_week_cmd(interaction: discord.Interaction, league_name: str):
 )
 @app_commands.describe(league_name="Name of the league")
 async def league_standings(interaction: discord.Interaction, league_name: str):
-    if league_name not in match_data["leagues"]:
+    league_data = await get_league_data(league_name)
+    if league_data is None:
         await interaction.response.send_message(
             "❌ League not found.", ephemeral=True
         )
         return
 
-    if league_name not in match_data["league_standings"]:
-        await interaction.response.send_message(
-            "❌ No standings available for this league yet.", ephemeral=True
-        )
-        return
+    league, standings, _ = league_data
 
-    league = match_data["leagues"][league_name]
-    standings = match_data["league_standings"][league_name]
-    
     if not standings:
         await interaction.response.send_message(
             "❌ No standings available for this league yet.", ephemeral=True
@@ -1620,18 +2115,109 @@ async def league_standings(interaction: discord.Interaction, league_name: str):
         reverse=True
     )
 
-    lines = []
-    for rank, (user_id, stats) in enumerate(sorted_standings, start=1):
-        display_name, elo, naked_laps = await get_user_display_info(int(user_id), league["sport"], interaction.guild)
-        lines.append(
-            f"**#{rank}** – {display_name}: {stats['points']}pts "
-            f"({stats['wins']}W/{stats['losses']}L) ELO: {elo} "
-            f"🩲{naked_laps}"
+    async def render_page(offset: int, limit: int) -> List[str]:
+        page = sorted_standings[offset:offset + limit]
+        names = await identities.resolve_many([int(user_id) for user_id, _ in page], interaction.guild)
+        lines = []
+        for rank, (user_id, stats) in enumerate(page, start=offset + 1):
+            elo = get_elo(user_id, league["sport"])
+            naked_laps = match_data["naked_laps"].get(user_id, 0)
+            lines.append(
+                f"**#{rank}** – {names[int(user_id)].display_name}: {stats['points']}pts "
+                f"({stats['wins']}W/{stats['losses']}L) ELO: {elo} "
+                f"🩲{naked_laps}"
+            )
+        return lines
+
+    await PaginatedView(
+        f"🏆 {league_name} League Standings 🏆", lambda: len(sorted_standings), render_page,
+        header=f"👥 **Format**: {league['team_size']}v{league['team_size']}"
+    ).send(interaction)
+
+
+@tree.command(
+    name="league_projection",
+    description="Simulate the rest of a league's season and show who is likely to win",
+    guild=discord.Object(id=GUILD_ID),
+)
+@app_commands.describe(
+    league_name="Name of the league",
+    trials="Number of simulated seasons (default 10000)",
+    top="Also show the chance of finishing in the top N (default 3)"
+)
+async def league_projection(interaction: discord.Interaction, league_name: str, trials: int = 10000, top: int = 3):
+    if league_name not in match_data["leagues"]:
+        await interaction.response.send_message(
+            "❌ League not found.", ephemeral=True
         )
+        return
 
-    await interaction.response.send_message(
-        f"🏆 **{league_name} League Standings** 🏆\n"
-        f"👥 **Format**: {match_data["leagues"][league_name]["team_size"]}v{match_data["leagues"][league_name]["team_size"]}\n" + "\n".join(lines)
+    league = match_data["leagues"][league_name]
+    if league["status"] != "active":
+        await interaction.response.send_message(
+            "❌ Projections are only available for active leagues.", ephemeral=True
+        )
+        return
+
+    trials = max(100, min(trials, 100000))
+    top = max(1, top)
+    participants = list(league["participants"])
+    sport = league["sport"]
+    team_size = league.get("team_size", 1)
+    standings = {
+        int(user_id): (stats["points"], stats["wins"])
+        for user_id, stats in match_data["league_standings"].get(league_name, {}).items()
+    }
+    ratings = {user_id: get_elo(str(user_id), sport) for user_id in participants}
+
+    # This week's unplayed matches, then every week that hasn't been generated yet
+    fixtures = []
+    for match in match_data["league_matches"][league_name].get(league["current_week"], []):
+        if match["status"] != "scheduled":
+            continue
+        if team_size == 2:
+            fixtures.append((match["team1"], match["team2"]))
+        else:
+            fixtures.append(([match["player1"]], [match["player2"]]))
+    weeks_left = league["season_length"] - league["current_week"]
+    history = (get_match_history(league_name), get_bye_history(league_name), get_teammate_history(league_name))
+    schedule = copy.deepcopy(league.get("schedule"))
+
+    await interaction.response.defer(thinking=True)
+
+    def simulate():
+        future_weeks = range(league["current_week"] + 1, league["season_length"] + 1)
+        if schedule is not None:
+            # Scheduled at the start: the rest of the season is already known
+            future = [
+                (match["team1"], match["team2"]) if team_size == 2 else ([match["player1"]], [match["player2"]])
+                for week in future_weeks for match in schedule[str(week)] if match["status"] == "scheduled"
+            ]
+        else:
+            seeds = [pairing_seed(league_name, week) for week in future_weeks]
+            future = project_schedule(participants, weeks_left, team_size, *history,
+                                      ratings=ratings, elo_weight=PAIRING_ELO_WEIGHT, seeds=seeds)
+        return project_season(participants, standings, ratings, fixtures + future,
+                              trials=trials, top_n=top, time_budget=PROJECTION_TIME_BUDGET)
+
+    try:
+        projection = await asyncio.to_thread(simulate)
+    except Exception as e:
+        print(f"Error projecting league {league_name}: {e}")
+        await interaction.followup.send(f"❌ Projection failed: {e}")
+        return
+
+    leaders = sorted(participants, key=lambda p: (projection.title[p], projection.top[p]), reverse=True)[:10]
+    names = await identities.resolve_many(leaders, interaction.guild)
+    lines = [
+        f"**{names[user_id].display_name}**: 🏆 {projection.title[user_id]:.1%} • "
+        f"Top {top}: {projection.top[user_id]:.1%} • Exp. pts: {projection.expected_points[user_id]:.1f}"
+        for user_id in leaders
+    ]
+    await interaction.followup.send(
+        f"🔮 **{league_name} Season Projection** 🔮\n"
+        f"📅 {len(fixtures)} matches left this week, {weeks_left} more week(s) • "
+        f"{projection.trials} simulated seasons in {projection.seconds:.2f}s\n" + "\n".join(lines)
     )
 
 
@@ -1656,13 +2242,15 @@ async def league_matches(interaction: discord.Interaction, league_name: str, wee
     if week is None:
         week = league["current_week"]
     
-    if week not in match_data["league_matches"][league_name]:
+    # Weeks not reached yet can still be shown if the whole season was scheduled at the start
+    matches = store.league_week(league_name, week)
+    if matches is None:
+        matches = league.get("schedule", {}).get(str(week))
+    if matches is None:
         await interaction.response.send_message(
             f"❌ No matches found for week {week}.", ephemeral=True
         )
         return
-
-    matches = match_data["league_matches"][league_name][week]
     
     if not matches:
         await interaction.response.send_message(
@@ -1670,32 +2258,34 @@ async def league_matches(interaction: discord.Interaction, league_name: str, wee
         )
         return
 
+    names = await identities.resolve_many(get_match_user_ids(matches), interaction.guild)
+
+    status_emoji = {
+        "scheduled": "⏰",
+        "completed": "✅",
+        "forfeited": "❌"
+    }
+
     lines = []
     for match in matches:
-        if match["player2"] is None:  # Bye
-            try:
-                player1 = await client.fetch_user(match["player1"])
-                lines.append(f"🆓 **{player1.display_name}** has a BYE this week")
-            except:
-                lines.append(f"🆓 **Unknown User ({match['player1']})** has a BYE this week")
+        status = status_emoji.get(match["status"], "❓")
+        if match.get("team1"):  # 2v2
+            team1 = ", ".join(names[uid].display_name for uid in match["team1"])
+            if not match.get("team2"):  # Bye
+                lines.append(f"🆓 **{team1}** have a BYE this week")
+            else:
+                team2 = ", ".join(names[uid].display_name for uid in match["team2"])
+                lines.append(f"{status} **{team1}** vs **{team2}** ({match['status'].title()})")
+        elif match["player2"] is None:  # Bye
+            player1 = names[match["player1"]]
+            lines.append(f"🆓 **{player1.display_name}** has a BYE this week")
         else:
-            try:
-                player1 = await client.fetch_user(match["player1"])
-                player2 = await client.fetch_user(match["player2"])
-                
-                status_emoji = {
-                    "scheduled": "⏰",
-                    "completed": "✅",
-                    "forfeited": "❌"
-                }
-                
-                status = status_emoji.get(match["status"], "❓")
-                lines.append(
-                    f"{status} **{player1.display_name}** vs **{player2.display_name}** "
-                    f"({match['status'].title()})"
-                )
-            except:
-                lines.append(f"❓ **Unknown User** vs **Unknown User** ({match['status'].title()})")
+            player1 = names[match["player1"]]
+            player2 = names[match["player2"]]
+            lines.append(
+                f"{status} **{player1.display_name}** vs **{player2.display_name}** "
+                f"({match['status'].title()})"
+            )
 
     await interaction.response.send_message(
         f"📅 **{league_name} - Week {week} Matches** 📅\n"
@@ -1709,7 +2299,8 @@ async def league_matches(interaction: discord.Interaction, league_name: str, wee
     guild=discord.Object(id=GUILD_ID),
 )
 async def list_leagues(interaction: discord.Interaction):
-    if not match_data["leagues"]:
+    archived = [name for name in cold.league_names() if name not in match_data["leagues"]]
+    if not match_data["leagues"] and not archived:
         await interaction.response.send_message(
             "📭 No leagues have been created yet."
         )
@@ -1730,6 +2321,9 @@ async def list_leagues(interaction: discord.Interaction):
             f"[{signup_count} participants]"
         )
 
+    if archived:
+        lines.append(f"📦 **Archived**: {', '.join(archived)} (see `/league_standings` or `/league_stats`)")
+
     await interaction.response.send_message(
         "🏆 **Available Leagues** 🏆\n" + "\n".join(lines)
     )
@@ -1756,13 +2350,12 @@ async def league_match_status(interaction: discord.Interaction, league_name: str
     if week is None:
         week = league["current_week"]
     
-    if week not in match_data["league_matches"][league_name]:
+    matches = store.league_week(league_name, week)
+    if matches is None:
         await interaction.response.send_message(
             f"❌ No matches found for week {week}.", ephemeral=True
         )
         return
-
-    matches = match_data["league_matches"][league_name][week]
     
     if not matches:
         await interaction.response.send_message(
@@ -1770,39 +2363,35 @@ async def league_match_status(interaction: discord.Interaction, league_name: str
         )
         return
 
+    names = await identities.resolve_many(get_match_user_ids(matches), interaction.guild)
+
     lines = []
     for match in matches:
         if match["player2"] is None:  # Bye
-            try:
-                player1 = await client.fetch_user(match["player1"])
-                lines.append(f"🆓 **{player1.display_name}** has a BYE this week")
-            except:
-                lines.append(f"🆓 **Unknown User ({match['player1']})** has a BYE this week")
+            player1 = names[match["player1"]]
+            lines.append(f"🆓 **{player1.display_name}** has a BYE this week")
         else:
-            try:
-                player1 = await client.fetch_user(match["player1"])
-                player2 = await client.fetch_user(match["player2"])
-                
-                status_emoji = {
-                    "scheduled": "⏰",
-                    "completed": "✅",
-                    "forfeited": "❌"
-                }
-                
-                status = status_emoji.get(match["status"], "❓")
-                
-                if match["status"] == "scheduled":
-                    lines.append(
-                        f"{status} **{player1.display_name}** vs **{player2.display_name}**\n"
-                        f"   📋 Status: {match['status'].title()} - Waiting for both players to confirm"
-                    )
-                else:
-                    lines.append(
-                        f"{status} **{player1.display_name}** vs **{player2.display_name}**\n"
-                        f"   📋 Status: {match['status'].title()}"
-                    )
-            except:
-                lines.append(f"❓ **Unknown User** vs **Unknown User** ({match['status'].title()})")
+            player1 = names[match["player1"]]
+            player2 = names[match["player2"]]
+            
+            status_emoji = {
+                "scheduled": "⏰",
+                "completed": "✅",
+                "forfeited": "❌"
+            }
+            
+            status = status_emoji.get(match["status"], "❓")
+            
+            if match["status"] == "scheduled":
+                lines.append(
+                    f"{status} **{player1.display_name}** vs **{player2.display_name}**\n"
+                    f"   📋 Status: {match['status'].title()} - Waiting for both players to confirm"
+                )
+            else:
+                lines.append(
+                    f"{status} **{player1.display_name}** vs **{player2.display_name}**\n"
+                    f"   📋 Status: {match['status'].title()}"
+                )
 
     await interaction.response.send_message(
         f"📅 **{league_name} - Week {week} Match Status** 📅\n"
@@ -1848,8 +2437,8 @@ async def league_match_history(interaction: discord.Interaction, league_name: st
     for (player1_id, player2_id), count in match_history.items():
         if count > 1:  # Only show if they've played more than once
             try:
-                player1 = await client.fetch_user(player1_id)
-                player2 = await client.fetch_user(player2_id)
+                player1 = await identities.resolve(player1_id, interaction.guild)
+                player2 = await identities.resolve(player2_id, interaction.guild)
                 repeat_lines.append(f"• **{player1.display_name}** vs **{player2.display_name}**: {count} times")
             except:
                 repeat_lines.append(f"• **Unknown User ({player1_id})** vs **Unknown User ({player2_id})**: {count} times")
@@ -1882,15 +2471,14 @@ async def league_match_history(interaction: discord.Interaction, league_name: st
 )
 @app_commands.describe(league_name="Name of the league")
 async def league_stats(interaction: discord.Interaction, league_name: str):
-    if league_name not in match_data["leagues"]:
+    league_data = await get_league_data(league_name)
+    if league_data is None:
         await interaction.response.send_message(
             "❌ League not found.", ephemeral=True
         )
         return
 
-    league = match_data["leagues"][league_name]
-    standings = match_data["league_standings"].get(league_name, {})
-    matches = match_data["league_matches"].get(league_name, {})
+    league, standings, matches = league_data
     
     # Calculate statistics
     total_matches = 0
@@ -1982,7 +2570,7 @@ async def extend_signup(interaction: discord.Interaction, league_name: str, new_
         return
 
     old_deadline = league["signup_deadline"]
-    league["signup_deadline"] = new_deadline
+    store.set(("leagues", league_name, "signup_deadline"), new_deadline)
     save_data()
 
     await interaction.response.send_message(
@@ -2014,13 +2602,13 @@ async def delete_league(interaction: discord.Interaction, league_name: str):
         return
 
     # Remove all league data
-    del match_data["leagues"][league_name]
+    store.delete(("leagues", league_name))
     if league_name in match_data["league_signups"]:
-        del match_data["league_signups"][league_name]
+        store.delete(("league_signups", league_name))
     if league_name in match_data["league_matches"]:
-        del match_data["league_matches"][league_name]
+        store.delete(("league_matches", league_name))
     if league_name in match_data["league_standings"]:
-        del match_data["league_standings"][league_name]
+        store.delete(("league_standings", league_name))
     
     save_data()
     
@@ -2152,6 +2740,12 @@ async def record_league_result_cmd(
         )
         return
 
+    if not is_valid_score(score):
+        await interaction.response.send_message(
+            "❌ Score must look like `21-15`.", ephemeral=True
+        )
+        return
+
     if record_league_match_result(league_name, week, player1.id, player2.id, winner.id, score):
         await interaction.response.send_message(
             f"✅ League match result recorded!\n"
@@ -2270,7 +2864,7 @@ async def admin_list(interaction: discord.Interaction):
     admin_lines = []
     for admin_id in admins:
         try:
-            user = await client.fetch_user(admin_id)
+            user = await identities.resolve(admin_id, interaction.guild)
             admin_lines.append(f"• **{user.display_name}** ({user.mention})")
         except:
             admin_lines.append(f"• **Unknown User** ({admin_id})")
@@ -2280,6 +2874,123 @@ async def admin_list(interaction: discord.Interaction):
     )
 
 
+@tree.command(
+    name="flush_data",
+    description="(Admin only) Write all pending changes to disk now",
+    guild=discord.Object(id=GUILD_ID),
+)
+async def flush_data(interaction: discord.Interaction):
+    # Admin-only check
+    if not is_admin(interaction.user.id):
+        await interaction.response.send_message(
+            "⛔ You must be an admin to flush data.", ephemeral=True
+        )
+        return
+
+    await persistence.flush()
+    stats = persistence.stats()
+
+    await interaction.response.send_message(
+        f"💾 **Data flushed**\n"
+        f"• Save requests: {stats['requests']}\n"
+        f"• Flushes: {stats['flushes']}\n"
+        f"• Coalesced saves: {stats['coalesced']}\n"
+        f"• Failed flushes: {stats['failures']}\n"
+        f"• Pending records: {stats['pending_records']}\n"
+        f"• Last flush: {stats['last_flush_ms']}ms",
+        ephemeral=True
+    )
+
+
+@tree.command(
+    name="recalculate_elo",
+    description="(Admin only) Rebuild every ELO rating by replaying the full match history",
+    guild=discord.Object(id=GUILD_ID),
+)
+@app_commands.describe(dry_run="Only report what would change (default: False)")
+async def recalculate_elo(interaction: discord.Interaction, dry_run: bool = False):
+    # Admin-only check
+    if not is_admin(interaction.user.id):
+        await interaction.response.send_message(
+            "⛔ You must be an admin to recalculate ELO.", ephemeral=True
+        )
+        return
+
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    version = rankings.version
+    started = time.perf_counter()
+    if not dry_run:
+        # Keeps rating changes recorded while the replay runs; set up with the capture in replay_all_ratings()
+        rating_history.begin_rebuild()
+    try:
+        replayed, history, match_count = await replay_all_ratings()
+    except Exception as e:
+        rating_history.cancel_rebuild()
+        print(f"Error replaying ratings: {e}")
+        await interaction.followup.send(f"❌ Replay failed: {e}", ephemeral=True)
+        return
+    seconds = time.perf_counter() - started
+
+    # Replay reproduces Elo; sports on other engines keep their ratings
+    history = {sport: records for sport, records in history.items() if get_rating_engine(sport).name == "elo"}
+    changes = [
+        (user_id, sport, rating)
+        for user_id, ratings in replayed.items()
+        for sport, rating in ratings.items()
+        if sport in history and get_elo(user_id, sport) != rating
+    ]
+    largest = max((abs(rating - get_elo(user_id, sport)) for user_id, sport, rating in changes), default=0)
+
+    if not dry_run:
+        if rankings.version != version:
+            rating_history.cancel_rebuild()
+            await interaction.followup.send(
+                "⚠️ Ratings changed while the replay was running. Please run the command again.", ephemeral=True
+            )
+            return
+        for user_id, sport, rating in changes:
+            set_elo(user_id, sport, rating)
+        save_data()
+        # The replayed history replaces the log; the corrections just made follow it
+        await asyncio.to_thread(rating_history.replace, history)
+
+    await interaction.followup.send(
+        f"♻️ **ELO {'replay (dry run)' if dry_run else 'recalculated'}**\n"
+        f"• Matches replayed: {match_count} in {seconds:.2f}s\n"
+        f"• K factor: {K_FACTOR:g}\n"
+        f"• Ratings {'that would change' if dry_run else 'changed'}: {len(changes)}\n"
+        f"• Largest change: {largest:.2f}",
+        ephemeral=True
+    )
+
+
+@tree.command(
+    name="cache_stats",
+    description="(Admin only) Show how well user names are being served from cache",
+    guild=discord.Object(id=GUILD_ID),
+)
+async def cache_stats(interaction: discord.Interaction):
+    # Admin-only check
+    if not is_admin(interaction.user.id):
+        await interaction.response.send_message(
+            "⛔ You must be an admin to view cache stats.", ephemeral=True
+        )
+        return
+
+    stats = identities.stats()
+
+    await interaction.response.send_message(
+        f"🪪 **Identity Cache**\n"
+        f"• Cached names: {stats['entries']}\n"
+        f"• Hits: {stats['hits']} ({stats['hit_rate']}%, {stats['negative_hits']} for unknown users)\n"
+        f"• Misses: {stats['misses']}\n"
+        f"• Resolved from member cache: {stats['gateway_hits']}\n"
+        f"• REST calls: {stats['rest_calls']} ({stats['retries']} rate-limit retries)\n"
+        f"• Indexed members: {stats['indexed_members']}",
+        ephemeral=True
+    )
+
+
 @tree.command(
     name="admin_check",
     description="Check if you have admin permissions",
@@ -2313,6 +3024,7 @@ async def send_week_matches(league_name: str, week: int):
         if guild:
             # Try to find a general channel or the first text channel
             channel = guild.system_channel or guild.text_channels[0]
+            names = await identities.resolve_many(get_match_user_ids(matches), guild)
             
             match_lines = []
             for match in matches:
@@ -2320,14 +3032,14 @@ async def send_week_matches(league_name: str, week: int):
                     # 2v2 rendering
                     if match.get("team2") is None and match.get("team1"):
                         try:
-                            t1_names = ", ".join([(await client.fetch_user(uid)).display_name for uid in match["team1"]])
+                            t1_names = ", ".join([names[uid].display_name for uid in match["team1"]])
                             match_lines.append(f"🆓 **{t1_names}** have a BYE this week")
                         except:
                             match_lines.append(f"🆓 **Team** has a BYE this week")
                     else:
                         try:
-                            t1_users = [await client.fetch_user(uid) for uid in match["team1"]]
-                            t2_users = [await client.fetch_user(uid) for uid in match["team2"]]
+                            t1_users = [names[uid] for uid in match["team1"]]
+                            t2_users = [names[uid] for uid in match["team2"]]
                             t1_mentions = ", ".join([u.mention for u in t1_users])
                             t2_mentions = ", ".join([u.mention for u in t2_users])
                             t1_names = ", ".join([u.display_name for u in t1_users])
@@ -2349,14 +3061,14 @@ async def send_week_matches(league_name: str, week: int):
                     # 1v1 rendering (existing)
                     if match["player2"] is None:  # Bye
                         try:
-                            player1 = await client.fetch_user(match["player1"])
+                            player1 = names[match["player1"]]
                             match_lines.append(f"🆓 **{player1.display_name}** has a BYE this week")
                         except:
                             match_lines.append(f"🆓 **Unknown User ({match['player1']})** has a BYE this week")
                     else:
                         try:
-                            player1 = await client.fetch_user(match["player1"])
-                            player2 = await client.fetch_user(match["player2"])
+                            player1 = names[match["player1"]]
+                            player2 = names[match["player2"]]
                             
                             match_lines.append(
                                 f"⚔️ **{player1.display_name}** vs **{player2.display_name}**"
@@ -2401,13 +3113,15 @@ async def resend_incomplete_matches(league_name: str, week: int, incomplete_matc
                 f"These matches still need to be completed:"
             )
             
+            names = await identities.resolve_many(get_match_user_ids(incomplete_matches), guild)
+
             # Resend each incomplete match
             for match in incomplete_matches:
                 if match.get("team1") or match.get("team2"):
                     # 2v2
                     if match.get("team2") is None and match.get("team1"):
                         try:
-                            t1_names = ", ".join([(await client.fetch_user(uid)).display_name for uid in match["team1"]])
+                            t1_names = ", ".join([names[uid].display_name for uid in match["team1"]])
                             await channel.send(
                                 f"🆓 **{t1_names}** have a BYE this week"
                             )
@@ -2417,8 +3131,8 @@ async def resend_incomplete_matches(league_name: str, week: int, incomplete_matc
                             )
                     else:
                         try:
-                            t1_users = [await client.fetch_user(uid) for uid in match["team1"]]
-                            t2_users = [await client.fetch_user(uid) for uid in match["team2"]]
+                            t1_users = [names[uid] for uid in match["team1"]]
+                            t2_users = [names[uid] for uid in match["team2"]]
                             t1_mentions = ", ".join([u.mention for u in t1_users])
                             t2_mentions = ", ".join([u.mention for u in t2_users])
                             view = LeagueMatchResultView2v2(league_name, week, match["team1"], match["team2"])
@@ -2435,7 +3149,7 @@ async def resend_incomplete_matches(league_name: str, week: int, incomplete_matc
                     # 1v1
                     if match["player2"] is None:  # Bye
                         try:
-                            player1 = await client.fetch_user(match["player1"])
+                            player1 = names[match["player1"]]
                             await channel.send(
                                 f"🆓 **{player1.display_name}** has a BYE this week"
                             )
@@ -2445,8 +3159,8 @@ async def resend_incomplete_matches(league_name: str, week: int, incomplete_matc
                             )
                     else:
                         try:
-                            player1 = await client.fetch_user(match["player1"])
-                            player2 = await client.fetch_user(match["player2"])
+                            player1 = names[match["player1"]]
+                            player2 = names[match["player2"]]
                             view = LeagueMatchResultView(league_name, week, match["player1"], match["player2"])
                             await channel.send(
                                 f"🏆 **{league_name} - Week {week} (Resent)**\n"
@@ -2475,6 +3189,7 @@ async def send_league_completion_summary(league_name: str):
     
     league = match_data["leagues"][league_name]
     standings = match_data["league_standings"].get(league_name, {})
+    guild = client.get_guild(GUILD_ID)
     
     # Sort standings by points, then wins, then ELO
     sorted_standings = sorted(
@@ -2512,19 +3227,10 @@ async def send_league_completion_summary(league_name: str):
     completion_rate = (total_matches / (league["season_length"] * len(league["participants"])) * 100) if league["season_length"] * len(league["participants"]) > 0 else 0
     final_message += f"**Completion Rate for {league_name}:** {completion_rate:.1f}%\n"
 
-    # Delete league data after completion
-    del match_data["leagues"][league_name]
-    if league_name in match_data["league_signups"]:
-        del match_data["league_signups"][league_name]
-    if league_name in match_data["league_matches"]:
-        del match_data["league_matches"][league_name]
-    if league_name in match_data["league_standings"]:
-        del match_data["league_standings"][league_name]
-    
-    save_data()
+    # Move league data to cold storage after completion
+    await archive_league(league_name)
 
     try:
-        guild = client.get_guild(GUILD_ID)
         if guild:
             channel = guild.system_channel or guild.text_channels[0]
             await channel.send(final_message)
@@ -2532,4 +3238,159 @@ async def send_league_completion_summary(league_name: str):
         print(f"Error sending league completion summary: {e}")
 
 
+async def archive_league(league_name: str):
+    """Move a completed league out of the hot data into a compressed cold archive"""
+    if league_name not in match_data["leagues"]:
+        return
+
+    # Copied on the loop: the league may still change while the archive is written
+    league = copy.deepcopy(match_data["leagues"][league_name])
+    matches = copy.deepcopy(match_data["league_matches"].get(league_name, {}))
+    standings = copy.deepcopy(match_data["league_standings"].get(league_name, {}))
+    signups = list(match_data["league_signups"].get(league_name, []))
+    await asyncio.to_thread(cold.archive_league, league_name, league, matches, standings, signups)
+
+    # Only drop the hot copy once the archive is safely on disk
+    store.delete(("leagues", league_name))
+    if league_name in match_data["league_signups"]:
+        store.delete(("league_signups", league_name))
+    if league_name in match_data["league_matches"]:
+        store.delete(("league_matches", league_name))
+    if league_name in match_data["league_standings"]:
+        store.delete(("league_standings", league_name))
+
+    save_data()
+
+
+async def archive_old_matches() -> int:
+    """Move casual matches older than COLD_MATCH_DAYS to cold storage; returns how many moved"""
+    archive = match_data["matches"]
+    count = archive.count_older_than(time.time() - COLD_MATCH_DAYS * 86400)
+    if count < COLD_MIN_MATCHES:
+        return 0
+
+    await asyncio.to_thread(cold.archive_matches, archive.copy_range(0, count))
+    store.trim(("matches",), count)
+    save_data()
+    return count
+
+
+async def get_league_data(league_name: str) -> Optional[tuple]:
+    """(league, standings, matches) from the hot data, or from cold storage once archived"""
+    if league_name in match_data["leagues"]:
+        return (
+            match_data["leagues"][league_name],
+            match_data["league_standings"].get(league_name, {}),
+            match_data["league_matches"].get(league_name, {})
+        )
+
+    archived = await asyncio.to_thread(cold.league, league_name)
+    if archived is None:
+        return None
+    return archived["league"], archived["standings"], archived["matches"]
+
+
+async def replay_all_ratings() -> tuple:
+    """Recompute every rating from all casual and league matches, hot and cold.
+
+    Returns (ratings laid out like match_data["elo"], rating history file contents
+    per sport, number of matches replayed).
+    The hot data is copied on the loop; cold files are read and the replay runs
+    in a worker thread.
+    """
+    captured_at = time.time()
+    hot = match_data["matches"].copy_range(0, len(match_data["matches"]))
+    leagues = [
+        (copy.deepcopy(league), copy.deepcopy(match_data["league_matches"].get(name, {})))
+        for name, league in match_data["leagues"].items()
+    ]
+
+    def replay():
+        log = EventLog()
+        # Anything archived after the copy above is already in it
+        for segment in cold.match_segments():
+            if segment.base + len(segment) <= hot.base:
+                log.add_archive(segment)
+        log.add_archive(hot)
+        for archived in cold.league_seasons():
+            if archived["archived_at"] < captured_at:
+                log.add_league(archived["league"], archived["matches"])
+        for league, weeks in leagues:
+            log.add_league(league, weeks)
+        events = log.events()
+        history = {}
+        ratings = replay_ratings(events, K_FACTOR, history)
+        return ratings, history, sum(len(sport_events) for sport_events in events.values())
+
+    return await asyncio.to_thread(replay)
+
+
+async def rebuild_head_to_head():
+    """Rebuild the head-to-head index from all casual and league matches, hot and cold.
+
+    Copies the hot data on the loop like replay_all_ratings(); results recorded
+    while the rebuild runs are kept.
+    """
+    captured_at = time.time()
+    hot = match_data["matches"].copy_range(0, len(match_data["matches"]))
+    leagues = [
+        (copy.deepcopy(league), copy.deepcopy(match_data["league_matches"].get(name, {})))
+        for name, league in match_data["leagues"].items()
+    ]
+    head_to_head.begin_rebuild()
+
+    def rebuild():
+        segments = (segment for segment in cold.match_segments() if segment.base + len(segment) <= hot.base)
+        seasons = (
+            (archived["league"], archived["matches"])
+            for archived in cold.league_seasons() if archived["archived_at"] < captured_at
+        )
+        head_to_head.replace(build_records(itertools.chain(segments, [hot]), itertools.chain(seasons, leagues)))
+
+    return await asyncio.to_thread(rebuild)
+
+
+@tasks.loop(hours=MEMBER_INDEX_REFRESH_HOURS)
+async def refresh_member_index():
+    guild = client.get_guild(GUILD_ID)
+    if guild is None:
+        return
+    try:
+        stats = await identities.prefetch_guild(guild)
+        print(f"👥 Indexed {stats['members']} members of {guild.name} in {stats['seconds']}s (~{stats['kilobytes']} KB)")
+    except Exception as e:
+        print(f"Error indexing guild members: {e}")
+
+
+@tasks.loop(hours=TIERING_INTERVAL_HOURS)
+async def tier_cold_data():
+    try:
+        # Leagues normally move when their summary is sent; catch any that didn't
+        for league_name, league in list(match_data["leagues"].items()):
+            if league["status"] == "completed":
+                await archive_league(league_name)
+
+        moved = await archive_old_matches()
+        if moved:
+            print(f"📦 Moved {moved} old matches to cold storage")
+    except Exception as e:
+        print(f"Error moving data to cold storage: {e}")
+
+
+@tasks.loop(hours=1)
+async def close_rating_periods():
+    # Sports without a league advancing their weeks still get a period every RATING_PERIOD_DAYS
+    for sport, config in list(match_data["sports"].items()):
+        if not get_rating_engine(sport).batched:
+            continue
+        if time.time() - config.get("period_started", 0) >= RATING_PERIOD_DAYS * 86400:
+            try:
+                close_rating_period(sport)
+            except Exception as e:
+                print(f"Error closing the {sport} rating period: {e}")
+
+
 client.run(TOKEN)
+
+# The event loop is gone; write whatever the scheduler had not flushed yet, side logs included
+persistence.close()
@@ -0,0 +1,205 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from match_archive import MatchArchive
+from storage import normalize_weeks, shard_filename, write_file_atomic
+
+
+class ColdStorage:
+    """Compressed, write-once archives for data that no longer changes.
+
+    Old casual matches are stored in segments covering a range of positions
+    in the full match history, and completed leagues in one file each. A
+    manifest lists both, so queries only decompress the files they read.
+    It also keeps every archived player's win/loss totals and the segments
+    they appear in, so a player's record needs no segment at all and their
+    history only opens segments they played in.
+    Nothing here is loaded at startup, and saving the hot data never touches
+    these files.
+    """
+
+    def __init__(self, directory: str, cache_size: int = 4):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[str, MatchArchive]" = OrderedDict()
+        # Queries run in worker threads, archiving on the loop
+        self.lock = threading.Lock()
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self) -> Dict:
+        manifest = {"match_segments": [], "leagues": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                manifest.update(json.load(f))
+        if "users" not in manifest:
+            # Manifests from before the player index; rebuilt from the segments on first use
+            manifest["users"] = {} if not manifest["match_segments"] else None
+        return manifest
+
+    def _write_manifest(self):
+        write_file_atomic(self.manifest_path, json.dumps(self.manifest, indent=4).encode())
+
+    def _write(self, filename: str, value: Dict):
+        os.makedirs(self.directory, exist_ok=True)
+        write_file_atomic(os.path.join(self.directory, filename), gzip.compress(json.dumps(value).encode()))
+
+    def _read(self, filename: str) -> Dict:
+        with gzip.open(os.path.join(self.directory, filename), "rb") as f:
+            return json.loads(f.read())
+
+    # --- casual matches ---
+
+    @property
+    def matches_end(self) -> int:
+        """Position in the full history just past the newest archived match"""
+        segments = self.manifest["match_segments"]
+        return segments[-1]["end"] if segments else 0
+
+    def archive_matches(self, matches: MatchArchive):
+        """Store matches as a new segment; they must directly follow the previous one"""
+        start, end = matches.base, matches.base + len(matches)
+        if start != self.matches_end:
+            raise ValueError(f"Cold segment starts at {start}, expected {self.matches_end}")
+
+        filename = f"matches-{start:010d}-{end:010d}.json.gz"
+        self._write(filename, matches.to_columns())
+        users = self._users()
+        with self.lock:
+            _index_users(users, len(self.manifest["match_segments"]), matches)
+            self.manifest["match_segments"].append({"file": filename, "start": start, "end": end})
+            self._write_manifest()
+
+    def _users(self) -> Dict[str, List]:
+        """The manifest's player index, built by reading every segment once if it has none yet"""
+        with self.lock:
+            if self.manifest["users"] is not None:
+                return self.manifest["users"]
+            segments = list(self.manifest["match_segments"])
+
+        users = {}
+        for position, entry in enumerate(segments):
+            _index_users(users, position, MatchArchive.from_columns(self._read(entry["file"])))
+        with self.lock:
+            if self.manifest["users"] is None:
+                self.manifest["users"] = users
+                self._write_manifest()
+            return self.manifest["users"]
+
+    def _user_entry(self, user_id: int) -> Tuple[int, int, List[Dict]]:
+        """(wins, losses, segments played in, oldest first) of an archived player"""
+        users = self._users()
+        with self.lock:
+            entry = users.get(str(user_id))
+            if entry is None:
+                return 0, 0, []
+            wins, losses, positions = entry
+            return wins, losses, [self.manifest["match_segments"][position] for position in positions]
+
+    def _segments(self) -> List[Dict]:
+        with self.lock:
+            return list(self.manifest["match_segments"])
+
+    def _segment(self, entry: Dict) -> MatchArchive:
+        with self.lock:
+            if entry["file"] in self.cache:
+                self.cache.move_to_end(entry["file"])
+                return self.cache[entry["file"]]
+
+        segment = MatchArchive.from_columns(self._read(entry["file"]))
+        with self.lock:
+            self.cache[entry["file"]] = segment
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return segment
+
+    def match_segments(self) -> Iterator[MatchArchive]:
+        """Every archived segment, oldest first; read straight from disk so the cache isn't flushed"""
+        for entry in self._segments():
+            yield MatchArchive.from_columns(self._read(entry["file"]))
+
+    def user_matches(self, user_id: int, limit: int, before: Optional[int] = None) -> List[Tuple[int, Dict]]:
+        """(position, match) of the most recent archived matches involving user_id below `before`, newest first"""
+        found = []
+        for entry in reversed(self._user_entry(user_id)[2]):
+            if before is not None and entry["start"] >= before:
+                continue
+            segment = self._segment(entry)
+            cursor = None if before is None else before - segment.base
+            for index in segment.indices_for_user(user_id, before=cursor):
+                found.append((segment.base + index, segment[index]))
+                if len(found) >= limit:
+                    return found
+        return found
+
+    def user_record(self, user_id: int, sport: Optional[str] = None) -> Tuple[int, int]:
+        """(wins, losses) across every archived match; only one sport's needs the segments read"""
+        wins, losses, segments = self._user_entry(user_id)
+        if sport is None:
+            return wins, losses
+        wins = losses = 0
+        for entry in segments:
+            segment_wins, segment_losses = self._segment(entry).user_record(user_id, sport)
+            wins += segment_wins
+            losses += segment_losses
+        return wins, losses
+
+    # --- completed leagues ---
+
+    def archive_league(self, name: str, league: Dict, matches: Dict, standings: Dict, signups: List):
+        archived_at = time.time()
+        filename = f"league-{shard_filename(name)[:-len('.json')]}-{int(archived_at)}.json.gz"
+        self._write(filename, {
+            "name": name,
+            "archived_at": archived_at,
+            "league": league,
+            "matches": matches,
+            "standings": standings,
+            "signups": signups
+        })
+        with self.lock:
+            # A league name can be reused after deletion; keep every season, newest last
+            self.manifest["leagues"].setdefault(name, []).append({
+                "file": filename,
+                "archived_at": archived_at,
+                "sport": league.get("sport")
+            })
+            self._write_manifest()
+
+    def league_names(self) -> List[str]:
+        return list(self.manifest["leagues"])
+
+    def league_seasons(self) -> Iterator[Dict]:
+        """Every archived season of every league"""
+        with self.lock:
+            entries = [entry for seasons in self.manifest["leagues"].values() for entry in seasons]
+        for entry in entries:
+            archived = self._read(entry["file"])
+            archived["matches"] = normalize_weeks(archived["matches"])
+            yield archived
+
+    def league(self, name: str) -> Optional[Dict]:
+        """The most recently archived season of a league, or None"""
+        entries = self.manifest["leagues"].get(name)
+        if not entries:
+            return None
+        archived = self._read(entries[-1]["file"])
+        archived["matches"] = normalize_weeks(archived["matches"])
+        return archived
+
+
+def _index_users(users: Dict[str, List], position: int, segment: MatchArchive):
+    """Add a segment's players to the manifest index: str(user id) -> [wins, losses, [segment positions]]"""
+    for user_id in segment.user_index:
+        wins, losses = segment.user_record(user_id)
+        entry = users.setdefault(str(user_id), [0, 0, []])
+        entry[0] += wins
+        entry[1] += losses
+        # 123 and "123" share a key; list the segment once
+        if not entry[2] or entry[2][-1] != position:
+            entry[2].append(position)
@@ -0,0 +1,219 @@
+import math
+import os
+import struct
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from match_archive import MatchArchive, parse_score
+from rating_history import NO_REF
+from replay import league_result
+from storage import shard_filename, write_file_atomic
+
+
+# One fixed-size record per (winner, loser) pairing in a match: 40 bytes.
+# Scores are -1 when the match's score doesn't parse or fit.
+RECORD = struct.Struct("<qqdqii")
+# Meetings kept per pair for display; wins and losses always count every match
+RECENT_MEETINGS = 5
+
+
+class Meeting(NamedTuple):
+    """One match between a pair, seen from the first player's side"""
+    timestamp: float
+    won: bool
+    winner_score: int
+    loser_score: int
+    ref: int
+
+
+class PairRecord:
+    """Wins and losses of one player against another in one sport, plus their latest meetings"""
+
+    __slots__ = ("wins", "losses", "recent")
+
+    def __init__(self):
+        self.wins = 0
+        self.losses = 0
+        self.recent: Deque[Meeting] = deque(maxlen=RECENT_MEETINGS)
+
+    def add(self, meeting: Meeting):
+        if meeting.won:
+            self.wins += 1
+        else:
+            self.losses += 1
+        self.recent.append(meeting)
+
+    def flipped(self) -> "PairRecord":
+        """The same record from the other player's side"""
+        record = PairRecord()
+        record.wins, record.losses = self.losses, self.wins
+        record.recent.extend(meeting._replace(won=not meeting.won) for meeting in self.recent)
+        return record
+
+
+class HeadToHead:
+    """Pairwise records between opponents, one append-only binary file per sport.
+
+    Works like RatingHistory: add() buffers records, flush() appends them
+    from the persistence worker, and a sport's file is read into a dict keyed
+    by (lower id, higher id) the first time that sport is queried. After that
+    a lookup is a single dict access, however many matches were played.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.loaded: Dict[str, Dict[Tuple[int, int], PairRecord]] = {}
+        self.pending: List[Tuple[str, bytes]] = []
+        # Records added while a rebuild is running; they are written after the rebuilt files
+        self.rebuilding: Optional[List[Tuple[str, bytes]]] = None
+        self.lock = threading.Lock()
+
+    def _path(self, sport: str) -> str:
+        return os.path.join(self.directory, shard_filename(sport)[:-len(".json")] + ".bin")
+
+    @property
+    def _complete_path(self) -> str:
+        return os.path.join(self.directory, "complete")
+
+    def is_built(self) -> bool:
+        """False until the index has been built from the existing match history once"""
+        return os.path.exists(self._complete_path)
+
+    def add(self, winner_ids: Sequence[int], loser_ids: Sequence[int], sport: str, timestamp: float,
+            score: Optional[str] = None, ref: int = NO_REF):
+        packed = pack_match(winner_ids, loser_ids, timestamp, score, ref)
+        if not packed:
+            return
+        with self.lock:
+            self.pending.append((sport, packed))
+            if self.rebuilding is not None:
+                self.rebuilding.append((sport, packed))
+            if sport in self.loaded:
+                _add(self.loaded[sport], packed)
+
+    def flush(self):
+        """Append buffered records to their sport files"""
+        with self.lock:
+            if not self.pending:
+                return
+            by_sport: Dict[str, List[bytes]] = {}
+            for sport, packed in self.pending:
+                by_sport.setdefault(sport, []).append(packed)
+            os.makedirs(self.directory, exist_ok=True)
+            for sport, records in by_sport.items():
+                with open(self._path(sport), "ab") as f:
+                    f.write(b"".join(records))
+            self.pending = []
+
+    def begin_rebuild(self):
+        """Call on the loop when capturing the data a rebuild will read"""
+        with self.lock:
+            self.rebuilding = []
+
+    def replace(self, records: Dict[str, bytes]):
+        """Swap in records built from the full history, keeping anything added since begin_rebuild()"""
+        with self.lock:
+            added = self.rebuilding or []
+            self.rebuilding = None
+            os.makedirs(self.directory, exist_ok=True)
+            sports = set(records) | {sport for sport, _ in added}
+            for sport in sports:
+                payload = records.get(sport, b"") + b"".join(packed for s, packed in added if s == sport)
+                write_file_atomic(self._path(sport), payload)
+            write_file_atomic(self._complete_path, b"")
+            self.pending = []
+            self.loaded = {}
+
+    def between(self, user_id: int, opponent_id: int, sport: str) -> Optional[PairRecord]:
+        """user_id's record against opponent_id; the first call for a sport reads its file"""
+        with self.lock:
+            if sport not in self.loaded:
+                self.loaded[sport] = self._load(sport)
+            record = self.loaded[sport].get((min(user_id, opponent_id), max(user_id, opponent_id)))
+        if record is None or user_id <= opponent_id:
+            return record
+        return record.flipped()
+
+    def _load(self, sport: str) -> Dict[Tuple[int, int], PairRecord]:
+        pairs: Dict[Tuple[int, int], PairRecord] = {}
+        path = self._path(sport)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                payload = f.read()
+            # A crash mid-append can leave a partial record at the end
+            _add(pairs, payload[:len(payload) - len(payload) % RECORD.size])
+        for pending_sport, packed in self.pending:
+            if pending_sport == sport:
+                _add(pairs, packed)
+        return pairs
+
+
+def pack_match(winner_ids: Sequence[int], loser_ids: Sequence[int], timestamp: float,
+               score: Optional[str] = None, ref: int = NO_REF) -> bytes:
+    """Records for every winner/loser pairing of one match"""
+    winner_score, loser_score = parse_score(score)
+    return b"".join(
+        RECORD.pack(winner, loser, timestamp, ref, winner_score, loser_score)
+        for winner in winner_ids for loser in loser_ids
+        if _is_id(winner) and _is_id(loser) and winner != loser
+    )
+
+
+def build_records(archives: Iterable[MatchArchive], leagues: Iterable[Tuple[Dict, Dict]]) -> Dict[str, bytes]:
+    """Per-sport record files for casual matches (archives oldest first) and league results.
+
+    League results are interleaved with casual matches by completion time.
+    """
+    by_sport: Dict[str, List[Tuple[float, bytes]]] = {}
+
+    for archive in archives:
+        timestamps = archive.columns["timestamp"]
+        for index in range(len(archive)):
+            match = archive[index]
+            if not isinstance(match.get("sport"), str):
+                continue
+            # Untimed matches predate timestamps, so they go first
+            timestamp = -math.inf if math.isnan(timestamps[index]) else timestamps[index]
+            packed = pack_match(match.get("winner_ids", []), match.get("loser_ids", []), timestamp,
+                                match.get("score"), archive.base + index)
+            if packed:
+                by_sport.setdefault(match["sport"], []).append((timestamp, packed))
+
+    for league, weeks in leagues:
+        sport = league.get("sport")
+        if not isinstance(sport, str):
+            continue
+        for week_matches in weeks.values():
+            for match in week_matches:
+                result = league_result(match)
+                if not result:
+                    continue
+                try:
+                    timestamp = datetime.fromisoformat(match["completed_date"]).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    timestamp = -math.inf
+                score = str(match.get("result", "")).partition("_")[2]
+                packed = pack_match(result[0], result[1], timestamp, score)
+                if packed:
+                    by_sport.setdefault(sport, []).append((timestamp, packed))
+
+    # Sorting on the timestamp alone keeps the original order among equal ones
+    return {
+        sport: b"".join(packed for _, packed in sorted(entries, key=lambda entry: entry[0]))
+        for sport, entries in by_sport.items()
+    }
+
+
+def _add(pairs: Dict[Tuple[int, int], PairRecord], payload: bytes):
+    for winner, loser, timestamp, ref, winner_score, loser_score in RECORD.iter_unpack(payload):
+        low, high = min(winner, loser), max(winner, loser)
+        record = pairs.get((low, high))
+        if record is None:
+            record = pairs[(low, high)] = PairRecord()
+        record.add(Meeting(timestamp, winner == low, winner_score, loser_score, ref))
+
+
+def _is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
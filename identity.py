@@ -0,0 +1,213 @@
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import aiohttp
+import discord
+
+
+# Failures that say nothing about the user; the lookup is simply tried again next time
+TRANSIENT_ERRORS = (discord.HTTPException, discord.RateLimited, aiohttp.ClientError, OSError, asyncio.TimeoutError)
+
+
+class Identity(NamedTuple):
+    """What the bot needs to render a user: a name to show and a mention to ping"""
+    display_name: str
+    mention: str
+
+
+def unknown_identity(user_id: int) -> Identity:
+    return Identity(f"Unknown User ({user_id})", f"<@{user_id}>")
+
+
+class IdentityCache:
+    """Display names per (guild, user) with a TTL and LRU eviction.
+
+    resolve() checks the cache, then the prefetched member index and the gateway
+    member cache (both free), and only then falls back to REST. Nicknames are
+    per guild, so the same user can have a different entry in each guild (or
+    None for no guild).
+
+    Member and user update events keep entries current (update_member,
+    remove_member, update_user), so the TTL only has to catch missed events.
+    Users that can't be found are cached too, for the shorter negative_ttl.
+    """
+
+    def __init__(self, client: discord.Client, ttl: float = 21600.0, capacity: int = 5000,
+                 concurrency: int = 8, max_retries: int = 3, negative_ttl: float = 3600.0):
+        self.client = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.capacity = capacity
+        self.max_retries = max_retries
+        # Caps REST lookups in flight at once, however many renders want names
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # Lookups in progress, so concurrent requests for the same user share one fetch
+        self.in_flight: Dict[Tuple[Optional[int], int], asyncio.Future] = {}
+        self.entries: "OrderedDict[Tuple[Optional[int], int], Tuple[float, Identity]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.gateway_hits = 0
+        self.rest_calls = 0
+        self.retries = 0
+        # guild id -> {user id: display name}, built from a full member chunk
+        self.member_index: Dict[int, Dict[int, str]] = {}
+        self.index_stats: Dict[int, Dict] = {}
+
+    def get(self, user_id: int, guild: Optional[discord.Guild] = None) -> Optional[Identity]:
+        """Cached identity if present and fresh"""
+        key = (guild.id if guild else None, user_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, identity = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return identity
+
+    def put(self, user_id: int, guild: Optional[discord.Guild], identity: Identity, ttl: Optional[float] = None):
+        key = (guild.id if guild else None, user_id)
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), identity)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    async def resolve(self, user_id: int, guild: Optional[discord.Guild] = None) -> Identity:
+        """Display name and mention for a user; never raises, unknown users get a placeholder"""
+        identity = self.get(user_id, guild)
+        if identity is not None:
+            self.hits += 1
+            if identity == unknown_identity(user_id):
+                self.negative_hits += 1
+            return identity
+        index = self.member_index.get(guild.id) if guild else None
+        if index is not None and user_id in index:
+            # Served without touching the LRU: the index already holds every member
+            self.hits += 1
+            return Identity(index[user_id], f"<@{user_id}>")
+        self.misses += 1
+
+        member = guild.get_member(user_id) if guild else None
+        if member is not None:
+            self.gateway_hits += 1
+            identity = Identity(member.display_name, member.mention)
+            self.put(user_id, guild, identity)
+            return identity
+
+        key = (guild.id if guild else None, user_id)
+        if key not in self.in_flight:
+            self.in_flight[key] = asyncio.ensure_future(self._fetch(user_id, guild))
+            self.in_flight[key].add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded so one caller timing out doesn't cancel the fetch for the others
+        identity = await asyncio.shield(self.in_flight[key])
+        return identity if identity is not None else unknown_identity(user_id)
+
+    async def resolve_many(self, user_ids: Iterable[int], guild: Optional[discord.Guild] = None) -> Dict[int, Identity]:
+        """Resolve a batch of users concurrently; returns user id -> Identity for every distinct id"""
+        unique = list(dict.fromkeys(user_id for user_id in user_ids if user_id is not None))
+        resolved = await asyncio.gather(*(self.resolve(user_id, guild) for user_id in unique))
+        return dict(zip(unique, resolved))
+
+    async def _fetch(self, user_id: int, guild: Optional[discord.Guild]) -> Optional[Identity]:
+        identity = None
+        if guild:
+            # The member carries the server nickname; only non-members need fetch_user
+            try:
+                member = await self._rest(guild.fetch_member, user_id)
+                identity = Identity(member.display_name, member.mention)
+            except (discord.NotFound, discord.Forbidden):
+                # Not a member (or members can't be fetched): fall back to the account name
+                pass
+            except TRANSIENT_ERRORS:
+                return None
+
+        if identity is None:
+            user = self.client.get_user(user_id)
+            if user is None:
+                try:
+                    user = await self._rest(self.client.fetch_user, user_id)
+                except discord.NotFound:
+                    # Deleted or otherwise unknown; remember that instead of asking again every render
+                    self.put(user_id, guild, unknown_identity(user_id), ttl=self.negative_ttl)
+                    return None
+                except TRANSIENT_ERRORS:
+                    return None
+            identity = Identity(user.display_name, user.mention)
+
+        self.put(user_id, guild, identity)
+        return identity
+
+    async def _rest(self, call: Callable[[int], Awaitable], user_id: int):
+        """Make a REST call under the concurrency cap, retrying when rate limited"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    self.rest_calls += 1
+                    return await call(user_id)
+            except discord.RateLimited as e:
+                # Raised instead of sleeping when the limit outlasts discord.py's own wait
+                if attempt == self.max_retries:
+                    raise
+                delay = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == self.max_retries:
+                    raise
+                delay = 0.5 * 2 ** attempt
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def update_member(self, member: discord.Member):
+        """A member joined or changed their nickname/name: store the new name right away"""
+        index = self.member_index.get(member.guild.id)
+        if index is not None:
+            index[member.id] = member.display_name
+        self.put(member.id, member.guild, Identity(member.display_name, member.mention))
+
+    def remove_member(self, member: discord.Member):
+        """A member left: drop them from the index and fall back to their account name"""
+        index = self.member_index.get(member.guild.id)
+        if index is not None:
+            index.pop(member.id, None)
+        # What a REST lookup would now return, without the two failed-then-fallback calls
+        self.put(member.id, member.guild, Identity(member.global_name or member.name, member.mention))
+
+    def update_user(self, user: discord.User):
+        """A user changed their account name: forget every cached name for them"""
+        for key in [key for key in self.entries if key[1] == user.id]:
+            del self.entries[key]
+        self.put(user.id, None, Identity(user.display_name, user.mention))
+
+    async def prefetch_guild(self, guild: discord.Guild) -> Dict:
+        """Request the full member list over the gateway and index every display name"""
+        started = time.perf_counter()
+        members = await guild.chunk(cache=True)
+        index = {member.id: member.display_name for member in members}
+        seconds = time.perf_counter() - started
+
+        self.member_index[guild.id] = index
+        stats = {
+            "members": len(index),
+            "seconds": round(seconds, 2),
+            "kilobytes": round((sys.getsizeof(index) + sum(sys.getsizeof(name) for name in index.values())) / 1024, 1)
+        }
+        self.index_stats[guild.id] = stats
+        return stats
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+            "negative_hits": self.negative_hits,
+            "gateway_hits": self.gateway_hits,
+            "rest_calls": self.rest_calls,
+            "retries": self.retries,
+            "indexed_members": sum(len(index) for index in self.member_index.values())
+        }
@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, List, Tuple
+
+
+# Keep sections JSON-friendly: pair keys are "low:high" and bye keys are user ids as strings
+SECTIONS = ("opponents", "teammates", "byes")
+# Matches that count as two players having faced each other
+FACED_STATUSES = ("completed", "forfeited", "scheduled")
+
+
+def empty_history() -> Dict:
+    """Counters for a league with no weeks generated yet"""
+    return {"opponents": {}, "teammates": {}, "byes": {}, "weeks": {}}
+
+
+def pair_key(a: int, b: int) -> str:
+    return f"{min(a, b)}:{max(a, b)}"
+
+
+def match_entries(match: Dict) -> List[Tuple[str, str]]:
+    """(section, key) counters one league match adds to, one entry per count"""
+    entries = []
+    if match.get("status") in FACED_STATUSES:
+        # 1v1 opponents
+        if match.get("player2") is not None and "player1" in match:
+            entries.append(("opponents", pair_key(match["player1"], match["player2"])))
+        # 2v2: every individual against every individual on the other team
+        if match.get("team1") and match.get("team2"):
+            entries += [("opponents", pair_key(a, b)) for a in match["team1"] for b in match["team2"]]
+    if match.get("status") == "bye":
+        if match.get("player2") is None and match.get("player1") is not None:
+            entries.append(("byes", str(match["player1"])))
+        if match.get("team1") and not match.get("team2"):
+            entries += [("byes", str(pid)) for pid in match["team1"]]
+    for side in ("team1", "team2"):
+        team = match.get(side)
+        if team and len(team) == 2:
+            entries.append(("teammates", pair_key(team[0], team[1])))
+    return entries
+
+
+def count_changes(history: Dict, removed: Iterable[Dict], added: Iterable[Dict]) -> Dict[Tuple[str, str], int]:
+    """New values of the counters that change when `removed` matches are replaced by `added` ones"""
+    deltas: Dict[Tuple[str, str], int] = {}
+    for sign, matches in ((-1, removed), (1, added)):
+        for match in matches:
+            for entry in match_entries(match):
+                deltas[entry] = deltas.get(entry, 0) + sign
+    return {
+        (section, key): history[section].get(key, 0) + delta
+        for (section, key), delta in deltas.items() if delta
+    }
+
+
+def build_history(weeks: Dict) -> Dict:
+    """Counters for a league from scratch, by walking every generated week"""
+    history = empty_history()
+    for week, matches in weeks.items():
+        count_matches(history, matches)
+        history["weeks"][str(week)] = len(matches)
+    return history
+
+
+def count_matches(history: Dict, matches: Iterable[Dict]):
+    """Add matches to the counters in place"""
+    for match in matches:
+        for section, key in match_entries(match):
+            history[section][key] = history[section].get(key, 0) + 1
+
+
+def is_current(history, weeks: Dict) -> bool:
+    """Whether stored counters cover exactly the weeks (and matches per week) the league has"""
+    if not isinstance(history, dict) or any(not isinstance(history.get(section), dict) for section in SECTIONS):
+        return False
+    counted = history.get("weeks")
+    return isinstance(counted, dict) and counted == {str(week): len(matches) for week, matches in weeks.items()}
+
+
+def pair_counts(counts: Dict[str, int]) -> Dict[tuple, int]:
+    """Stored "low:high" counters as the (low, high) tuple dicts the pairing code takes"""
+    return {tuple(int(part) for part in key.split(":")): count for key, count in counts.items()}
+
+
+def user_counts(counts: Dict[str, int]) -> Dict[int, int]:
+    return {int(key): count for key, count in counts.items()}
@@ -0,0 +1,336 @@
+import math
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+# Fixed-width typecodes only, so binary columns read back the same on every platform
+COLUMNS = {
+    "sport": "H",           # index into sport_names
+    "timestamp": "d",       # unix time, NaN for matches recorded before timestamps existed
+    "reported_by": "q",
+    "winner_count": "H",    # the first winner_count ids of the match's players are the winners
+    "player_offset": "Q",   # players[player_offset[i]:player_offset[i + 1]] belong to match i
+    "players": "q",
+    "winner_score": "i",
+    "loser_score": "i",
+}
+
+SCORE_PATTERN = re.compile(r"^\s*(\d+)\s*-\s*(\d+)\s*$")
+# Scores are stored as int32; anything larger is kept as text in the match's override
+MAX_SCORE = 2 ** 31 - 1
+MAX_WINNERS = 2 ** 16 - 1
+MATCH_FIELDS = ("sport", "winner_ids", "loser_ids", "score", "reported_by", "timestamp")
+
+
+class MatchArchive:
+    """Casual match history stored as parallel typed arrays instead of a list of dicts.
+
+    Behaves like the list it replaces: append() takes the same match dicts and
+    indexing or iterating rebuilds them. Anything the columns can't represent
+    exactly (a score written as "21 - 15", string ids, extra keys) is kept in
+    a small per-match override so nothing is lost.
+
+    `base` counts the matches trimmed off the front into cold storage, so
+    base + index is a match's position in the full history.
+
+    `user_index` maps each player to the ascending indices of their matches.
+    It is kept up to date by append() and trimming and rebuilt on load, so
+    per-player lookups cost the player's own match count, not the archive's.
+    """
+
+    def __init__(self):
+        self.base = 0
+        self.sport_names: List[str] = []
+        self.sport_ids: Dict[str, int] = {}
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self.columns["player_offset"].append(0)
+        self.overrides: Dict[int, Dict] = {}
+        self.user_index: Dict[Hashable, array] = {}
+
+    @classmethod
+    def load(cls, stored) -> "MatchArchive":
+        """Build an archive from a snapshot's matches: the column layout or the old list of dicts"""
+        if isinstance(stored, cls):
+            return stored
+        if isinstance(stored, dict):
+            return cls.from_columns(stored)
+        archive = cls()
+        for match in stored:
+            archive.append(match)
+        return archive
+
+    def _sport_id(self, sport: str) -> int:
+        if sport not in self.sport_ids:
+            self.sport_ids[sport] = len(self.sport_names)
+            self.sport_names.append(sport)
+        return self.sport_ids[sport]
+
+    def append(self, match: Dict):
+        index = len(self)
+        override = {key: value for key, value in match.items() if key not in MATCH_FIELDS}
+
+        # Every column value is worked out first, so a value the columns can't hold
+        # never leaves them with different lengths
+        sport = match.get("sport")
+        if not isinstance(sport, str):
+            override["sport"] = sport
+            sport = ""
+
+        timestamp = match.get("timestamp")
+        timestamp_value = float(timestamp) if isinstance(timestamp, (int, float)) else math.nan
+        if "timestamp" in match and not isinstance(timestamp, float):
+            override["timestamp"] = timestamp
+
+        reported_by = match.get("reported_by")
+        if not _is_id(reported_by):
+            override["reported_by"] = reported_by
+            reported_by = 0
+
+        winner_ids, loser_ids = match.get("winner_ids", []), match.get("loser_ids", [])
+        players = [*winner_ids, *loser_ids]
+        if all(_is_id(uid) for uid in players) and len(winner_ids) <= MAX_WINNERS:
+            winner_count = len(winner_ids)
+        else:
+            override["winner_ids"], override["loser_ids"] = winner_ids, loser_ids
+            players, winner_count = [], 0
+
+        score = match.get("score")
+        winner_score, loser_score = parse_score(score)
+        if winner_score < 0 or score != f"{winner_score}-{loser_score}":
+            override["score"] = score
+
+        columns = self.columns
+        columns["sport"].append(self._sport_id(sport))
+        columns["timestamp"].append(timestamp_value)
+        columns["reported_by"].append(reported_by)
+        columns["players"].extend(players)
+        columns["winner_count"].append(winner_count)
+        columns["player_offset"].append(len(columns["players"]))
+        columns["winner_score"].append(winner_score)
+        columns["loser_score"].append(loser_score)
+
+        if override:
+            self.overrides[index] = override
+        self._index_match(index, (*winner_ids, *loser_ids))
+
+    def _index_match(self, index: int, player_ids):
+        for uid in player_ids:
+            indices = self.user_index.get(uid)
+            if indices is None:
+                indices = self.user_index[uid] = array("q")
+            # Someone listed twice in one match still played it once
+            if not indices or indices[-1] != index:
+                indices.append(index)
+
+    def rebuild_user_index(self):
+        """Recompute user_index from the columns and overrides"""
+        self.user_index = {}
+        players, offsets = self.columns["players"], self.columns["player_offset"]
+        overrides = self.overrides
+        for index in range(len(self)):
+            if index in overrides and "winner_ids" in overrides[index]:
+                self._index_match(index, (*overrides[index]["winner_ids"], *overrides[index]["loser_ids"]))
+            else:
+                self._index_match(index, players[offsets[index]:offsets[index + 1]])
+
+    def __delitem__(self, index):
+        # Only trimming the oldest matches is supported; that is what tiering needs
+        if not isinstance(index, slice) or index.start not in (None, 0) or index.step not in (None, 1):
+            raise TypeError("MatchArchive only supports deleting a leading slice, e.g. del archive[:n]")
+        count = min(len(self), max(0, len(self) if index.stop is None else index.stop))
+        rest = self.copy_range(count, len(self))
+        self.columns, self.overrides, self.user_index = rest.columns, rest.overrides, rest.user_index
+        self.base += count
+
+    def copy_range(self, start: int, end: int) -> "MatchArchive":
+        """New archive holding matches [start, end), sharing the interned sport names"""
+        archive = MatchArchive()
+        archive.base = self.base + start
+        archive.sport_names, archive.sport_ids = list(self.sport_names), dict(self.sport_ids)
+        offsets = self.columns["player_offset"]
+        first_player, last_player = offsets[start], offsets[end]
+        for name, column in self.columns.items():
+            if name == "players":
+                archive.columns[name] = column[first_player:last_player]
+            elif name == "player_offset":
+                archive.columns[name] = array(COLUMNS[name], (offset - first_player for offset in column[start:end + 1]))
+            else:
+                archive.columns[name] = column[start:end]
+        archive.overrides = {
+            index - start: override for index, override in self.overrides.items() if start <= index < end
+        }
+        for uid, indices in self.user_index.items():
+            first, last = bisect_left(indices, start), bisect_left(indices, end)
+            if first < last:
+                archive.user_index[uid] = array("q", (index - start for index in indices[first:last]))
+        return archive
+
+    def capture(self) -> Tuple:
+        """What a snapshot needs, taken without copying the columns.
+
+        Columns only grow at the end and trimming swaps in new arrays, so the
+        first `length` values of each captured column never change afterwards.
+        from_capture() turns the result back into an archive on another thread.
+        """
+        columns = {name: (column, len(column)) for name, column in self.columns.items()}
+        return self.base, list(self.sport_names), columns, dict(self.overrides)
+
+    @classmethod
+    def from_capture(cls, captured: Tuple) -> "MatchArchive":
+        """Archive for serializing a capture(); it has no user_index"""
+        archive = cls()
+        archive.base, archive.sport_names, columns, archive.overrides = captured
+        archive.columns = {name: column[:length] for name, (column, length) in columns.items()}
+        return archive
+
+    def count_older_than(self, cutoff: float) -> int:
+        """Length of the leading run of matches played before cutoff (untimed ones count as old)"""
+        count = 0
+        for timestamp in self.columns["timestamp"]:
+            if timestamp >= cutoff:
+                break
+            count += 1
+        return count
+
+    def __len__(self) -> int:
+        return len(self.columns["sport"])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("match index out of range")
+
+        columns = self.columns
+        start, end = columns["player_offset"][index], columns["player_offset"][index + 1]
+        split = start + columns["winner_count"][index]
+        match = {
+            "sport": self.sport_names[columns["sport"][index]],
+            "winner_ids": columns["players"][start:split].tolist(),
+            "loser_ids": columns["players"][split:end].tolist(),
+            "score": f"{columns['winner_score'][index]}-{columns['loser_score'][index]}",
+            "reported_by": columns["reported_by"][index],
+        }
+        timestamp = columns["timestamp"][index]
+        if not math.isnan(timestamp):
+            match["timestamp"] = timestamp
+        match.update(self.overrides.get(index, {}))
+        return match
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (MatchArchive, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def indices_for_user(self, user_id: int, newest_first: bool = True, before: Optional[int] = None) -> Iterator[int]:
+        """Indices of matches user_id played in, optionally only those below index `before`"""
+        indices = self.user_index.get(user_id)
+        if not indices:
+            return iter(())
+        end = len(indices) if before is None else bisect_left(indices, before)
+        if newest_first:
+            return (indices[i] for i in range(end - 1, -1, -1))
+        return (indices[i] for i in range(end))
+
+    def scan(self, sport: Optional[str] = None, user_id: Optional[int] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             newest_first: bool = False) -> Iterator[int]:
+        """Indices of matches passing every given filter, touching only the columns involved"""
+        if user_id is not None:
+            indices = self.indices_for_user(user_id, newest_first)
+        else:
+            indices = reversed(range(len(self))) if newest_first else iter(range(len(self)))
+
+        if sport is not None:
+            if sport not in self.sport_ids:
+                return iter(())
+            sport_id, sports = self.sport_ids[sport], self.columns["sport"]
+            indices = (i for i in indices if sports[i] == sport_id)
+        if since is not None or until is not None:
+            # NaN timestamps fail both comparisons, so untimed matches drop out of time filters
+            low = -math.inf if since is None else since
+            high = math.inf if until is None else until
+            timestamps = self.columns["timestamp"]
+            indices = (i for i in indices if low <= timestamps[i] < high)
+        return indices
+
+    def user_record(self, user_id: int, sport: Optional[str] = None) -> Tuple[int, int]:
+        """(wins, losses) of user_id, optionally in one sport"""
+        players, offsets, winner_counts = (
+            self.columns["players"], self.columns["player_offset"], self.columns["winner_count"]
+        )
+        wins = losses = 0
+        for index in self.scan(sport=sport, user_id=user_id):
+            if index in self.overrides and "winner_ids" in self.overrides[index]:
+                won = user_id in self.overrides[index]["winner_ids"]
+            else:
+                start = offsets[index]
+                won = user_id in players[start:start + winner_counts[index]]
+            if won:
+                wins += 1
+            else:
+                losses += 1
+        return wins, losses
+
+    def to_columns(self, binary: bool = False) -> Dict[str, Any]:
+        """Snapshot layout; binary formats get raw array bytes instead of number lists"""
+        return {
+            "format": "columns",
+            "byteorder": sys.byteorder,
+            "base": self.base,
+            "sport_names": list(self.sport_names),
+            "columns": {
+                name: (column.tobytes() if binary else column.tolist())
+                for name, column in self.columns.items()
+            },
+            # JSON object keys are strings
+            "overrides": {str(index): override for index, override in self.overrides.items()},
+        }
+
+    @classmethod
+    def from_columns(cls, stored: Dict) -> "MatchArchive":
+        archive = cls()
+        archive.base = stored.get("base", 0)
+        archive.sport_names = list(stored["sport_names"])
+        archive.sport_ids = {sport: index for index, sport in enumerate(archive.sport_names)}
+        for name, typecode in COLUMNS.items():
+            values = stored["columns"][name]
+            column = array(typecode)
+            if isinstance(values, (bytes, bytearray)):
+                column.frombytes(values)
+                if stored.get("byteorder", sys.byteorder) != sys.byteorder:
+                    column.byteswap()
+            else:
+                column.extend(values)
+            archive.columns[name] = column
+        archive.overrides = {int(index): override for index, override in stored.get("overrides", {}).items()}
+
+        if len({len(archive.columns[name]) for name in COLUMNS if name not in ("players", "player_offset")}) != 1 \
+                or len(archive.columns["player_offset"]) != len(archive) + 1:
+            raise ValueError("Match archive columns have mismatched lengths")
+        archive.rebuild_user_index()
+        return archive
+
+
+def parse_score(score) -> Tuple[int, int]:
+    """(winner score, loser score) of a "W-L" score, or (-1, -1) if it doesn't parse or fit in the columns"""
+    parsed = SCORE_PATTERN.match(score) if isinstance(score, str) else None
+    if not parsed:
+        return -1, -1
+    winner_score, loser_score = int(parsed.group(1)), int(parsed.group(2))
+    if winner_score > MAX_SCORE or loser_score > MAX_SCORE:
+        return -1, -1
+    return winner_score, loser_score
+
+
+def _is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63
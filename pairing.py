@@ -0,0 +1,584 @@
+import random
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+# Cost of pairing two players who already met once; added again for every further meeting.
+# Higher than any realistic rating gap term, so a fresh matchup always beats a rematch.
+REMATCH_PENALTY = 1000
+# Edges kept per player in the candidate graph: the nearest opponents they haven't met yet
+NEIGHBOURS = 8
+
+
+def choose_bye(players: Sequence[int], bye_history: Dict[int, int], rng: random.Random) -> int:
+    """The player with the fewest byes so far; ties are broken by rng"""
+    fewest = min(bye_history.get(p, 0) for p in players)
+    return rng.choice([p for p in players if bye_history.get(p, 0) == fewest])
+
+
+def pair_week(players: Sequence[int], match_history: Dict[tuple, int], bye_history: Dict[int, int],
+              ratings: Optional[Dict[int, float]] = None, elo_weight: float = 0.0,
+              seed: Optional[Union[int, str]] = None) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """One week of 1v1 pairings: (pairs, bye player or None).
+
+    With an odd number of players the bye goes to whoever has had the fewest
+    before the rest are paired by pair_players().
+    """
+    pool = list(players)
+    bye = None
+    if len(pool) % 2:
+        bye = choose_bye(pool, bye_history, random.Random(seed))
+        pool.remove(bye)
+    return pair_players(pool, match_history, ratings, elo_weight, seed), bye
+
+
+def round_robin(players: Sequence[int], weeks: int,
+                seed: Optional[Union[int, str]] = None) -> List[Tuple[List[Tuple[int, int]], Optional[int]]]:
+    """`weeks` rounds of a round robin: (pairs, bye player or None) for each week.
+
+    Circle method (Berger tables): the first seat stays put while the others
+    rotate one place a round. Over any n - 1 rounds (n players, rounded up
+    to even) everyone meets everyone else once and, with an odd number of
+    players, sits out once; a longer season starts the cycle over. Players
+    are seated in a seeded shuffle.
+    """
+    order: List[Optional[int]] = list(players)
+    random.Random(seed).shuffle(order)
+    if len(order) % 2:
+        # The fixed seat is the bye, so it rotates through everyone
+        order.insert(0, None)
+    count = len(order)
+    rounds = []
+    for week in range(weeks):
+        shift = week % (count - 1)
+        seats = [order[0]] + [order[1 + (seat + shift) % (count - 1)] for seat in range(count - 1)]
+        pairs, bye = [], None
+        for seat in range(count // 2):
+            a, b = seats[seat], seats[count - 1 - seat]
+            if a is None or b is None:
+                bye = b if a is None else a
+            else:
+                pairs.append((a, b))
+        rounds.append((pairs, bye))
+    return rounds
+
+
+def pair_week_2v2(players: Sequence[int], match_history: Dict[tuple, int], bye_history: Dict[int, int],
+                  teammate_history: Dict[tuple, int], ratings: Optional[Dict[int, float]] = None,
+                  elo_weight: float = 0.0, seed: Optional[Union[int, str]] = None
+                  ) -> Tuple[List[Tuple[Tuple[int, int], Tuple[int, int]]], Optional[int], Optional[Tuple[int, int]]]:
+    """One week of 2v2 matches: (team pairs, bye player or None, bye team or None).
+
+    With an odd number of players one sits out. Teams are formed by
+    pair_players() with each player's load (opponent plus teammate counts so
+    far) standing in for the rating, so a pair costs REMATCH_PENALTY per time
+    they have teamed up before plus one per point of load gap. With an odd
+    number of teams, the team with the fewest byes between them sits out.
+    The rest are paired by pair_players() again, a rematch counting once for
+    every two players who have faced each other before, and ratings (team
+    averages) weighted by elo_weight as in 1v1.
+    """
+    rng = random.Random(seed)
+    pool = list(players)
+    bye = None
+    if len(pool) % 2:
+        bye = choose_bye(pool, bye_history, rng)
+        pool.remove(bye)
+
+    # Every player's load in one pass over the histories
+    load = {p: 0 for p in pool}
+    for history in (match_history, teammate_history):
+        for (a, b), count in history.items():
+            if a in load:
+                load[a] += count
+            if b in load:
+                load[b] += count
+    teams = pair_players(pool, teammate_history, load, 1.0, seed)
+
+    bye_team = None
+    if len(teams) % 2:
+        fewest = min(bye_history.get(a, 0) + bye_history.get(b, 0) for a, b in teams)
+        bye_team = rng.choice([t for t in teams if bye_history.get(t[0], 0) + bye_history.get(t[1], 0) == fewest])
+        teams.remove(bye_team)
+
+    # Opponent history between teams, summed over their members
+    team_of = {p: index for index, team in enumerate(teams) for p in team}
+    team_history: Dict[tuple, int] = {}
+    for (a, b), count in match_history.items():
+        ta, tb = team_of.get(a), team_of.get(b)
+        if ta is not None and tb is not None and ta != tb:
+            key = (min(ta, tb), max(ta, tb))
+            team_history[key] = team_history.get(key, 0) + count
+    team_ratings = None
+    if ratings is not None:
+        team_ratings = {index: (ratings.get(a, 1000) + ratings.get(b, 1000)) / 2 for index, (a, b) in enumerate(teams)}
+    fixtures = pair_players(list(range(len(teams))), team_history, team_ratings, elo_weight, seed)
+    return [(teams[a], teams[b]) for a, b in fixtures], bye, bye_team
+
+
+def pair_players(players: Sequence[int], match_history: Dict[tuple, int],
+                 ratings: Optional[Dict[int, float]] = None, elo_weight: float = 0.0,
+                 seed: Optional[Union[int, str]] = None, neighbours: int = NEIGHBOURS) -> List[Tuple[int, int]]:
+    """Pair an even number of players at the lowest total cost.
+
+    A pair costs REMATCH_PENALTY per previous meeting plus elo_weight per
+    point of rating gap. Rather than every possible pair, each player only
+    gets edges to the `neighbours` nearest opponents (by rating, or in a
+    seeded shuffle without ratings) they haven't met yet, plus any rematches
+    passed on the way. A minimum-cost perfect matching is found on that
+    sparse graph with Edmonds' blossom algorithm; anyone it can't pair is
+    matched again against all the other leftovers. The same inputs and seed
+    always give the same pairs.
+    """
+    if len(players) % 2:
+        raise ValueError("pair_players needs an even number of players")
+    rng = random.Random(seed)
+    order = list(players)
+    rng.shuffle(order)
+    use_ratings = ratings is not None and elo_weight > 0
+    if use_ratings:
+        # Stable sort, so the shuffle breaks rating ties
+        order.sort(key=lambda p: ratings.get(p, 1000))
+    rating = [ratings.get(p, 1000) if use_ratings else 0 for p in order]
+
+    position = {p: i for i, p in enumerate(order)}
+    met: List[Dict[int, int]] = [{} for _ in order]
+    for (a, b), count in match_history.items():
+        if count and a in position and b in position:
+            met[position[a]][position[b]] = met[position[b]][position[a]] = count
+
+    def cost(i: int, j: int) -> int:
+        return REMATCH_PENALTY * met[i].get(j, 0) + round(elo_weight * abs(rating[i] - rating[j]))
+
+    count = len(order)
+    edges = set()
+    for i in range(count):
+        fresh = 0
+        left, right = i - 1, i + 1
+        while fresh < neighbours and (left >= 0 or right < count):
+            # Walk outwards, always to the nearer side in rating, then in order
+            if right >= count or (left >= 0 and
+                                  (rating[i] - rating[left], i - left) <= (rating[right] - rating[i], right - i)):
+                j, left = left, left - 1
+            else:
+                j, right = right, right + 1
+            edges.add((min(i, j), max(i, j)))
+            if j not in met[i]:
+                fresh += 1
+
+    mate = _min_cost_matching(count, sorted(edges), cost)
+    leftover = [i for i in range(count) if mate[i] == -1]
+    if leftover:
+        # The sparse graph had no perfect matching; finish with every pair among the rest
+        dense = [(leftover[a], leftover[b]) for a in range(len(leftover)) for b in range(a + 1, len(leftover))]
+        for i, j in enumerate(_min_cost_matching(count, dense, cost)):
+            if j != -1:
+                mate[i] = j
+
+    return [(order[i], order[mate[i]]) for i in range(count) if i < mate[i]]
+
+
+def _min_cost_matching(vertices: int, edges: List[Tuple[int, int]], cost) -> List[int]:
+    """Maximum-cardinality matching, of least total cost if it is perfect; mate[v] is v's partner or -1"""
+    if not edges:
+        return [-1] * vertices
+    costs = [cost(i, j) for i, j in edges]
+    # Flip costs into positive weights; among maximum matchings the heaviest is then the cheapest
+    top = max(costs) + 1
+    return max_weight_matching(vertices, [(i, j, top - c) for (i, j), c in zip(edges, costs)],
+                               max_cardinality=True, greedy_start=True)
+
+
+def max_weight_matching(vertices: int, edges: List[Tuple[int, int, int]],
+                        max_cardinality: bool = False, greedy_start: bool = False) -> List[int]:
+    """Edmonds' blossom algorithm for a maximum-weight matching in a general graph.
+
+    edges are (i, j, weight) with integer weights and 0 <= i, j < vertices.
+    Returns mate, where mate[v] is the vertex matched to v or -1. With
+    max_cardinality the result is the heaviest of the maximum-cardinality
+    matchings. Primal-dual method in O(n^3), following Galil, "Efficient
+    algorithms for finding maximum matching in graphs" (1986); dual values
+    are stored doubled so integer weights never need fractions.
+
+    greedy_start (with max_cardinality) first shifts the weights by vertex
+    potentials so that every vertex has an edge of the top weight, then
+    matches such edges greedily, which skips most of the stages. Shifting
+    changes every perfect matching's weight by the same amount, so the
+    result is the heaviest if the graph has a perfect matching; otherwise it
+    is still of maximum cardinality.
+    """
+    edge_count = len(edges)
+    nvertex = vertices
+    if not edge_count:
+        return [-1] * nvertex
+    if max_cardinality and greedy_start:
+        edges = _reweight(nvertex, edges)
+    max_weight = max(0, max(w for _, _, w in edges))
+
+    # Endpoint p of edge k = p // 2 is vertex endpoint[p]; p ^ 1 is the other end
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * edge_count)]
+    neighbend: List[List[int]] = [[] for _ in range(nvertex)]
+    for k, (i, j, _) in enumerate(edges):
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+
+    # mate[v]: remote endpoint of v's matched edge, -1 if single
+    mate = [-1] * nvertex
+    # Top-level blossom labels: 0 free, 1 S (outer), 2 T (inner); bit 4 marks scanBlossom's walk
+    label = [0] * (2 * nvertex)
+    labelend = [-1] * (2 * nvertex)
+    inblossom = list(range(nvertex))
+    blossomparent = [-1] * (2 * nvertex)
+    blossomchilds: List[Optional[List[int]]] = [None] * (2 * nvertex)
+    blossombase = list(range(nvertex)) + [-1] * nvertex
+    blossomendps: List[Optional[List[int]]] = [None] * (2 * nvertex)
+    bestedge = [-1] * (2 * nvertex)
+    blossombestedges: List[Optional[List[int]]] = [None] * (2 * nvertex)
+    unusedblossoms = list(range(nvertex, 2 * nvertex))
+    dualvar = [max_weight] * nvertex + [0] * nvertex
+    allowedge = [False] * edge_count
+    queue: List[int] = []
+
+    if max_cardinality and greedy_start:
+        # After reweighting every vertex has a tight edge; match as many of them as possible up front
+        for v in range(nvertex):
+            for p in neighbend[v]:
+                w = endpoint[p]
+                if mate[v] == -1 and mate[w] == -1 and edges[p // 2][2] == max_weight:
+                    mate[v], mate[w] = p, p ^ 1
+
+    double_weight = [2 * w for _, _, w in edges]
+
+    def slack(k: int) -> int:
+        i, j, _ = edges[k]
+        return dualvar[i] + dualvar[j] - double_weight[k]
+
+    def blossom_leaves(b: int):
+        if b < nvertex:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                if t < nvertex:
+                    yield t
+                else:
+                    yield from blossom_leaves(t)
+
+    def assign_label(w: int, t: int, p: int):
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossom_leaves(b))
+        else:
+            # The base of a T-blossom is matched; its mate becomes an S-vertex
+            base = blossombase[b]
+            assign_label(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scan_blossom(v: int, w: int) -> int:
+        """Trace back from v and w; the base of a new blossom, or -1 for an augmenting path"""
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base: int, k: int):
+        v, w, _ = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in blossom_leaves(b):
+            if label[inblossom[v]] == 2:
+                # Former T-vertices become S-vertices inside the blossom
+                queue.append(v)
+            inblossom[v] = b
+
+        # Least-slack edge from the new blossom to each neighbouring S-blossom
+        bestedgeto: Dict[int, int] = {}
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbend[v]] for v in blossom_leaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for k in nblist:
+                    i, j, _ = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if bj != b and label[bj] == 1 and (bj not in bestedgeto or slack(k) < slack(bestedgeto[bj])):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = list(bestedgeto.values())
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expand_blossom(b: int, endstage: bool):
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expand_blossom(s, endstage)
+            else:
+                for v in blossom_leaves(s):
+                    inblossom[v] = s
+
+        if not endstage and label[b] == 2:
+            # Relabel the children along the even path from the entry child to the base
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep, endptrick = 1, 0
+            else:
+                jstep, endptrick = -1, 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[blossomendps[b][j - endptrick] ^ endptrick ^ 1]] = 0
+                assign_label(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in blossom_leaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assign_label(v, 2, labelend[v])
+                j += jstep
+
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augment_blossom(b: int, v: int):
+        """Swap matched and unmatched edges inside blossom b so that v becomes its base"""
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            augment_blossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep, endptrick = 1, 0
+        else:
+            jstep, endptrick = -1, 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                augment_blossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augment_matching(k: int):
+        v, w, _ = edges[k]
+        for s, p in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    augment_blossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # Each stage grows alternating trees from every single vertex until one augmenting path is found
+    for _ in range(nvertex):
+        label[:] = [0] * (2 * nvertex)
+        bestedge[:] = [-1] * (2 * nvertex)
+        blossombestedges[nvertex:] = [None] * nvertex
+        allowedge[:] = [False] * edge_count
+        queue[:] = []
+        for v in range(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assign_label(v, 1, -1)
+
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = dualvar[v] + dualvar[w] - double_weight[k]
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assign_label(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scan_blossom(v, w)
+                            if base >= 0:
+                                add_blossom(base, k)
+                            else:
+                                augment_matching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+            if augmented:
+                break
+
+            # No tight edge left to follow: change the duals by the largest safe amount
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+            if not max_cardinality:
+                deltatype = 1
+                delta = min(dualvar[:nvertex])
+            for v in range(nvertex):
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = slack(bestedge[v])
+                    if deltatype == -1 or d < delta:
+                        delta, deltatype, deltaedge = d, 2, bestedge[v]
+            for b in range(2 * nvertex):
+                if blossomparent[b] == -1 and label[b] == 1 and bestedge[b] != -1:
+                    d = slack(bestedge[b]) // 2
+                    if deltatype == -1 or d < delta:
+                        delta, deltatype, deltaedge = d, 3, bestedge[b]
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1 and label[b] == 2 and \
+                        (deltatype == -1 or dualvar[b] < delta):
+                    delta, deltatype, deltablossom = dualvar[b], 4, b
+            if deltatype == -1:
+                # Only reachable with max_cardinality: nothing more can be matched
+                deltatype = 1
+                delta = max(0, min(dualvar[:nvertex]))
+
+            for v in range(nvertex):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                i, j, _ = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                i, j, _ = edges[deltaedge]
+                queue.append(i)
+            else:
+                expand_blossom(deltablossom, False)
+
+        if not augmented:
+            break
+        # S-blossoms whose dual dropped to zero are dissolved between stages
+        for b in range(nvertex, 2 * nvertex):
+            if blossomparent[b] == -1 and blossombase[b] >= 0 and label[b] == 1 and dualvar[b] == 0:
+                expand_blossom(b, True)
+
+    return [endpoint[p] if p >= 0 else -1 for p in mate]
+
+
+def _reweight(nvertex: int, edges: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """Edges with potentials y subtracted, w - y[i] - y[j] <= 0, and a zero edge at every vertex"""
+    adjacent: List[List[Tuple[int, int]]] = [[] for _ in range(nvertex)]
+    for i, j, w in edges:
+        adjacent[i].append((j, w))
+        adjacent[j].append((i, w))
+    potential = [max((w for _, w in neighbours), default=0) for neighbours in adjacent]
+    # Lower each potential in turn until one of its edges is tight
+    for v, neighbours in enumerate(adjacent):
+        if neighbours:
+            potential[v] -= min(potential[v] + potential[u] - w for u, w in neighbours)
+    return [(i, j, w - potential[i] - potential[j]) for i, j, w in edges]
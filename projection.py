@@ -0,0 +1,130 @@
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from pairing import pair_week, pair_week_2v2
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# (side a player ids, side b player ids) of one match still to be played
+Fixture = Tuple[Sequence[int], Sequence[int]]
+
+WIN_POINTS = 3
+
+
+class SeasonProjection(NamedTuple):
+    """Share of simulated seasons in which each player finished first / in the top N"""
+    trials: int
+    title: Dict[int, float]
+    top: Dict[int, float]
+    expected_points: Dict[int, float]
+    seconds: float
+
+
+def project_schedule(participants: List[int], weeks: int, team_size: int, match_history: Dict[tuple, int],
+                     bye_history: Dict[int, int], teammate_history: Dict[tuple, int],
+                     ratings: Optional[Dict[int, float]] = None, elo_weight: float = 0.0,
+                     seeds: Optional[Sequence[Union[int, str]]] = None) -> List[Fixture]:
+    """Fixtures for the weeks not generated yet, following the league's pairing rules.
+
+    Pairings only depend on who has met, teamed up and sat out before (and on
+    current ratings), never on results, so the rest of the season is the same
+    in every simulated trial and can be worked out once, with the league's
+    own pairing engine and one seed per week. The history dicts are updated
+    as weeks are added.
+    """
+    fixtures: List[Fixture] = []
+    for week in range(weeks):
+        seed = seeds[week] if seeds is not None else week
+        if team_size == 2:
+            pairs, bye_player, bye_team = pair_week_2v2(participants, match_history, bye_history, teammate_history,
+                                                        ratings, elo_weight, seed)
+            teams = [team for pair in pairs for team in pair]
+            sitting_out = [] if bye_player is None else [bye_player]
+            if bye_team is not None:
+                teams.append(bye_team)
+                sitting_out += bye_team
+            for team in teams:
+                _count(teammate_history, team[0], team[1])
+            for p in sitting_out:
+                bye_history[p] = bye_history.get(p, 0) + 1
+            week_fixtures = [(list(a), list(b)) for a, b in pairs]
+        else:
+            pairs, bye_player = pair_week(participants, match_history, bye_history, ratings, elo_weight, seed)
+            if bye_player is not None:
+                bye_history[bye_player] = bye_history.get(bye_player, 0) + 1
+            week_fixtures = [([a], [b]) for a, b in pairs]
+
+        for side_a, side_b in week_fixtures:
+            for a in side_a:
+                for b in side_b:
+                    _count(match_history, a, b)
+        fixtures += week_fixtures
+    return fixtures
+
+
+def _count(history: Dict[tuple, int], a: int, b: int):
+    pair = tuple(sorted([a, b]))
+    history[pair] = history.get(pair, 0) + 1
+
+
+def project_season(participants: List[int], standings: Dict[int, Tuple[int, int]], ratings: Dict[int, float],
+                   fixtures: List[Fixture], trials: int = 10000, top_n: int = 3, time_budget: float = 2.0,
+                   chunk: int = 1000, seed: Optional[int] = None) -> SeasonProjection:
+    """Play the remaining fixtures `trials` times and tally where everyone finishes.
+
+    Each match is won by side a with the Elo expected score of the two sides'
+    average ratings. Trials run in chunks, each one a single array operation;
+    simulation stops early once time_budget seconds have passed. Final order
+    is points, then wins, then current rating, like /league_standings.
+    """
+    if np is None:
+        raise RuntimeError("League projections need the numpy package: pip install numpy")
+
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    index = {user_id: i for i, user_id in enumerate(participants)}
+    players = len(participants)
+
+    side_a = np.zeros((len(fixtures), players))
+    side_b = np.zeros((len(fixtures), players))
+    for match, (a, b) in enumerate(fixtures):
+        side_a[match, [index[p] for p in a]] = 1
+        side_b[match, [index[p] for p in b]] = 1
+    rating = np.array([ratings.get(p, 1000) for p in participants], dtype=float)
+    rating_a = side_a @ rating / np.maximum(side_a.sum(axis=1), 1)
+    rating_b = side_b @ rating / np.maximum(side_b.sum(axis=1), 1)
+    win_chance = 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+    base_points = np.array([standings.get(p, (0, 0))[0] for p in participants], dtype=float)
+    base_wins = np.array([standings.get(p, (0, 0))[1] for p in participants], dtype=float)
+    # Rating order breaks ties in points and wins; scaled below one win
+    tiebreak = np.argsort(np.argsort(rating)) / max(players, 1)
+
+    top_n = min(top_n, players)
+    title_counts = np.zeros(players)
+    top_counts = np.zeros(players)
+    points_total = np.zeros(players)
+    done = 0
+    while done < trials and (done == 0 or time.perf_counter() - started < time_budget):
+        size = min(chunk, trials - done)
+        a_won = rng.random((size, len(fixtures))) < win_chance
+        wins = a_won @ side_a + ~a_won @ side_b
+        points = base_points + WIN_POINTS * wins
+        key = points * 10000 + (base_wins + wins) * 100 + tiebreak
+        order = np.argsort(-key, axis=1)
+        title_counts += np.bincount(order[:, 0], minlength=players)
+        top_counts += np.bincount(order[:, :top_n].ravel(), minlength=players)
+        points_total += points.sum(axis=0)
+        done += size
+
+    return SeasonProjection(
+        trials=done,
+        title={p: title_counts[i] / done for p, i in index.items()},
+        top={p: top_counts[i] / done for p, i in index.items()},
+        expected_points={p: points_total[i] / done for p, i in index.items()},
+        seconds=time.perf_counter() - started
+    )
@@ -0,0 +1,71 @@
+from typing import Dict, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+
+class SportRanking:
+    """Players of one sport ordered by rating, highest first.
+
+    Entries are (-rating, user_id) in a SortedList, so an update is a remove
+    plus an insert (O(log n)) and position lookups are order-statistic
+    queries rather than a sort of the whole population. Equal ratings are
+    ordered by user id.
+    """
+
+    def __init__(self):
+        self.entries = SortedList()
+        self.ratings: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def update(self, user_id: int, rating: float):
+        old = self.ratings.get(user_id)
+        if old is not None:
+            self.entries.remove((-old, user_id))
+        self.ratings[user_id] = rating
+        self.entries.add((-rating, user_id))
+
+    def remove(self, user_id: int):
+        old = self.ratings.pop(user_id, None)
+        if old is not None:
+            self.entries.remove((-old, user_id))
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, float]]:
+        """(user_id, rating) for positions offset .. offset + limit - 1 (0-based)"""
+        return [(user_id, -negative) for negative, user_id in self.entries.islice(offset, offset + limit)]
+
+    def top(self, k: int) -> List[Tuple[int, float]]:
+        return self.page(0, k)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based position of user_id, or None if they have no rating in this sport"""
+        rating = self.ratings.get(user_id)
+        if rating is None:
+            return None
+        return self.entries.index((-rating, user_id)) + 1
+
+
+class RankingIndex:
+    """Per-sport rankings kept in step with match_data["elo"] by set_elo"""
+
+    def __init__(self):
+        self.sports: Dict[str, SportRanking] = {}
+        # Bumped on every rating change, so a slow reader can tell ratings moved under it
+        self.version = 0
+
+    @classmethod
+    def from_elo(cls, elo: Dict[str, Dict[str, float]]) -> "RankingIndex":
+        index = cls()
+        for user_id, ratings in elo.items():
+            for sport, rating in ratings.items():
+                index.update(int(user_id), sport, rating)
+        return index
+
+    def sport(self, sport: str) -> SportRanking:
+        """Ranking for a sport; empty if nobody has a rating in it yet"""
+        return self.sports.get(sport) or SportRanking()
+
+    def update(self, user_id: int, sport: str, rating: float):
+        self.sports.setdefault(sport, SportRanking()).update(user_id, rating)
+        self.version += 1
@@ -0,0 +1,188 @@
+import math
+from itertools import chain
+from typing import Dict, Hashable, List, NamedTuple, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_RATING = 1000
+
+
+class PlayerRating(NamedTuple):
+    """A player's rating in one sport; Elo only uses `rating`"""
+    rating: float
+    rd: float = 350.0
+    volatility: float = 0.06
+
+
+# (winner ids, loser ids) of one match
+Game = Tuple[Sequence[Hashable], Sequence[Hashable]]
+
+
+class RatingEngine:
+    """How one sport's ratings respond to match results.
+
+    rate() takes the current ratings of (at least) every player involved and a
+    list of games, and returns the new ratings of the players it rated.
+    Engines with `batched` set hold results until the sport's rating period
+    closes and then rate the whole period in one call; the others are called
+    with each match as it is reported.
+    """
+
+    name = ""
+    batched = False
+
+    def rate(self, players: Dict[Hashable, PlayerRating], games: List[Game]) -> Dict[Hashable, PlayerRating]:
+        raise NotImplementedError
+
+
+class EloEngine(RatingEngine):
+    """Classic Elo with team averaging; each game is applied in order, ratings rounded to 2 decimals"""
+
+    name = "elo"
+
+    def __init__(self, k_factor: float = 32):
+        self.k_factor = k_factor
+
+    def rate(self, players: Dict[Hashable, PlayerRating], games: List[Game]) -> Dict[Hashable, PlayerRating]:
+        ratings = {player_id: player.rating for player_id, player in players.items()}
+        changed = {}
+        for winner_ids, loser_ids in games:
+            winner_elos = [ratings.get(uid, DEFAULT_RATING) for uid in winner_ids]
+            loser_elos = [ratings.get(uid, DEFAULT_RATING) for uid in loser_ids]
+
+            avg_winner_elo = sum(winner_elos) / len(winner_elos)
+            avg_loser_elo = sum(loser_elos) / len(loser_elos)
+
+            expected_win = expected_score(avg_winner_elo, avg_loser_elo)
+            expected_loss = expected_score(avg_loser_elo, avg_winner_elo)
+
+            updates = [(uid, r + self.k_factor * (1 - expected_win)) for uid, r in zip(winner_ids, winner_elos)]
+            updates += [(uid, r + self.k_factor * (0 - expected_loss)) for uid, r in zip(loser_ids, loser_elos)]
+            for uid, new_r in updates:
+                ratings[uid] = round(new_r, 2)
+                changed[uid] = PlayerRating(ratings[uid], *players.get(uid, PlayerRating(DEFAULT_RATING))[1:])
+        return changed
+
+
+class Glicko2Engine(RatingEngine):
+    """Glicko-2 (Glickman, 2012) with every game of a rating period rated in one vectorized pass.
+
+    Teams are rated as a composite opponent: the mean rating and the
+    root-mean-square deviation of the other side. Players with no games in
+    the period keep their rating while their deviation grows. The rating
+    scale is centred on DEFAULT_RATING instead of 1500 so that it lines up
+    with Elo ratings when a sport switches engines.
+    """
+
+    name = "glicko2"
+    batched = True
+
+    SCALE = 173.7178
+    MAX_RD = 350.0
+
+    def __init__(self, tau: float = 0.5, tolerance: float = 1e-6):
+        if np is None:
+            raise RuntimeError("The Glicko-2 engine needs the numpy package: pip install numpy")
+        self.tau = tau
+        self.tolerance = tolerance
+
+    def rate(self, players: Dict[Hashable, PlayerRating], games: List[Game]) -> Dict[Hashable, PlayerRating]:
+        games = [(winners, losers) for winners, losers in games if winners and losers]
+        ids = list(dict.fromkeys(chain(players, (uid for game in games for side in game for uid in side))))
+        if not ids:
+            return {}
+        index = {uid: i for i, uid in enumerate(ids)}
+        current = [players.get(uid, PlayerRating(DEFAULT_RATING)) for uid in ids]
+        mu = (np.array([p.rating for p in current], dtype=float) - DEFAULT_RATING) / self.SCALE
+        phi = np.array([p.rd for p in current], dtype=float) / self.SCALE
+        sigma = np.array([p.volatility for p in current], dtype=float)
+
+        # Flatten the games: one slot per player per game, tagged with its side (2 * game + won)
+        sizes = np.array([(len(winners), len(losers)) for winners, losers in games], dtype=np.int64).reshape(-1, 2)
+        slot_player = np.fromiter((index[uid] for game in games for side in game for uid in side),
+                                  dtype=np.int64, count=int(sizes.sum()))
+        side_sizes = sizes.reshape(-1)
+        slot_side = np.repeat(np.arange(len(side_sizes)), side_sizes)
+        won = slot_side % 2 == 0
+        # Each side's composite: mean mu and root-mean-square phi
+        side_mu = np.bincount(slot_side, weights=mu[slot_player], minlength=len(side_sizes)) / np.maximum(side_sizes, 1)
+        side_phi = np.sqrt(
+            np.bincount(slot_side, weights=phi[slot_player] ** 2, minlength=len(side_sizes)) / np.maximum(side_sizes, 1)
+        )
+        opponent = slot_side ^ 1
+        score = won.astype(float)
+
+        g = 1 / np.sqrt(1 + 3 * side_phi[opponent] ** 2 / math.pi ** 2)
+        expected = 1 / (1 + np.exp(-g * (mu[slot_player] - side_mu[opponent])))
+        inverse_v = np.bincount(slot_player, weights=g ** 2 * expected * (1 - expected), minlength=len(ids))
+        improvement = np.bincount(slot_player, weights=g * (score - expected), minlength=len(ids))
+
+        played = inverse_v > 0
+        new_mu, new_phi, new_sigma = mu.copy(), np.sqrt(phi ** 2 + sigma ** 2), sigma.copy()
+        if played.any():
+            v = 1 / inverse_v[played]
+            delta = v * improvement[played]
+            new_sigma[played] = self._volatility(phi[played], sigma[played], v, delta)
+            pre_phi = np.sqrt(phi[played] ** 2 + new_sigma[played] ** 2)
+            new_phi[played] = 1 / np.sqrt(1 / pre_phi ** 2 + 1 / v)
+            new_mu[played] = mu[played] + new_phi[played] ** 2 * improvement[played]
+        new_phi = np.minimum(new_phi, self.MAX_RD / self.SCALE)
+
+        ratings = np.round(new_mu * self.SCALE + DEFAULT_RATING, 2)
+        rds = new_phi * self.SCALE
+        return {
+            uid: PlayerRating(float(ratings[i]), float(rds[i]), float(new_sigma[i]))
+            for i, uid in enumerate(ids)
+        }
+
+    def _volatility(self, phi, sigma, v, delta):
+        """Step 5 of Glicko-2, the Illinois root search, run for every player at once"""
+        a = np.log(sigma ** 2)
+        tau = self.tau
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / tau ** 2
+
+        upper = np.empty_like(a)
+        big = delta ** 2 > phi ** 2 + v
+        upper[big] = np.log(delta[big] ** 2 - phi[big] ** 2 - v[big])
+        k = np.ones_like(a)
+        searching = ~big
+        while searching.any():
+            searching &= f(a - k * tau) < 0
+            k[searching] += 1
+        upper[~big] = (a - k * tau)[~big]
+
+        low, high = a, upper
+        f_low, f_high = f(low), f(high)
+        # Converged players keep being computed alongside the rest but their results are discarded
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for _ in range(100):
+                active = np.abs(high - low) > self.tolerance
+                if not active.any():
+                    break
+                middle = low + (low - high) * f_low / (f_high - f_low)
+                f_middle = f(middle)
+                crossed = f_middle * f_high <= 0
+                low = np.where(active & crossed, high, low)
+                f_low = np.where(active & crossed, f_high, np.where(active, f_low / 2, f_low))
+                high = np.where(active, middle, high)
+                f_high = np.where(active, f_middle, f_high)
+        return np.exp(low / 2)
+
+
+def expected_score(rating_a, rating_b):
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+
+def make_engines(k_factor: float) -> Dict[str, RatingEngine]:
+    """Engines selectable per sport by name; Glicko-2 is left out when numpy is missing"""
+    engines: Dict[str, RatingEngine] = {"elo": EloEngine(k_factor)}
+    if np is not None:
+        engines["glicko2"] = Glicko2Engine()
+    return engines
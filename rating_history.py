@@ -0,0 +1,168 @@
+import math
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from storage import shard_filename, write_file_atomic
+
+
+# One fixed-size record per rating change: 28 bytes, however long the history gets.
+# Ratings are stored in hundredths; they are always rounded to 2 decimals, so this is exact.
+RECORD_FIELDS = (("user_id", "<i8"), ("timestamp", "<f8"), ("rating", "<i4"), ("ref", "<i8"))
+RECORD = struct.Struct("<qdiq")
+# Match ref for changes that don't come from a casual match (league results, forfeits)
+NO_REF = -1
+
+
+class RatingSeries:
+    """One player's ratings in one sport over time, as parallel typed arrays.
+
+    ref is the casual match's position in the full match history, or NO_REF.
+    """
+
+    def __init__(self):
+        self.timestamps = array("d")
+        self.ratings = array("i")
+        self.refs = array("q")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, timestamp: float, rating: int, ref: int):
+        # Kept sorted for bisect even if the clock steps back
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        self.ratings.append(rating)
+        self.refs.append(ref)
+        self.timestamps.append(timestamp)
+
+    def rating_at(self, timestamp: float) -> Optional[float]:
+        """Rating in effect at timestamp, or None if the player had no rated match yet"""
+        index = bisect_right(self.timestamps, timestamp) - 1
+        return self.ratings[index] / 100 if index >= 0 else None
+
+    def downsample(self, points: int, since: Optional[float] = None,
+                   until: Optional[float] = None) -> List[Tuple[float, float]]:
+        """At most `points` (timestamp, rating) pairs: the last rating in each equal slice of time"""
+        start = bisect_right(self.timestamps, -math.inf if since is None else since)
+        end = bisect_right(self.timestamps, math.inf if until is None else until)
+        if end - start <= points:
+            return [(self.timestamps[i], self.ratings[i] / 100) for i in range(start, end)]
+
+        first = since
+        if first is None:
+            # Changes from before matches had timestamps sit at -inf and fold into the first slice
+            timed = bisect_right(self.timestamps, -math.inf, start, end)
+            if timed == end:
+                return [(self.timestamps[end - 1], self.ratings[end - 1] / 100)]
+            first = self.timestamps[timed]
+        last = self.timestamps[end - 1] if until is None else until
+        step = (last - first) / points
+        series = []
+        for bucket in range(1, points + 1):
+            index = bisect_right(self.timestamps, first + bucket * step, start, end) - 1
+            if index >= start and (not series or series[-1][0] != self.timestamps[index]):
+                series.append((self.timestamps[index], self.ratings[index] / 100))
+        return series
+
+
+class RatingHistory:
+    """Append-only log of every rating change, one binary file per sport.
+
+    record() buffers a change in memory and flush() appends the buffer to disk
+    (from the persistence worker thread). A sport's file is only read, and
+    split into per-player series, the first time that sport is queried.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.loaded: Dict[str, Dict[int, RatingSeries]] = {}
+        self.pending: List[Tuple[str, bytes]] = []
+        # Changes recorded while a rebuild is running; they are written after the rebuilt files
+        self.rebuilding: Optional[List[Tuple[str, bytes]]] = None
+        # record() runs on the loop, flush() and loading in worker threads
+        self.lock = threading.Lock()
+
+    def _path(self, sport: str) -> str:
+        return os.path.join(self.directory, shard_filename(sport)[:-len(".json")] + ".bin")
+
+    def record(self, user_id: int, sport: str, timestamp: float, rating: float, ref: int = NO_REF):
+        packed = RECORD.pack(user_id, timestamp, round(rating * 100), ref)
+        with self.lock:
+            self.pending.append((sport, packed))
+            if self.rebuilding is not None:
+                self.rebuilding.append((sport, packed))
+            if sport in self.loaded:
+                _add(self.loaded[sport], packed)
+
+    def flush(self):
+        """Append buffered changes to their sport files"""
+        with self.lock:
+            if not self.pending:
+                return
+            by_sport = defaultdict(list)
+            for sport, packed in self.pending:
+                by_sport[sport].append(packed)
+            os.makedirs(self.directory, exist_ok=True)
+            for sport, records in by_sport.items():
+                with open(self._path(sport), "ab") as f:
+                    f.write(b"".join(records))
+            self.pending = []
+
+    def begin_rebuild(self):
+        """Call on the loop when capturing the data a rebuild will read"""
+        with self.lock:
+            self.rebuilding = []
+
+    def cancel_rebuild(self):
+        """Call instead of replace() when a rebuild is abandoned"""
+        with self.lock:
+            self.rebuilding = None
+
+    def replace(self, records: Dict[str, bytes]):
+        """Swap in the history of the sports in records, e.g. rebuilt by replaying every match.
+
+        Changes recorded since begin_rebuild() are kept after the rebuilt
+        records; other sports' files and unflushed changes are left alone.
+        """
+        with self.lock:
+            added = self.rebuilding or []
+            self.rebuilding = None
+            os.makedirs(self.directory, exist_ok=True)
+            for sport, payload in records.items():
+                write_file_atomic(self._path(sport), payload + b"".join(packed for s, packed in added if s == sport))
+            # The rewritten files now hold everything buffered for their sports
+            self.pending = [(sport, packed) for sport, packed in self.pending if sport not in records]
+            for sport in records:
+                self.loaded.pop(sport, None)
+
+    def series(self, user_id: int, sport: str) -> Optional[RatingSeries]:
+        """A player's series in a sport; the first call for a sport reads its file"""
+        with self.lock:
+            if sport not in self.loaded:
+                self.loaded[sport] = self._load(sport)
+            return self.loaded[sport].get(user_id)
+
+    def _load(self, sport: str) -> Dict[int, RatingSeries]:
+        players: Dict[int, RatingSeries] = {}
+        path = self._path(sport)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                payload = f.read()
+            # A crash mid-append can leave a partial record at the end
+            payload = payload[:len(payload) - len(payload) % RECORD.size]
+            for user_id, timestamp, rating, ref in RECORD.iter_unpack(payload):
+                players.setdefault(user_id, RatingSeries()).append(timestamp, rating, ref)
+        for pending_sport, packed in self.pending:
+            if pending_sport == sport:
+                _add(players, packed)
+        return players
+
+
+def _add(players: Dict[int, RatingSeries], packed: bytes):
+    user_id, timestamp, rating, ref = RECORD.unpack(packed)
+    players.setdefault(user_id, RatingSeries()).append(timestamp, rating, ref)
@@ -0,0 +1,362 @@
+import math
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from match_archive import MatchArchive
+from rating_history import NO_REF, RECORD_FIELDS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DEFAULT_RATING = 1000
+# A forfeit costs every player K, but never takes a rating below this
+FORFEIT_FLOOR = 100
+# Layers with fewer events than this are cheaper to apply one by one than with array ops
+MIN_VECTOR_LAYER = 16
+
+
+class SportEvents:
+    """One sport's rated events as flat arrays, in the order they were applied.
+
+    Event i involves players[offsets[i]:offsets[i + 1]] (indices into user_ids);
+    the first winner_count[i] of them won. A forfeit has no winners: every
+    player loses K, floored at FORFEIT_FLOOR. refs[i] is a casual match's
+    position in the full match history, or NO_REF.
+    """
+
+    def __init__(self, user_ids, players, offsets, winner_count, forfeit, timestamps, refs):
+        self.user_ids = user_ids
+        self.players = players
+        self.offsets = offsets
+        self.winner_count = winner_count
+        self.forfeit = forfeit
+        self.timestamps = timestamps
+        self.refs = refs
+
+    def __len__(self) -> int:
+        return len(self.winner_count)
+
+
+class EventLog:
+    """Collects casual matches and league results from every tier into per-sport event arrays"""
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("Rating replay needs the numpy package: pip install numpy")
+        self.sport_names: List[str] = []
+        self.sport_ids: Dict[str, int] = {}
+        # Casual matches, oldest first, one array chunk per archive
+        self.casual: List[Dict] = []
+        self.casual_count = 0
+        # Matches the columns can't describe, and league results: (casual position or None,
+        # timestamp, sport, winner ids, loser ids, forfeit, match ref)
+        self.extra: List[Tuple] = []
+
+    def _sport_id(self, sport: str) -> int:
+        if sport not in self.sport_ids:
+            self.sport_ids[sport] = len(self.sport_names)
+            self.sport_names.append(sport)
+        return self.sport_ids[sport]
+
+    def add_archive(self, archive: MatchArchive):
+        """Add casual matches; archives must be added oldest first (cold segments, then hot)"""
+        columns = archive.columns
+        count = len(archive)
+        offsets = np.frombuffer(columns["player_offset"], dtype=np.uint64).astype(np.int64)
+        sport_map = np.array([self._sport_id(name) for name in archive.sport_names] or [0], dtype=np.int64)
+        keep = np.ones(count, dtype=bool)
+
+        for index, override in archive.overrides.items():
+            if not {"sport", "winner_ids", "loser_ids"} & set(override):
+                continue
+            keep[index] = False
+            match = archive[index]
+            if isinstance(match.get("sport"), str):
+                self.extra.append((self.casual_count + index, None, match["sport"],
+                                   match.get("winner_ids", []), match.get("loser_ids", []), False,
+                                   archive.base + index))
+
+        self.casual.append({
+            "sport": sport_map[np.frombuffer(columns["sport"], dtype=np.uint16)] if count else np.empty(0, np.int64),
+            "timestamp": np.frombuffer(columns["timestamp"], dtype=np.float64),
+            "winner_count": np.frombuffer(columns["winner_count"], dtype=np.uint16).astype(np.int64),
+            "player_count": np.diff(offsets),
+            "players": np.frombuffer(columns["players"], dtype=np.int64),
+            "ref": np.arange(archive.base, archive.base + count, dtype=np.int64),
+            "keep": keep,
+        })
+        self.casual_count += count
+
+    def add_league(self, league: Dict, weeks: Dict):
+        """Add a league's completed and forfeited matches, ordered by when they were recorded"""
+        sport = league.get("sport")
+        for week_matches in weeks.values():
+            for match in week_matches:
+                if match.get("status") not in ("completed", "forfeited"):
+                    continue
+                try:
+                    timestamp = datetime.fromisoformat(match["completed_date"]).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    timestamp = math.inf
+                if match["status"] == "forfeited":
+                    first, second = _sides(match)
+                    if first and second:
+                        self.extra.append((None, timestamp, sport, [], first + second, True, NO_REF))
+                    continue
+                result = league_result(match)
+                if result:
+                    self.extra.append((None, timestamp, sport, result[0], result[1], False, NO_REF))
+
+    def events(self) -> Dict[str, SportEvents]:
+        """Every sport's events sorted into the order the live path applied them"""
+        chunks = self.casual or [_empty_chunk()]
+        sport = np.concatenate([chunk["sport"] for chunk in chunks])
+        winner_count = np.concatenate([chunk["winner_count"] for chunk in chunks])
+        player_count = np.concatenate([chunk["player_count"] for chunk in chunks])
+        players = np.concatenate([chunk["players"] for chunk in chunks])
+        refs = np.concatenate([chunk["ref"] for chunk in chunks])
+        keep = np.concatenate([chunk["keep"] for chunk in chunks])
+
+        # Casual matches are stored in the order they were confirmed. Carry the latest timestamp
+        # forward so untimed or out-of-order ones stay where they are relative to league results.
+        timestamps = np.concatenate([chunk["timestamp"] for chunk in chunks])
+        timestamps = np.fmax.accumulate(timestamps) if len(timestamps) else timestamps
+        timestamps = np.where(np.isnan(timestamps), -np.inf, timestamps)
+        ties = np.arange(len(sport), dtype=np.int64)
+        keep &= (winner_count > 0) & (player_count > winner_count)
+        forfeit = np.zeros(len(sport), dtype=bool)
+
+        extra_players = []
+        extra_rows = {
+            "sport": [], "timestamp": [], "tie": [], "winner_count": [], "player_count": [], "forfeit": [], "ref": []
+        }
+        for position, timestamp, extra_sport, winners, losers, is_forfeit, ref in self.extra:
+            if not is_forfeit and (not winners or not losers):
+                continue
+            if position is None:
+                extra_rows["timestamp"].append(timestamp)
+                # League results sort after casual matches with the same timestamp
+                extra_rows["tie"].append(self.casual_count + len(extra_rows["tie"]))
+            else:
+                extra_rows["timestamp"].append(timestamps[position])
+                extra_rows["tie"].append(position)
+            extra_rows["sport"].append(self._sport_id(extra_sport))
+            extra_rows["winner_count"].append(len(winners))
+            extra_rows["player_count"].append(len(winners) + len(losers))
+            extra_rows["forfeit"].append(is_forfeit)
+            extra_rows["ref"].append(ref)
+            extra_players.extend(int(uid) for uid in (*winners, *losers))
+
+        player_keep = np.repeat(keep, player_count)
+        sport = np.concatenate([sport[keep], np.array(extra_rows["sport"], dtype=np.int64)])
+        timestamps = np.concatenate([timestamps[keep], np.array(extra_rows["timestamp"], dtype=np.float64)])
+        ties = np.concatenate([ties[keep], np.array(extra_rows["tie"], dtype=np.int64)])
+        winner_count = np.concatenate([winner_count[keep], np.array(extra_rows["winner_count"], dtype=np.int64)])
+        player_count = np.concatenate([player_count[keep], np.array(extra_rows["player_count"], dtype=np.int64)])
+        forfeit = np.concatenate([forfeit[keep], np.array(extra_rows["forfeit"], dtype=bool)])
+        refs = np.concatenate([refs[keep], np.array(extra_rows["ref"], dtype=np.int64)])
+        players = np.concatenate([players[player_keep], np.array(extra_players, dtype=np.int64)])
+
+        order = np.lexsort((ties, timestamps, sport))
+        players = players[_gather_ranges(_offsets(player_count)[:-1][order], player_count[order])]
+        sport, timestamps, refs = sport[order], timestamps[order], refs[order]
+        winner_count, player_count, forfeit = winner_count[order], player_count[order], forfeit[order]
+        offsets = _offsets(player_count)
+
+        by_sport = {}
+        bounds = np.searchsorted(sport, np.arange(len(self.sport_names) + 1))
+        for sport_id, name in enumerate(self.sport_names):
+            start, end = bounds[sport_id], bounds[sport_id + 1]
+            if start == end:
+                continue
+            first_player, last_player = offsets[start], offsets[end]
+            user_ids, local_players = np.unique(players[first_player:last_player], return_inverse=True)
+            by_sport[name] = SportEvents(
+                user_ids, local_players.reshape(-1), offsets[start:end + 1] - first_player,
+                winner_count[start:end], forfeit[start:end], timestamps[start:end], refs[start:end]
+            )
+        return by_sport
+
+
+def replay_elo(events: SportEvents, k_factor: float, history: Optional[List] = None) -> Dict[int, float]:
+    """Final Elo of every player in the events, computed exactly as update_elo_winner_loser would.
+
+    If a history list is given, every rating change is appended to it as a
+    packed rating_history record array, in the order the changes happened.
+
+    Events are split into layers in which nobody plays twice; a layer only
+    depends on earlier layers, so all of its matches are applied at once
+    with array math. Results that land within rounding noise of a
+    half-cent are recomputed in plain Python so the output matches the
+    live path bit for bit.
+    """
+    ratings = np.full(len(events.user_ids), float(DEFAULT_RATING))
+    if not len(events):
+        return {}
+
+    counts = np.diff(events.offsets)
+    layers = _layers(events.players.tolist(), events.offsets.tolist(), len(events.user_ids))
+    event_order = np.argsort(layers, kind="stable")
+    event_rank = np.empty_like(event_order)
+    event_rank[event_order] = np.arange(len(event_order))
+
+    slot_event = np.repeat(np.arange(len(events)), counts)
+    slot_winner = np.arange(len(slot_event)) - events.offsets[:-1][slot_event] < events.winner_count[slot_event]
+    slot_order = np.argsort(layers[slot_event], kind="stable")
+    slot_user = events.players[slot_order]
+    slot_winner = slot_winner[slot_order]
+    slot_rank = event_rank[slot_event][slot_order]
+
+    sorted_layers = layers[event_order]
+    layer_bounds = np.flatnonzero(np.diff(sorted_layers)) + 1
+    event_bounds = np.concatenate([[0], layer_bounds, [len(events)]])
+    slot_bounds = np.concatenate([[0], np.cumsum(counts[event_order])])[event_bounds]
+
+    winner_counts = events.winner_count[event_order]
+    loser_counts = counts[event_order] - winner_counts
+    forfeits = events.forfeit[event_order]
+    # The rating each slot ended up with, in slot_order
+    slot_rating = np.empty(len(slot_user))
+
+    for layer in range(len(event_bounds) - 1):
+        event_start, event_end = event_bounds[layer], event_bounds[layer + 1]
+        slot_start, slot_end = slot_bounds[layer], slot_bounds[layer + 1]
+        users = slot_user[slot_start:slot_end]
+
+        if event_end - event_start < MIN_VECTOR_LAYER:
+            position = slot_start
+            for event in range(event_start, event_end):
+                size = winner_counts[event] + loser_counts[event]
+                group = users[position - slot_start:position - slot_start + size]
+                new = _update([float(ratings[user]) for user in group], int(winner_counts[event]),
+                              bool(forfeits[event]), k_factor)
+                for user, value in zip(group, new):
+                    ratings[user] = value
+                slot_rating[position:position + size] = new
+                position += size
+            continue
+
+        old = ratings[users]
+        local = slot_rank[slot_start:slot_end] - event_start
+        winner = slot_winner[slot_start:slot_end]
+        size = event_end - event_start
+        winner_sum = np.bincount(local[winner], weights=old[winner], minlength=size)
+        loser_sum = np.bincount(local[~winner], weights=old[~winner], minlength=size)
+        avg_winner = winner_sum / np.maximum(winner_counts[event_start:event_end], 1)
+        avg_loser = loser_sum / np.maximum(loser_counts[event_start:event_end], 1)
+        expected_win = 1 / (1 + 10 ** ((avg_loser - avg_winner) / 400))
+        expected_loss = 1 / (1 + 10 ** ((avg_winner - avg_loser) / 400))
+
+        new = np.where(winner, old + k_factor * (1 - expected_win[local]), old + k_factor * (0 - expected_loss[local]))
+        forfeit = forfeits[event_start:event_end][local]
+        new = np.where(forfeit, np.maximum(FORFEIT_FLOOR, old - k_factor), new)
+
+        scaled = new * 100
+        rounded = np.rint(scaled) / 100
+        # Python's round() is exact; rint(x * 100) can only disagree next to a half-cent
+        for slot in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+            event_slots = np.flatnonzero(local == local[slot])
+            values = _update([float(value) for value in old[event_slots]], int(winner_counts[event_start + local[slot]]),
+                             bool(forfeit[slot]), k_factor)
+            rounded[slot] = values[int(np.searchsorted(event_slots, slot))]
+
+        # Winners are written before losers, like the live path, in case a match lists someone twice
+        ratings[users[winner]] = rounded[winner]
+        ratings[users[~winner]] = rounded[~winner]
+        slot_rating[slot_start:slot_end] = rounded
+
+    if history is not None:
+        slot_event = slot_event[slot_order]
+        records = np.empty(len(slot_user), dtype=list(RECORD_FIELDS))
+        records["user_id"] = events.user_ids[slot_user]
+        records["timestamp"] = events.timestamps[slot_event]
+        records["rating"] = np.rint(slot_rating * 100)
+        records["ref"] = events.refs[slot_event]
+        # Stable, so each player's changes stay in the order they happened
+        history.append(records[np.argsort(records["user_id"], kind="stable")])
+
+    return {int(user_id): float(rating) for user_id, rating in zip(events.user_ids, ratings)}
+
+
+def replay_ratings(events: Dict[str, SportEvents], k_factor: float,
+                   history: Optional[Dict[str, bytes]] = None) -> Dict[str, Dict[str, float]]:
+    """Replay every sport; returns ratings laid out like match_data["elo"] (user id -> sport -> rating).
+
+    If a history dict is given, it is filled with each sport's rating history file contents.
+    """
+    elo: Dict[str, Dict[str, float]] = {}
+    for sport, sport_events in events.items():
+        changes = [] if history is not None else None
+        for user_id, rating in replay_elo(sport_events, k_factor, changes).items():
+            elo.setdefault(str(user_id), {})[sport] = rating
+        if history is not None:
+            history[sport] = changes[0].tobytes() if changes else b""
+    return elo
+
+
+def _update(ratings: List[float], winner_count: int, forfeit: bool, k_factor: float) -> List[float]:
+    """New ratings for one event's players, with the same float operations as the live path"""
+    if forfeit:
+        return [round(max(FORFEIT_FLOOR, rating - k_factor), 2) for rating in ratings]
+    winner_elos, loser_elos = ratings[:winner_count], ratings[winner_count:]
+    avg_winner_elo = sum(winner_elos) / len(winner_elos)
+    avg_loser_elo = sum(loser_elos) / len(loser_elos)
+    expected_win = 1 / (1 + 10 ** ((avg_loser_elo - avg_winner_elo) / 400))
+    expected_loss = 1 / (1 + 10 ** ((avg_winner_elo - avg_loser_elo) / 400))
+    return [round(r + k_factor * (1 - expected_win), 2) for r in winner_elos] + \
+           [round(r + k_factor * (0 - expected_loss), 2) for r in loser_elos]
+
+
+def _layers(players: List[int], offsets: List[int], user_count: int):
+    """Layer of each event: one past the latest layer any of its players appeared in"""
+    last = [0] * user_count
+    layers = []
+    for start, end in zip(offsets, offsets[1:]):
+        group = players[start:end]
+        layer = max(last[player] for player in group) + 1
+        for player in group:
+            last[player] = layer
+        layers.append(layer)
+    return np.array(layers, dtype=np.int64)
+
+
+def league_result(match: Dict) -> Optional[Tuple[List, List]]:
+    """(winner ids, loser ids) of a completed league match, or None"""
+    first, second = _sides(match)
+    if match.get("status") != "completed" or not first or not second:
+        return None
+    winner = str(match.get("result", "")).split("_")[0]
+    # 1v1 results start with the winner's id, 2v2 results with the winning team number
+    first_won = winner in (str(match.get("player1")), "1")
+    return (first, second) if first_won else (second, first)
+
+
+def _sides(match: Dict) -> Tuple[List, List]:
+    if "team1" in match or "team2" in match:
+        return list(match.get("team1") or []), list(match.get("team2") or [])
+    first, second = match.get("player1"), match.get("player2")
+    return ([first] if first is not None else []), ([second] if second is not None else [])
+
+
+def _offsets(counts):
+    return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+
+def _gather_ranges(starts, lengths):
+    """Indices of the ranges [start, start + length) laid end to end"""
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - _offsets(lengths)[:-1], lengths)
+    return np.arange(total, dtype=np.int64) + shifts
+
+
+def _empty_chunk() -> Dict:
+    return {
+        "sport": np.empty(0, np.int64), "timestamp": np.empty(0, np.float64),
+        "winner_count": np.empty(0, np.int64), "player_count": np.empty(0, np.int64),
+        "players": np.empty(0, np.int64), "ref": np.empty(0, np.int64), "keep": np.empty(0, bool),
+    }
@@ -0,0 +1,935 @@
+import argparse
+import asyncio
+import copy
+import gc
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from match_archive import MatchArchive
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Per-league sections the JSON backend keeps in one shard file per league
+SHARDED_SECTIONS = ("league_matches", "league_standings", "league_signups")
+
+
+# Binary snapshots start with this magic followed by a one byte format version
+SNAPSHOT_MAGIC = b"MDSNAP"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FORMATS = ("json", "msgpack")
+
+
+def encode_snapshot(data: Dict, snapshot_format: str = "json") -> bytes:
+    """Serialize a snapshot as pretty-printed JSON or as a versioned msgpack blob"""
+    if snapshot_format == "json":
+        return json.dumps(data, indent=4, default=_encode_archive).encode()
+    if snapshot_format == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("SNAPSHOT_FORMAT=msgpack needs the msgpack package: pip install msgpack")
+        packed = msgpack.packb(data, use_bin_type=True, default=lambda o: _encode_archive(o, binary=True))
+        return SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]) + packed
+    raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+
+
+def _encode_archive(value, binary: bool = False):
+    if isinstance(value, MatchArchive):
+        return value.to_columns(binary)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def decode_snapshot(payload: bytes) -> Dict:
+    """Parse a snapshot written in either format; raises ValueError if it can't be read"""
+    # Parsing allocates millions of small containers for a big match history and the
+    # cyclic GC would rescan them over and over; nothing parsed here can form a cycle
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _decode_snapshot(payload)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _decode_snapshot(payload: bytes) -> Dict:
+    if not payload.startswith(SNAPSHOT_MAGIC):
+        return json.loads(payload)
+
+    version = payload[len(SNAPSHOT_MAGIC)] if len(payload) > len(SNAPSHOT_MAGIC) else None
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported binary snapshot version: {version}")
+    if msgpack is None:
+        raise RuntimeError("This snapshot is in msgpack format; install it with: pip install msgpack")
+    try:
+        # Week numbers are int keys; msgpack keeps them, unlike JSON
+        return msgpack.unpackb(payload[len(SNAPSHOT_MAGIC) + 1:], raw=False, strict_map_key=False)
+    except Exception as e:
+        raise ValueError(f"Corrupt binary snapshot: {e}")
+
+
+def default_data() -> Dict:
+    """Empty data layout used when no data file exists yet"""
+    return {
+        "sports": {},
+        "elo": {},
+        "matches": MatchArchive(),
+        "naked_laps": {},
+        "leagues": {},
+        "league_signups": {},
+        "league_matches": {},
+        "league_standings": {},
+        "admins": []
+    }
+
+
+def normalize_weeks(weeks: Dict) -> Dict:
+    """Restore integer week keys, which JSON turns into strings"""
+    return {
+        (int(week) if isinstance(week, str) and week.isdigit() else week): matches
+        for week, matches in weeks.items()
+    }
+
+
+def normalize_data(data: Dict) -> Dict:
+    """Fill in missing sections, restore integer week keys lost in JSON and load the match archive"""
+    for key, value in default_data().items():
+        data.setdefault(key, value)
+
+    data["matches"] = MatchArchive.load(data["matches"])
+
+    for league_name, weeks in data["league_matches"].items():
+        data["league_matches"][league_name] = normalize_weeks(weeks)
+
+    return data
+
+
+def match_player_ids(match: Dict) -> List[int]:
+    """Every player id referenced by a league match (1v1 or 2v2)"""
+    ids = [match.get("player1"), match.get("player2")]
+    ids += match.get("team1") or []
+    ids += match.get("team2") or []
+    return [uid for uid in ids if uid is not None]
+
+
+def apply_record(data: Dict, record: Dict):
+    """Apply a single journal record to the data dict"""
+    *parents, key = record["path"]
+    target = data
+    for part in parents:
+        target = target[part]
+
+    op = record["op"]
+    if op == "set":
+        target[key] = record["value"]
+    elif op == "delete":
+        target.pop(key, None)
+    elif op == "append":
+        target[key].append(record["value"])
+    elif op == "remove":
+        if record["value"] in target[key]:
+            target[key].remove(record["value"])
+    elif op == "trim":
+        del target[key][:record["value"]]
+    else:
+        raise ValueError(f"Unknown journal op: {op}")
+
+
+def rotated_path(path: str, generation: int) -> str:
+    """Path of an older generation of a file: match_data.json, match_data.json.1, ..."""
+    return path if generation == 0 else f"{path}.{generation}"
+
+
+def fsync_directory(directory: str):
+    """Make renames inside a directory durable (no-op where directories can't be opened)"""
+    try:
+        fd = os.open(directory or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_file_atomic(path: str, payload: bytes):
+    """Write to a temp file, fsync it and rename it over path so readers never see a partial file"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(path))
+
+
+def rotate_generations(path: str, generations: int):
+    """Shift path -> path.1 -> path.2 ..., dropping whatever falls off the end"""
+    for generation in range(generations - 1, 0, -1):
+        older = rotated_path(path, generation - 1)
+        if os.path.exists(older):
+            os.replace(older, rotated_path(path, generation))
+
+
+class SnapshotFiles:
+    """Rotated generations of a snapshot file, each paired with a .sha256 checksum"""
+
+    def __init__(self, path: str, generations: int = 3):
+        self.path = path
+        self.generations = max(1, generations)
+
+    def exists(self) -> bool:
+        return any(os.path.exists(rotated_path(self.path, g)) for g in range(self.generations))
+
+    def write(self, payload: bytes):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        rotate_generations(self.path, self.generations)
+        rotate_generations(self.path + ".sha256", self.generations)
+
+        # The checksum lands before the data; if we die in between, generation 0
+        # fails verification (or is missing) and load falls back to generation 1
+        write_file_atomic(self.path + ".sha256", hashlib.sha256(payload).hexdigest().encode())
+        os.replace(tmp_path, self.path)
+        fsync_directory(os.path.dirname(self.path))
+
+    def read_valid(self) -> Iterator[Tuple[int, bytes]]:
+        """Yield (generation, payload) for each generation whose checksum matches, newest first"""
+        for generation in range(self.generations):
+            path = rotated_path(self.path, generation)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                payload = f.read()
+
+            checksum_path = rotated_path(self.path + ".sha256", generation)
+            if os.path.exists(checksum_path):
+                with open(checksum_path, "r") as f:
+                    expected = f.read().strip()
+                if hashlib.sha256(payload).hexdigest() != expected:
+                    print(f"⚠️ Checksum mismatch in {path}, skipping it")
+                    continue
+            # Files written before checksums existed have no .sha256; parsing them is the only check
+
+            yield generation, payload
+
+    def remove(self):
+        for generation in range(self.generations):
+            for path in (rotated_path(self.path, generation), rotated_path(self.path + ".sha256", generation)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def shard_filename(league_name: str) -> str:
+    """Filesystem-safe, collision-free file name for a league's shard"""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", league_name).strip("_")[:40] or "league"
+    digest = hashlib.sha1(league_name.encode()).hexdigest()[:8]
+    return f"{slug}-{digest}.json"
+
+
+class LeagueShards:
+    """One shard file per league holding its matches, standings and signups.
+
+    Shards load on first access and stay cached for up to `capacity` leagues,
+    evicting the least recently used clean shard. A shard is dirty from its
+    first change until a snapshot has written it, and only dirty shards are
+    written.
+    """
+
+    def __init__(self, directory: str, capacity: int = 16, generations: int = 3,
+                 snapshot_format: str = "json"):
+        self.directory = directory
+        self.capacity = max(1, capacity)
+        self.generations = generations
+        self.snapshot_format = snapshot_format
+        self.cache: "OrderedDict[str, Dict]" = OrderedDict()
+        # journal_seq each shard was written at, used to skip records it already contains
+        self.seqs: Dict[str, int] = {}
+        # league -> change counter; commits run in a worker thread, hence the lock
+        self.dirty: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        # league -> sections its shard holds, so listing leagues never opens shard files;
+        # saved in the main snapshot as "league_shards"
+        self.sections: Dict[str, Set[str]] = {}
+
+    def _files(self, name: str) -> SnapshotFiles:
+        return SnapshotFiles(os.path.join(self.directory, shard_filename(name)), self.generations)
+
+    def set_section(self, name: str, section: str, value):
+        self.get(name, create=True)[section] = value
+        self.sections.setdefault(name, set()).add(section)
+        self.mark_dirty(name)
+
+    def manifest(self) -> Dict[str, List[str]]:
+        return {name: sorted(sections) for name, sections in self.sections.items() if sections}
+
+    def get(self, name: str, create: bool = False) -> Optional[Dict]:
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+
+        shard = self._read(name)
+        if shard is None:
+            if not create:
+                return None
+            shard = {}
+        self.cache[name] = shard
+        self._evict()
+        return shard
+
+    def _read(self, name: str) -> Optional[Dict]:
+        for generation, payload in self._files(name).read_valid():
+            try:
+                stored = decode_snapshot(payload)
+            except ValueError:
+                continue
+            if generation > 0:
+                print(f"⚠️ Recovered league shard for {name} from generation {generation}")
+            self.seqs[name] = stored.get("journal_seq", 0)
+            shard = {section: stored[section] for section in SHARDED_SECTIONS if section in stored}
+            if "league_matches" in shard:
+                shard["league_matches"] = normalize_weeks(shard["league_matches"])
+            # The file is the authority for what it holds, e.g. after recovering an older main snapshot
+            self.sections[name] = set(shard)
+            return shard
+        return None
+
+    def _evict(self):
+        while len(self.cache) > self.capacity:
+            # Never the shard just requested, and never one with unwritten changes
+            victim = next((name for name in list(self.cache)[:-1] if name not in self.dirty), None)
+            if victim is None:
+                return
+            del self.cache[victim]
+
+    def mark_dirty(self, name: str):
+        with self.lock:
+            self.dirty[name] = self.dirty.get(name, 0) + 1
+
+    def capture_dirty(self) -> Dict[str, Tuple[int, bytes]]:
+        """Copy every dirty shard, tagged with its change counter"""
+        with self.lock:
+            dirty = dict(self.dirty)
+        return {
+            name: (version, pickle.dumps(self.cache.get(name) or {}, pickle.HIGHEST_PROTOCOL))
+            for name, version in dirty.items()
+        }
+
+    def write(self, captured: Dict[str, Tuple[int, bytes]], seq: int):
+        """Write captured shards; each stays dirty if it changed again meanwhile"""
+        if captured:
+            os.makedirs(self.directory, exist_ok=True)
+        for name, (version, payload) in captured.items():
+            shard = pickle.loads(payload)
+            if shard:
+                self._files(name).write(
+                    encode_snapshot({"name": name, "journal_seq": seq, **shard}, self.snapshot_format)
+                )
+            else:
+                self._files(name).remove()
+            with self.lock:
+                if self.dirty.get(name) == version:
+                    del self.dirty[name]
+
+
+class PickledSections:
+    """Pickled copies of the main snapshot's sections, one per key (user, sport, league...).
+
+    Only keys that a record touched since the last capture are pickled again,
+    so capturing a snapshot on the event loop costs what changed, not the
+    whole dataset. The worker thread unpickles the pieces to write them out.
+    """
+
+    def __init__(self):
+        self.sections: Dict[str, Dict[Any, bytes]] = {}
+        self.stale: Dict[str, Set] = {}
+
+    def mark(self, path: Sequence):
+        section = path[0]
+        if len(path) == 1:
+            # Replaced as a whole; pickled from scratch at the next capture
+            self.sections.pop(section, None)
+            self.stale.pop(section, None)
+        elif section in self.sections:
+            self.stale.setdefault(section, set()).add(path[1])
+
+    def capture(self, section: str, value: Dict) -> Dict[Any, bytes]:
+        pickled = self.sections.get(section)
+        if pickled is None:
+            pickled = {key: pickle.dumps(item, pickle.HIGHEST_PROTOCOL) for key, item in value.items()}
+            self.sections[section] = pickled
+        else:
+            for key in self.stale.pop(section, ()):
+                if key in value:
+                    pickled[key] = pickle.dumps(value[key], pickle.HIGHEST_PROTOCOL)
+                else:
+                    pickled.pop(key, None)
+        # Later captures update the cache in place; the worker gets its own dict
+        return dict(pickled)
+
+
+class ShardSection(MutableMapping):
+    """A per-league section (e.g. league_matches) whose values live in LeagueShards"""
+
+    def __init__(self, shards: LeagueShards, section: str):
+        self.shards = shards
+        self.section = section
+
+    def __getitem__(self, name: str):
+        shard = self.shards.get(name)
+        if shard is None or self.section not in shard:
+            raise KeyError(name)
+        return shard[self.section]
+
+    def __setitem__(self, name: str, value):
+        self.shards.set_section(name, self.section, value)
+
+    def __delitem__(self, name: str):
+        shard = self.shards.get(name)
+        if shard is None or self.section not in shard:
+            raise KeyError(name)
+        del shard[self.section]
+        self.shards.sections.get(name, set()).discard(self.section)
+        self.shards.mark_dirty(name)
+
+    # Membership and listing come from the shard index without loading any shard
+    def __contains__(self, name) -> bool:
+        return self.section in self.shards.sections.get(name, ())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([name for name, sections in list(self.shards.sections.items()) if self.section in sections])
+
+    def __len__(self) -> int:
+        return sum(1 for sections in self.shards.sections.values() if self.section in sections)
+
+
+class Journal:
+    """Append-only log of mutation records, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+
+    def read(self, generation: int = 0) -> Iterator[Dict]:
+        path = rotated_path(self.path, generation)
+        if not os.path.exists(path):
+            return
+
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append; everything before it is valid
+                    break
+
+    def append(self, lines: List[str]):
+        with open(self.path, "a") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += len(lines)
+
+    def reset(self):
+        with open(self.path, "w"):
+            pass
+        self.size = 0
+
+    def rotate(self, generations: int):
+        """Start a new journal, keeping the old one as journal.1 (and so on) for recovery"""
+        rotate_generations(self.path, generations)
+        self.reset()
+        fsync_directory(os.path.dirname(self.path))
+
+
+class StorageBackend:
+    """Where DataStore keeps its data between restarts"""
+
+    def load(self) -> Dict:
+        raise NotImplementedError
+
+    def on_record(self, record: Dict):
+        """Called as each mutation is applied in memory, before it is committed"""
+        pass
+
+    def capture(self, entries: List[Tuple[Dict, str]], data: Dict) -> Any:
+        """Copy whatever commit() needs from the live data.
+
+        Runs on the event loop so the copy is consistent; commit() may then run
+        in a worker thread while the data keeps changing.
+        """
+        raise NotImplementedError
+
+    def commit(self, entries: List[Tuple[Dict, str]], snapshot: Any):
+        """Persist (record, serialized record) pairs produced since the last commit"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    # Read paths. These answer from the in-memory data; SqliteBackend runs
+    # indexed queries instead. All of them run on the event loop.
+
+    def rating(self, data: Dict, user_id: str, sport: str) -> Optional[float]:
+        return data["elo"].get(user_id, {}).get(sport)
+
+    def ranking(self, data: Dict, sport: str):
+        """A sport's leaderboard (see ranking.SportRanking), or None to use the in-memory RankingIndex"""
+        return None
+
+    def user_matches(self, data: Dict, user_id: int, limit: int,
+                     before: Optional[int] = None) -> List[Tuple[int, Dict]]:
+        archive = data["matches"]
+        indices = archive.indices_for_user(user_id, before=None if before is None else before - archive.base)
+        return [(archive.base + index, archive[index]) for index in itertools.islice(indices, limit)]
+
+    def user_record(self, data: Dict, user_id: int, sport: Optional[str] = None) -> Tuple[int, int]:
+        return data["matches"].user_record(user_id, sport)
+
+    def league_week(self, data: Dict, league: str, week: int) -> Optional[List[Dict]]:
+        return data["league_matches"].get(league, {}).get(week)
+
+    def league_match_indices(self, data: Dict, league: str, week: int, user_id: int) -> List[int]:
+        """Positions in a league week of the matches user_id plays in"""
+        matches = self.league_week(data, league, week) or []
+        return [index for index, match in enumerate(matches) if user_id in match_player_ids(match)]
+
+
+class JsonBackend(StorageBackend):
+    """match_data.json snapshot plus an append-only journal.
+
+    In "journal" mode commit() only appends the new records; the full snapshot
+    is rewritten once the journal reaches compact_after records. In "snapshot"
+    mode commit() rewrites the whole file like the original save_data().
+
+    Snapshots are written atomically and the last `generations` of them are
+    kept with checksums, together with the journals written after each one.
+    If the newest snapshot is damaged, load() falls back to an older
+    generation and replays the journals on top of it. A league shard recovered
+    from an older generation is caught up from the same journals.
+
+    League matches, standings and signups are not part of the main snapshot;
+    each league lives in its own shard file under <name>_leagues/ (see
+    LeagueShards) so a change to one league never rewrites the others.
+    """
+
+    def __init__(self, path: str, mode: str = "journal", compact_after: int = 1000,
+                 generations: int = 3, shard_cache_size: int = 16, snapshot_format: str = "json"):
+        if mode not in ("journal", "snapshot"):
+            raise ValueError(f"Unknown persistence mode: {mode}")
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+
+        self.path = path
+        self.mode = mode
+        self.compact_after = compact_after
+        self.snapshot_format = snapshot_format
+        self.snapshots = SnapshotFiles(path, generations)
+        self.journal = Journal(os.path.splitext(path)[0] + ".journal")
+        self.shards = LeagueShards(os.path.splitext(path)[0] + "_leagues", shard_cache_size, generations,
+                                   snapshot_format)
+        # Set when load() had to catch a recovered shard up from older journals
+        self.compact_next = False
+        self.pickled = PickledSections()
+
+    def exists(self) -> bool:
+        return self.snapshots.exists() or os.path.exists(self.journal.path)
+
+    def load(self) -> Dict:
+        data, generation = None, 0
+        for generation, payload in self.snapshots.read_valid():
+            try:
+                data = decode_snapshot(payload)
+                break
+            except ValueError:
+                print(f"⚠️ {rotated_path(self.path, generation)} could not be parsed, skipping it")
+
+        if data is None:
+            if self.snapshots.exists():
+                # Starting empty would overwrite the damaged files on the next save
+                raise RuntimeError(f"No readable generation of {self.path} found")
+            data, generation = default_data(), 0
+        elif generation > 0:
+            print(f"⚠️ Recovered {self.path} from generation {generation}")
+
+        manifest = data.pop("league_shards", None)
+        data = normalize_data(data)
+        seq = data.get("journal_seq", 0)
+
+        if manifest is not None:
+            self.shards.sections = {name: set(sections) for name, sections in manifest.items()}
+        else:
+            # Snapshots from before the shard index: read each league's shard once to build it
+            for name in data["leagues"]:
+                self.shards.get(name)
+
+        # Files from before sharding keep every league inline; move them into
+        # shards, which the next snapshot writes out
+        for section in SHARDED_SECTIONS:
+            for name, value in data[section].items():
+                self.shards.set_section(name, section, value)
+            data[section] = ShardSection(self.shards, section)
+
+        # Replay everything written after the snapshot was taken, oldest journal
+        # first. Every retained journal is read: a shard recovered from an older
+        # generation than the main snapshot needs the league records from before it too
+        main_seq, leagues = seq, set(self.shards.sections)
+        records = [
+            (journal_generation, record)
+            for journal_generation in range(self.snapshots.generations - 1, -1, -1)
+            for record in self.journal.read(journal_generation)
+        ]
+        first_seq = records[0][1]["seq"] if records else main_seq + 1
+        incomplete = set()
+        self.journal.size = 0
+        for journal_generation, record in records:
+            if journal_generation == 0:
+                self.journal.size += 1
+            path = record["path"]
+            if path[0] in SHARDED_SECTIONS and len(path) > 1:
+                name = path[1]
+                if record["seq"] <= main_seq:
+                    # Leagues the main snapshot doesn't know about were deleted before it
+                    if name not in leagues or name in incomplete:
+                        continue
+                    self.shards.get(name)
+                    shard_seq = self.shards.seqs.get(name, 0)
+                    if record["seq"] <= shard_seq:
+                        continue
+                    if shard_seq + 1 < first_seq:
+                        print(f"⚠️ League shard for {name} is older than the oldest journal; "
+                              f"changes to it between seq {shard_seq} and {first_seq} are lost")
+                        incomplete.add(name)
+                        continue
+                    # Rewrite the caught-up shard on the next commit rather than at the next compaction
+                    self.compact_next = True
+                else:
+                    # A shard written after the main snapshot may already contain this change
+                    self.shards.get(name)
+                    if record["seq"] <= self.shards.seqs.get(name, 0):
+                        continue
+                self.shards.mark_dirty(name)
+            elif record["seq"] <= main_seq:
+                continue
+            seq = max(seq, record["seq"])
+            apply_record(data, record)
+
+        data["journal_seq"] = seq
+        # Pickle everything once now, while startup is still off the event loop
+        self._capture_main(data)
+        return data
+
+    def on_record(self, record: Dict):
+        path = record["path"]
+        if path[0] in SHARDED_SECTIONS and len(path) > 1:
+            self.shards.mark_dirty(path[1])
+        elif path[0] != "matches":
+            self.pickled.mark(path)
+
+    def capture(self, entries: List[Tuple[Dict, str]], data: Dict) -> Optional[Tuple]:
+        # Journal lines are already serialized; only a full rewrite needs the data
+        if self.mode == "snapshot" or self.compact_next or self.journal.size + len(entries) >= self.compact_after:
+            self.compact_next = False
+            return self._capture_snapshot(data)
+        return None
+
+    def _capture_snapshot(self, data: Dict) -> Tuple:
+        return data.get("journal_seq", 0), self._capture_main(data), self.shards.capture_dirty()
+
+    def _capture_main(self, data: Dict) -> Dict:
+        """Main snapshot sections: pickled per key for dicts, cheap captures for the rest"""
+        main = {}
+        for section, value in data.items():
+            if section in SHARDED_SECTIONS:
+                continue
+            if isinstance(value, MatchArchive):
+                main[section] = value.capture()
+            elif isinstance(value, dict):
+                main[section] = self.pickled.capture(section, value)
+            else:
+                # Small values such as the admin list and journal_seq
+                main[section] = copy.deepcopy(value)
+        main["league_shards"] = self.shards.manifest()
+        return main
+
+    @staticmethod
+    def _restore_main(main: Dict) -> Dict:
+        """The captured main sections as plain data; runs in the worker thread"""
+        restored = {}
+        for section, value in main.items():
+            if isinstance(value, tuple):
+                restored[section] = MatchArchive.from_capture(value)
+            elif isinstance(value, dict) and section != "league_shards":
+                restored[section] = {key: pickle.loads(item) for key, item in value.items()}
+            else:
+                restored[section] = value
+        return restored
+
+    def commit(self, entries: List[Tuple[Dict, str]], snapshot: Optional[Tuple]):
+        if entries and self.mode == "journal":
+            self.journal.append([line for _, line in entries])
+
+        if snapshot is not None:
+            self._write_snapshot(*snapshot)
+
+    def _write_snapshot(self, seq: int, main: Dict, shards: Dict[str, Tuple[int, bytes]]):
+        """Write dirty league shards, then atomically rewrite the main file and start a new journal"""
+        self.shards.write(shards, seq)
+        self.snapshots.write(encode_snapshot(self._restore_main(main), self.snapshot_format))
+        if self.mode == "journal":
+            self.journal.rotate(self.snapshots.generations)
+        elif self.journal.size:
+            self.journal.reset()
+
+
+_MISSING = object()
+
+
+class DataStore:
+    """In-memory match data whose mutations are recorded for the storage backend.
+
+    Every mutation goes through set/delete/append/remove so the backend can
+    persist just what changed when commit() is called.
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.pending: List[Tuple[Dict, str]] = []
+        self.in_flight = 0
+        self.data = backend.load()
+        self.seq = self.data.get("journal_seq", 0)
+
+    def _record(self, op: str, path: Sequence, value: Any = _MISSING):
+        record = {"op": op, "path": list(path)}
+        if value is not _MISSING:
+            record["value"] = value
+
+        apply_record(self.data, record)
+        self.backend.on_record(record)
+
+        self.seq += 1
+        record["seq"] = self.seq
+        # Serialize now so later in-place edits can't leak into this record
+        self.pending.append((record, json.dumps(record) + "\n"))
+
+    def set(self, path: Sequence, value: Any):
+        self._record("set", path, value)
+
+    def delete(self, path: Sequence):
+        self._record("delete", path)
+
+    def append(self, path: Sequence, value: Any):
+        self._record("append", path, value)
+
+    def remove(self, path: Sequence, value: Any):
+        self._record("remove", path, value)
+
+    def trim(self, path: Sequence, count: int):
+        """Drop the first `count` items of a list, e.g. matches moved to cold storage"""
+        self._record("trim", path, count)
+
+    @property
+    def dirty(self) -> bool:
+        """True while some mutations have not reached the backend yet"""
+        return bool(self.pending) or self.in_flight > 0
+
+    def prepare_commit(self) -> Tuple[List[Tuple[Dict, str]], Any]:
+        """Take the pending records and capture what the backend needs to persist them"""
+        entries, self.pending = self.pending, []
+        self.data["journal_seq"] = self.seq
+        self.in_flight += 1
+        return entries, self.backend.capture(entries, self.data)
+
+    def commit(self):
+        """Persist every mutation made since the last commit, synchronously"""
+        entries, snapshot = self.prepare_commit()
+        try:
+            self.backend.commit(entries, snapshot)
+        finally:
+            self.in_flight -= 1
+
+    def close(self):
+        self.commit()
+        self.backend.close()
+
+    def rating(self, user_id: str, sport: str) -> Optional[float]:
+        return self.backend.rating(self.data, user_id, sport)
+
+    def ranking(self, sport: str):
+        return self.backend.ranking(self.data, sport)
+
+    def user_matches(self, user_id: int, limit: int = 10, before: Optional[int] = None) -> List[Tuple[int, Dict]]:
+        """(position, match) of user_id's most recent casual matches, newest first.
+
+        Positions count from the start of the full history, so passing the last
+        one back as `before` continues with older matches.
+        """
+        return self.backend.user_matches(self.data, user_id, limit, before)
+
+    def user_record(self, user_id: int, sport: Optional[str] = None) -> Tuple[int, int]:
+        """(wins, losses) across all casual matches still in the hot data"""
+        return self.backend.user_record(self.data, user_id, sport)
+
+    def league_week(self, league: str, week: int) -> Optional[List[Dict]]:
+        """A generated league week's matches, or None"""
+        return self.backend.league_week(self.data, league, week)
+
+    def league_match_indices(self, league: str, week: int, user_id: int) -> List[int]:
+        return self.backend.league_match_indices(self.data, league, week, user_id)
+
+
+# Longest wait between retries of a failing save, in seconds
+MAX_RETRY_DELAY = 60.0
+
+
+class PersistenceScheduler:
+    """Coalesces save requests into background flushes.
+
+    mark_dirty() schedules a flush `window` seconds out; every other request
+    that arrives before it fires rides along in the same flush. The backend
+    write runs in a worker thread from a snapshot captured on the event loop.
+    Outside a running event loop (startup, shutdown) saves happen immediately.
+
+    Each companion's flush() runs right after the backend write, in the same
+    thread, for side logs that should be saved on the same schedule.
+    """
+
+    def __init__(self, store: DataStore, window: float = 1.0, companions: Sequence = ()):
+        self.store = store
+        self.window = window
+        self.companions = list(companions)
+        self.requests = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.failures = 0
+        # Failed flushes in a row; each retry waits twice as long, up to MAX_RETRY_DELAY
+        self.consecutive_failures = 0
+        self.last_flush_seconds = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        # Only one flush may write at a time so journal appends stay in order
+        self._lock = asyncio.Lock()
+
+    def mark_dirty(self):
+        self.requests += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.store.commit()
+            self._flush_companions()
+            self.flushes += 1
+            return
+
+        if self._timer is not None:
+            self.coalesced += 1
+            return
+        self._timer = loop.call_later(self.window, self._start_flush)
+
+    def _start_flush(self):
+        self._timer = None
+        self._task = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self):
+        async with self._lock:
+            if not self.store.pending:
+                # Companions can have records buffered even when no data changed
+                await asyncio.to_thread(self._flush_companions)
+                return
+
+            started = time.perf_counter()
+            entries, snapshot = self.store.prepare_commit()
+            try:
+                await asyncio.to_thread(self._commit, entries, snapshot)
+                self.flushes += 1
+                self.consecutive_failures = 0
+            except Exception as e:
+                # Put the records back and retry them later, even if nothing else changes
+                self.store.pending[:0] = entries
+                self.failures += 1
+                self.consecutive_failures += 1
+                print(f"Error saving data: {e}")
+                self._schedule_retry()
+            finally:
+                self.store.in_flight -= 1
+                self.last_flush_seconds = time.perf_counter() - started
+
+    def _schedule_retry(self):
+        if self._timer is not None:
+            return
+        delay = min(self.window * 2 ** self.consecutive_failures, MAX_RETRY_DELAY)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _commit(self, entries, snapshot):
+        self.store.backend.commit(entries, snapshot)
+        self._flush_companions()
+
+    def _flush_companions(self):
+        for companion in self.companions:
+            try:
+                companion.flush()
+            except Exception as e:
+                print(f"Error saving {type(companion).__name__}: {e}")
+
+    async def flush(self):
+        """Write out everything pending now, e.g. before shutdown or on admin request"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self._flush()
+
+    def close(self):
+        """Write everything still buffered and close the store; call once the event loop has stopped"""
+        try:
+            self.store.close()
+        finally:
+            self._flush_companions()
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "flushes": self.flushes,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "pending_records": len(self.store.pending),
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 1)
+        }
+
+
+def convert_snapshot(path: str, snapshot_format: str):
+    """Rewrite the newest valid generation of a snapshot or shard file in another format"""
+    files = SnapshotFiles(path, generations=1)
+    for _, payload in files.read_valid():
+        files.write(encode_snapshot(decode_snapshot(payload), snapshot_format))
+        return
+    raise RuntimeError(f"No readable snapshot at {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert snapshot files between JSON and msgpack in place")
+    parser.add_argument("format", choices=SNAPSHOT_FORMATS)
+    parser.add_argument("paths", nargs="+", help="e.g. match_data.json match_data_leagues/*.json")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        convert_snapshot(path, args.format)
+        print(f"{path} -> {args.format}")
@@ -0,0 +1,530 @@
+import argparse
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from match_archive import MatchArchive
+from storage import (SHARDED_SECTIONS, JsonBackend, StorageBackend, default_data, encode_snapshot, match_player_ids,
+                     normalize_data)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sports (
+    name TEXT PRIMARY KEY,
+    config TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS elo (
+    user_id TEXT NOT NULL,
+    sport TEXT NOT NULL,
+    rating REAL NOT NULL,
+    PRIMARY KEY (user_id, sport)
+);
+-- Leaderboard pages and rank lookups
+CREATE INDEX IF NOT EXISTS idx_elo_sport_rating ON elo (sport, rating DESC);
+-- id is the match's position in the full history, cold storage included
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    sport TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match_players (
+    match_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    won INTEGER NOT NULL
+);
+-- Match history pages and win/loss records
+CREATE INDEX IF NOT EXISTS idx_match_players_user ON match_players (user_id, match_id);
+CREATE TABLE IF NOT EXISTS leagues (
+    name TEXT PRIMARY KEY,
+    config TEXT NOT NULL DEFAULT '{}',
+    signups TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS league_matches (
+    league TEXT NOT NULL,
+    week INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    status TEXT,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (league, week, idx)
+);
+CREATE TABLE IF NOT EXISTS league_match_players (
+    league TEXT NOT NULL,
+    week INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    user_id INTEGER NOT NULL
+);
+-- Rewriting a week's rows
+CREATE INDEX IF NOT EXISTS idx_league_match_players_week ON league_match_players (league, week);
+-- Finding a player's match in a week
+DROP INDEX IF EXISTS idx_league_match_players_user;
+CREATE INDEX IF NOT EXISTS idx_league_match_players_user_week ON league_match_players (user_id, league, week);
+CREATE TABLE IF NOT EXISTS standings (
+    league TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    wins INTEGER NOT NULL,
+    losses INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    elo REAL NOT NULL,
+    PRIMARY KEY (league, user_id)
+);
+CREATE TABLE IF NOT EXISTS naked_laps (
+    user_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS admins (
+    user_id INTEGER PRIMARY KEY
+);
+"""
+
+
+class SqliteBackend(StorageBackend):
+    """SQLite database with one indexed table per data section.
+
+    Each mutation marks the rows behind its path. Before the next query or
+    save, those rows are rewritten from the in-memory data inside an open
+    transaction, and commit() closes the transaction from the persistence
+    worker. Ratings, leaderboards, match history and league weeks are
+    parameterised SELECTs on the indexed tables, on the same connection, so
+    they see every change straight away. If the database is new and a JSON
+    data file exists, it is imported on first load.
+    """
+
+    def __init__(self, path: str, import_from: str = None):
+        self.path = path
+        self.import_from = import_from
+        # Queries and row writes run on the event loop, commits in a worker thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        # Commits only append to the write-ahead log, so queries waiting on one aren't held up long
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        # Casual match appends and trims in order, plus the other rows to rewrite
+        self.match_changes: List[Tuple] = []
+        self.changed_rows: Set[tuple] = set()
+        # Set when a commit failed and its rows were rolled back; everything is rewritten
+        self.resync = False
+
+    def load(self) -> Dict:
+        initialized = self.conn.execute("SELECT value FROM meta WHERE key = 'initialized'").fetchone()
+        if not initialized:
+            source = JsonBackend(self.import_from) if self.import_from else None
+            data = load_json(source) if source and source.exists() else default_data()
+            self.write_snapshot(data)
+            return data
+
+        data = default_data()
+        conn = self.conn
+
+        for name, config in conn.execute("SELECT name, config FROM sports"):
+            data["sports"][name] = json.loads(config)
+
+        for user_id, sport, rating in conn.execute("SELECT user_id, sport, rating FROM elo"):
+            data["elo"].setdefault(user_id, {})[sport] = rating
+
+        data["matches"] = MatchArchive.load(
+            json.loads(payload) for (payload,) in conn.execute("SELECT payload FROM matches ORDER BY id")
+        )
+        base = conn.execute("SELECT value FROM meta WHERE key = 'matches_base'").fetchone()
+        data["matches"].base = int(base[0]) if base else 0
+
+        for name, config, signups in conn.execute("SELECT name, config, signups FROM leagues"):
+            data["leagues"][name] = json.loads(config)
+            data["league_signups"][name] = json.loads(signups)
+            data["league_matches"][name] = {}
+            data["league_standings"][name] = {}
+
+        for league, week, payload in conn.execute(
+            "SELECT league, week, payload FROM league_matches ORDER BY league, week, idx"
+        ):
+            data["league_matches"].setdefault(league, {}).setdefault(week, []).append(json.loads(payload))
+
+        for league, user_id, wins, losses, points, elo in conn.execute(
+            "SELECT league, user_id, wins, losses, points, elo FROM standings"
+        ):
+            data["league_standings"].setdefault(league, {})[user_id] = {
+                "wins": wins, "losses": losses, "points": points, "elo": elo
+            }
+
+        for user_id, count in conn.execute("SELECT user_id, count FROM naked_laps"):
+            data["naked_laps"][user_id] = count
+
+        data["admins"] = [user_id for (user_id,) in conn.execute("SELECT user_id FROM admins")]
+
+        seq = conn.execute("SELECT value FROM meta WHERE key = 'journal_seq'").fetchone()
+        data["journal_seq"] = int(seq[0]) if seq else 0
+        data = normalize_data(data)
+
+        # Databases from before match ids were history positions are renumbered once
+        first, last = conn.execute("SELECT MIN(id), MAX(id) FROM matches").fetchone()
+        archive = data["matches"]
+        if len(archive) and (first, last) != (archive.base, archive.base + len(archive) - 1):
+            with self.lock, self.conn:
+                self._sync_path(("matches",), data)
+        self.data = data
+        return data
+
+    def on_record(self, record: Dict):
+        # Runs right after the record is applied, so the data already holds the change
+        path = tuple(record["path"])
+        if path[0] == "matches" and record["op"] == "append":
+            archive = self.data["matches"]
+            self.match_changes.append(("append", archive.base + len(archive) - 1, record["value"]))
+        elif path[0] == "matches" and record["op"] == "trim":
+            self.match_changes.append(("trim", self.data["matches"].base))
+        elif path[0] in ("league_matches", "league_standings"):
+            self.changed_rows.add(path[:3])
+        else:
+            self.changed_rows.add(path[:2])
+            if path[0] == "leagues" and len(path) > 1:
+                self.changed_rows.add(("league_signups", path[1]))
+
+    def _write_changes(self, data: Dict):
+        """Rewrite the rows changed since the last call, inside the open transaction; hold self.lock"""
+        if self.resync:
+            self.resync = False
+            self.match_changes, self.changed_rows = [], set()
+            self._sync_all(data)
+            return
+
+        match_changes, self.match_changes = self.match_changes, []
+        for change in match_changes:
+            if change[0] == "append":
+                self._insert_match(change[1], change[2])
+            else:
+                self._trim_matches(change[1])
+        changed_rows, self.changed_rows = self.changed_rows, set()
+        for path in changed_rows:
+            self._sync_path(path, data)
+
+    def capture(self, entries: List[Tuple[Dict, str]], data: Dict) -> None:
+        # Serializing the changed rows happens here, on the loop, so commit() never reads live data
+        with self.lock:
+            self._write_changes(data)
+            if entries:
+                self._set_meta("journal_seq", entries[-1][0]["seq"])
+        return None
+
+    def commit(self, entries: List[Tuple[Dict, str]], snapshot: None):
+        with self.lock:
+            try:
+                self.conn.commit()
+            except Exception:
+                # The rows are gone with the transaction; rewrite everything on the retry
+                self.conn.rollback()
+                self.resync = True
+                raise
+
+    def write_snapshot(self, data: Dict):
+        with self.lock, self.conn:
+            self._sync_all(data)
+        self.data = data
+
+    def _sync_all(self, data: Dict):
+        for section in ("sports", "elo", "matches", "leagues", "league_signups",
+                        "league_matches", "league_standings", "naked_laps", "admins"):
+            self._sync_path((section,), data)
+        self._set_meta("matches_base", data["matches"].base)
+        self._set_meta("journal_seq", data.get("journal_seq", 0))
+        self._set_meta("initialized", 1)
+
+    def close(self):
+        self.conn.close()
+
+    # --- indexed reads ---
+
+    def rating(self, data: Dict, user_id: str, sport: str) -> Optional[float]:
+        row = self._query(data, "SELECT rating FROM elo WHERE user_id = ? AND sport = ?", (user_id, sport))
+        return row[0][0] if row else None
+
+    def ranking(self, data: Dict, sport: str) -> "SqliteRanking":
+        return SqliteRanking(self, data, sport)
+
+    def user_matches(self, data: Dict, user_id: int, limit: int,
+                     before: Optional[int] = None) -> List[Tuple[int, Dict]]:
+        before_clause = "" if before is None else "AND p.match_id < ? "
+        rows = self._query(
+            data,
+            "SELECT DISTINCT m.id, m.payload FROM match_players p JOIN matches m ON m.id = p.match_id "
+            f"WHERE p.user_id = ? {before_clause}ORDER BY p.match_id DESC LIMIT ?",
+            (user_id, *(() if before is None else (before,)), limit)
+        )
+        return [(match_id, json.loads(payload)) for match_id, payload in rows]
+
+    def user_record(self, data: Dict, user_id: int, sport: Optional[str] = None) -> Tuple[int, int]:
+        # One row per match, even for someone listed twice in it
+        sport_join = "" if sport is None else "JOIN matches m ON m.id = p.match_id AND m.sport = ? "
+        (wins, played), = self._query(
+            data,
+            "SELECT COALESCE(SUM(won), 0), COUNT(*) FROM ("
+            f"SELECT MAX(p.won) AS won FROM match_players p {sport_join}WHERE p.user_id = ? GROUP BY p.match_id)",
+            (*(() if sport is None else (sport,)), user_id)
+        )
+        return wins, played - wins
+
+    def league_week(self, data: Dict, league: str, week: int) -> Optional[List[Dict]]:
+        if week not in data["league_matches"].get(league, {}):
+            # Weeks can be generated with no matches, which leaves no rows
+            return None
+        rows = self._query(
+            data, "SELECT payload FROM league_matches WHERE league = ? AND week = ? ORDER BY idx", (league, week)
+        )
+        return [json.loads(payload) for (payload,) in rows]
+
+    def league_match_indices(self, data: Dict, league: str, week: int, user_id: int) -> List[int]:
+        rows = self._query(
+            data,
+            "SELECT DISTINCT idx FROM league_match_players WHERE user_id = ? AND league = ? AND week = ? ORDER BY idx",
+            (user_id, league, week)
+        )
+        return [idx for (idx,) in rows]
+
+    def _query(self, data: Dict, sql: str, params: tuple) -> List[tuple]:
+        with self.lock:
+            self._write_changes(data)
+            return self.conn.execute(sql, params).fetchall()
+
+    def _set_meta(self, key: str, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    def _sync_path(self, path: tuple, data: Dict):
+        """Rewrite the rows backing a changed path from the current in-memory data"""
+        section = path[0]
+        conn = self.conn
+
+        if section == "sports":
+            names = [path[1]] if len(path) > 1 else None
+            if names is None:
+                conn.execute("DELETE FROM sports")
+                names = list(data["sports"])
+            for name in names:
+                if name in data["sports"]:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sports (name, config) VALUES (?, ?)",
+                        (name, json.dumps(data["sports"][name]))
+                    )
+                else:
+                    conn.execute("DELETE FROM sports WHERE name = ?", (name,))
+
+        elif section == "elo":
+            user_ids = [path[1]] if len(path) > 1 else None
+            if user_ids is None:
+                conn.execute("DELETE FROM elo")
+                user_ids = list(data["elo"])
+            for user_id in user_ids:
+                conn.execute("DELETE FROM elo WHERE user_id = ?", (user_id,))
+                conn.executemany(
+                    "INSERT INTO elo (user_id, sport, rating) VALUES (?, ?, ?)",
+                    [(user_id, sport, rating) for sport, rating in data["elo"].get(user_id, {}).items()]
+                )
+
+        elif section == "matches":
+            conn.execute("DELETE FROM matches")
+            conn.execute("DELETE FROM match_players")
+            archive = data["matches"]
+            for index, match in enumerate(archive):
+                self._insert_match(archive.base + index, match)
+
+        elif section == "leagues":
+            names = [path[1]] if len(path) > 1 else None
+            if names is None:
+                conn.execute("DELETE FROM leagues")
+                names = list(data["leagues"])
+            for name in names:
+                if name in data["leagues"]:
+                    conn.execute(
+                        "INSERT INTO leagues (name, config, signups) VALUES (?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET config = excluded.config",
+                        (name, json.dumps(data["leagues"][name]),
+                         json.dumps(data["league_signups"].get(name, [])))
+                    )
+                else:
+                    conn.execute("DELETE FROM leagues WHERE name = ?", (name,))
+
+        elif section == "league_signups":
+            names = [path[1]] if len(path) > 1 else list(data["league_signups"])
+            for name in names:
+                conn.execute(
+                    "UPDATE leagues SET signups = ? WHERE name = ?",
+                    (json.dumps(data["league_signups"].get(name, [])), name)
+                )
+
+        elif section == "league_matches":
+            if len(path) > 2:
+                self._sync_league_week(path[1], path[2], data)
+            else:
+                names = [path[1]] if len(path) > 1 else None
+                if names is None:
+                    conn.execute("DELETE FROM league_matches")
+                    conn.execute("DELETE FROM league_match_players")
+                    names = list(data["league_matches"])
+                for name in names:
+                    conn.execute("DELETE FROM league_matches WHERE league = ?", (name,))
+                    conn.execute("DELETE FROM league_match_players WHERE league = ?", (name,))
+                    for week in data["league_matches"].get(name, {}):
+                        self._sync_league_week(name, week, data)
+
+        elif section == "league_standings":
+            if len(path) > 2:
+                keys = [(path[1], path[2])]
+            else:
+                names = [path[1]] if len(path) > 1 else None
+                if names is None:
+                    conn.execute("DELETE FROM standings")
+                    names = list(data["league_standings"])
+                keys = []
+                for name in names:
+                    conn.execute("DELETE FROM standings WHERE league = ?", (name,))
+                    keys += [(name, user_id) for user_id in data["league_standings"].get(name, {})]
+            for name, user_id in keys:
+                stats = data["league_standings"].get(name, {}).get(user_id)
+                if stats is None:
+                    conn.execute("DELETE FROM standings WHERE league = ? AND user_id = ?", (name, user_id))
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO standings (league, user_id, wins, losses, points, elo) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, user_id, stats["wins"], stats["losses"], stats["points"], stats["elo"])
+                )
+
+        elif section == "naked_laps":
+            user_ids = [path[1]] if len(path) > 1 else None
+            if user_ids is None:
+                conn.execute("DELETE FROM naked_laps")
+                user_ids = list(data["naked_laps"])
+            for user_id in user_ids:
+                if user_id in data["naked_laps"]:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO naked_laps (user_id, count) VALUES (?, ?)",
+                        (user_id, data["naked_laps"][user_id])
+                    )
+                else:
+                    conn.execute("DELETE FROM naked_laps WHERE user_id = ?", (user_id,))
+
+        elif section == "admins":
+            conn.execute("DELETE FROM admins")
+            conn.executemany(
+                "INSERT OR IGNORE INTO admins (user_id) VALUES (?)",
+                [(user_id,) for user_id in data["admins"]]
+            )
+
+    def _sync_league_week(self, league: str, week: int, data: Dict):
+        self.conn.execute("DELETE FROM league_matches WHERE league = ? AND week = ?", (league, week))
+        self.conn.execute("DELETE FROM league_match_players WHERE league = ? AND week = ?", (league, week))
+        for idx, match in enumerate(data["league_matches"].get(league, {}).get(week, [])):
+            self.conn.execute(
+                "INSERT INTO league_matches (league, week, idx, status, payload) VALUES (?, ?, ?, ?, ?)",
+                (league, week, idx, match.get("status"), json.dumps(match))
+            )
+            self.conn.executemany(
+                "INSERT INTO league_match_players (league, week, idx, user_id) VALUES (?, ?, ?, ?)",
+                [(league, week, idx, user_id) for user_id in match_player_ids(match)]
+            )
+
+    def _trim_matches(self, base: int):
+        """Delete the matches below position `base`, which have been moved to cold storage"""
+        self.conn.execute("DELETE FROM match_players WHERE match_id < ?", (base,))
+        self.conn.execute("DELETE FROM matches WHERE id < ?", (base,))
+        self._set_meta("matches_base", base)
+
+    def _insert_match(self, position: int, match: Dict):
+        self.conn.execute("DELETE FROM match_players WHERE match_id = ?", (position,))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO matches (id, sport, payload) VALUES (?, ?, ?)",
+            (position, match["sport"], json.dumps(match))
+        )
+        self.conn.executemany(
+            "INSERT INTO match_players (match_id, user_id, won) VALUES (?, ?, ?)",
+            [(position, uid, 1) for uid in match.get("winner_ids", [])] +
+            [(position, uid, 0) for uid in match.get("loser_ids", [])]
+        )
+
+
+class SqliteRanking:
+    """One sport's leaderboard as queries on the elo table's (sport, rating) index.
+
+    Same interface as ranking.SportRanking, including ties ordered by user id.
+    """
+
+    def __init__(self, backend: SqliteBackend, data: Dict, sport: str):
+        self.backend = backend
+        self.data = data
+        self.sport = sport
+
+    def __len__(self) -> int:
+        return self.backend._query(self.data, "SELECT COUNT(*) FROM elo WHERE sport = ?", (self.sport,))[0][0]
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, float]]:
+        rows = self.backend._query(
+            self.data,
+            "SELECT user_id, rating FROM elo WHERE sport = ? "
+            "ORDER BY rating DESC, CAST(user_id AS INTEGER) LIMIT ? OFFSET ?",
+            (self.sport, limit, offset)
+        )
+        return [(int(user_id), rating) for user_id, rating in rows]
+
+    def top(self, k: int) -> List[Tuple[int, float]]:
+        return self.page(0, k)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        rating = self.backend.rating(self.data, str(user_id), self.sport)
+        if rating is None:
+            return None
+        (ahead,), = self.backend._query(
+            self.data,
+            "SELECT COUNT(*) FROM elo WHERE sport = ? "
+            "AND (rating > ? OR (rating = ? AND CAST(user_id AS INTEGER) < ?))",
+            (self.sport, rating, rating, user_id)
+        )
+        return ahead + 1
+
+
+def load_json(source: JsonBackend) -> Dict:
+    """A JSON backend's data as plain dicts, with every league shard read in"""
+    data = source.load()
+    for section in SHARDED_SECTIONS:
+        data[section] = dict(data[section].items())
+    return data
+
+
+def export_json(db_path: str, json_path: str):
+    """Write the contents of a SQLite database out as a match_data.json file"""
+    backend = SqliteBackend(db_path)
+    data = backend.load()
+    backend.close()
+    with open(json_path, "wb") as f:
+        f.write(encode_snapshot(data))
+
+
+def import_json(json_path: str, db_path: str):
+    """Replace the contents of a SQLite database with a match_data.json file (plus its journal)"""
+    data = load_json(JsonBackend(json_path))
+    backend = SqliteBackend(db_path)
+    backend.write_snapshot(data)
+    backend.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move bot data between JSON and SQLite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="SQLite -> JSON")
+    export_parser.add_argument("db")
+    export_parser.add_argument("json")
+    import_parser = subparsers.add_parser("import", help="JSON -> SQLite")
+    import_parser.add_argument("json")
+    import_parser.add_argument("db")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_json(args.db, args.json)
+    else:
+        import_json(args.json, args.db)